@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
+import argparse
 import sys
 import struct
 import os
 
-from scapy.all import sniff, sendp, hexdump, get_if_list, get_if_hwaddr
+from scapy.all import sendp, hexdump, get_if_list, get_if_hwaddr
 from scapy.all import Packet, IPOption
 from scapy.all import ShortField, IntField, LongField, BitField, FieldListField, FieldLenField
-from scapy.all import IP, TCP, UDP, Raw
+from scapy.all import Ether, IP, TCP, UDP, Raw
 from scapy.layers.inet import _IPOption_HDR
 
+# Import the capture engine from the script dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script'))
+from capture import IPPROTO_TCP, addCaptureArguments, bpfFilter, captureFromArgs
+
 def get_if():
     ifs=get_if_list()
     iface=None
@@ -42,12 +48,16 @@ def handle_pkt(pkt):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    addCaptureArguments(parser)
+    args = parser.parse_args()
+
     ifaces = [i for i in os.listdir('/sys/class/net/') if 'eth' in i]
     iface = ifaces[0]
     print(("sniffing on %s" % iface))
     sys.stdout.flush()
-    sniff(iface = iface,
-          prn = lambda x: handle_pkt(x))
+    captureFromArgs(iface, args, bpf=bpfFilter(IPPROTO_TCP, dport=1234),
+                    show=lambda frame: handle_pkt(Ether(frame)))
 
 if __name__ == '__main__':
     main()
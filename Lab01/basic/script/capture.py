@@ -0,0 +1,393 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import ctypes
+import mmap
+import select
+import socket
+import struct
+import sys
+from time import monotonic
+
+'''
+High rate packet capture and decoding.
+
+PacketCapture receives the frames of an interface on an AF_PACKET socket,
+filtered in the kernel by a classic BPF program (see bpfFilter). Frames
+are read from a TPACKET_V3 ring buffer shared with the kernel, a whole
+block of frames at a time, falling back to one recv call per frame when
+the ring cannot be set up.
+
+Frames are handed to a handler as (buffer, offset, caplen, wire_len),
+without copying them: handlers decode the headers they need in place,
+e.g. with decodeIPv4, and must not keep a reference to the buffer.
+FlowCounters is such a handler, counting packets per flow and printing
+the counters periodically:
+
+    counters = FlowCounters()
+    with PacketCapture('eth0', bpf=bpfFilter(IPPROTO_UDP, port=4321)) as capture:
+        capture.run(counters.update, interval=1.0, on_interval=counters.report)
+'''
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_8021Q = 0x8100
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+PROTO_NAMES = {IPPROTO_TCP: 'tcp', IPPROTO_UDP: 'udp', 1: 'icmp'}
+
+SOL_SOCKET = 1
+SO_ATTACH_FILTER = 26
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+PACKET_IGNORE_OUTGOING = 23
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# Ring buffer geometry: RING_BLOCK_NR blocks of RING_BLOCK_SIZE bytes. The
+# kernel hands a block over when it is full or RING_BLOCK_TIMEOUT (ms)
+# after its first frame
+RING_BLOCK_SIZE = 1 << 20
+RING_BLOCK_NR = 8
+RING_FRAME_SIZE = 2048
+RING_BLOCK_TIMEOUT = 50
+# Longest wait for frames before checking deadlines (seconds)
+POLL_TIMEOUT = 0.1
+# Largest frame read without the ring
+RECV_SIZE = 65536
+# Flows printed by FlowCounters.report, the busiest first
+MAX_REPORTED_FLOWS = 20
+
+# tpacket_req3
+RING_REQUEST = struct.Struct('=7I')
+# block_status of tpacket_block_desc, then num_pkts and offset_to_first_pkt
+BLOCK_STATUS = struct.Struct('=I')
+BLOCK_STATUS_OFFSET = 8
+BLOCK_HEADER = struct.Struct('=III')
+# tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac
+# of tpacket3_hdr
+FRAME_HEADER = struct.Struct('=6IH')
+# sock_filter, and sock_fprog pointing to an array of them
+BPF_INSTRUCTION = struct.Struct('=HBBI')
+BPF_PROGRAM = struct.Struct('HP')
+
+ETHERTYPE = struct.Struct('!H')
+# version/IHL, TOS, total length, fragment, protocol, source, destination
+IPV4 = struct.Struct('!BBH2xH1xB2x4s4s')
+PORTS = struct.Struct('!HH')
+
+# Classic BPF opcodes
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LDX_B_MSH = 0xb1
+BPF_JEQ_K = 0x15
+BPF_JSET_K = 0x45
+BPF_RET_K = 0x06
+BPF_ACCEPT_SIZE = 0x40000
+
+
+def bpfFilter(proto=None, port=None, dport=None, ethertype=ETH_P_IP):
+    """Returns the classic BPF program (list of (code, jt, jf, k)) accepting
+    the IPv4 packets of protocol proto, with source or destination port
+    port, or destination port dport. Without proto, a port matches both TCP
+    and UDP packets. Fragments other than the first never match a port.
+    Only the EtherType is checked for other EtherTypes than IPv4."""
+    if ethertype != ETH_P_IP and (proto, port, dport) != (None, None, None):
+        raise ValueError("protocol and ports can only be matched in IPv4 packets")
+    ACCEPT, DROP = 'accept', 'drop'
+    # Jump targets are labels, or 0 for the next instruction
+    insns = [(BPF_LD_H_ABS, 0, 0, 12),
+             (BPF_JEQ_K, 0, DROP, ethertype)]
+    if proto is not None:
+        insns += [(BPF_LD_B_ABS, 0, 0, 23),
+                  (BPF_JEQ_K, 0, DROP, proto)]
+    elif port is not None or dport is not None:
+        insns += [(BPF_LD_B_ABS, 0, 0, 23),
+                  (BPF_JEQ_K, 1, 0, IPPROTO_TCP),
+                  (BPF_JEQ_K, 0, DROP, IPPROTO_UDP)]
+    if port is not None or dport is not None:
+        insns += [(BPF_LD_H_ABS, 0, 0, 20),
+                  (BPF_JSET_K, DROP, 0, 0x1fff),
+                  # X = IP header length
+                  (BPF_LDX_B_MSH, 0, 0, 14)]
+        if port is not None:
+            insns += [(BPF_LD_H_IND, 0, 0, 14),
+                      (BPF_JEQ_K, ACCEPT, 0, port)]
+        insns += [(BPF_LD_H_IND, 0, 0, 16),
+                  (BPF_JEQ_K, ACCEPT, DROP, port if dport is None else dport)]
+    targets = {ACCEPT: len(insns), DROP: len(insns) + 1}
+    program = []
+    for i, (code, jt, jf, k) in enumerate(insns):
+        jt = targets[jt] - i - 1 if jt in targets else jt
+        jf = targets[jf] - i - 1 if jf in targets else jf
+        program.append((code, jt, jf, k))
+    program += [(BPF_RET_K, 0, 0, BPF_ACCEPT_SIZE),
+                (BPF_RET_K, 0, 0, 0)]
+    return program
+
+def attachFilter(sock, program):
+    "Attaches a classic BPF program (list of (code, jt, jf, k)) to sock"
+    insns = b''.join(BPF_INSTRUCTION.pack(*insn) for insn in program)
+    buf = ctypes.create_string_buffer(insns, len(insns))
+    sock.setsockopt(SOL_SOCKET, SO_ATTACH_FILTER,
+                    BPF_PROGRAM.pack(len(program), ctypes.addressof(buf)))
+
+
+def decodeIPv4(buf, offset, caplen):
+    """Decodes the IPv4 frame of caplen bytes at offset of buf. Returns
+    (source, destination, protocol, source port, destination port, TOS,
+    IP total length, offset of the layer 4 header), addresses being 4 byte
+    strings and ports 0 for other protocols than TCP and UDP, or None when
+    the frame is not IPv4."""
+    if caplen < 34:
+        return None
+    ethertype, = ETHERTYPE.unpack_from(buf, offset + 12)
+    ip = offset + 14
+    if ethertype == ETH_P_8021Q:
+        if caplen < 38:
+            return None
+        ethertype, = ETHERTYPE.unpack_from(buf, offset + 16)
+        ip += 4
+    if ethertype != ETH_P_IP:
+        return None
+    ver_ihl, tos, total_len, frag, proto, src, dst = IPV4.unpack_from(buf, ip)
+    l4 = ip + (ver_ihl & 0x0f) * 4
+    sport = dport = 0
+    if ((proto == IPPROTO_UDP or proto == IPPROTO_TCP) and not frag & 0x1fff and
+            l4 + 4 <= offset + caplen):
+        sport, dport = PORTS.unpack_from(buf, l4)
+    return src, dst, proto, sport, dport, tos, total_len, l4
+
+
+class PacketCapture(object):
+    """Captures the frames of an interface through one AF_PACKET socket.
+
+    bpf is a classic BPF program run by the kernel, frames it rejects are
+    never copied to user space. Frames sent by this host are ignored when
+    ignore_outgoing is True (Linux 4.20 and later). use_ring=False reads
+    the frames with one recv call each instead of through the ring.
+    """
+
+    def __init__(self, iface, bpf=None, ignore_outgoing=True, use_ring=True):
+        self.iface = iface
+        self.ring = None
+        self.buf = None
+        # Protocol 0 receives nothing until bind, so that no frame is
+        # queued before the filter is attached
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        try:
+            if bpf is not None:
+                attachFilter(self.sock, bpf)
+            if ignore_outgoing:
+                try:
+                    self.sock.setsockopt(SOL_PACKET, PACKET_IGNORE_OUTGOING, 1)
+                except OSError:
+                    pass
+            if use_ring:
+                self.setupRing()
+            if self.ring is None:
+                self.buf = bytearray(RECV_SIZE)
+            self.sock.bind((iface, ETH_P_ALL))
+        except:
+            self.close()
+            raise
+
+    def setupRing(self):
+        try:
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, RING_REQUEST.pack(
+                RING_BLOCK_SIZE, RING_BLOCK_NR, RING_FRAME_SIZE,
+                RING_BLOCK_SIZE // RING_FRAME_SIZE * RING_BLOCK_NR,
+                RING_BLOCK_TIMEOUT, 0, 0))
+            self.ring = mmap.mmap(self.sock.fileno(), RING_BLOCK_SIZE * RING_BLOCK_NR,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except OSError:
+            # Kernel without TPACKET_V3, fall back to recv
+            self.ring = None
+            return
+        # Next block to read
+        self.block = 0
+        self.poller = select.poll()
+        self.poller.register(self.sock.fileno(), select.POLLIN | select.POLLERR)
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def run(self, handler, duration=None, count=None, interval=None, on_interval=None):
+        """Calls handler(buffer, offset, caplen, wire_len) for each captured
+        frame until duration seconds have passed or count frames were
+        captured (forever if both are None, until KeyboardInterrupt), and
+        on_interval() every interval seconds. Returns the number of frames."""
+        start = monotonic()
+        deadline = None if duration is None else start + duration
+        next_tick = None
+        if interval is not None and on_interval is not None:
+            next_tick = start + interval
+        if self.ring is not None:
+            frames = self.readRing
+        else:
+            frames = self.readSocket
+        seen = 0
+        try:
+            while count is None or seen < count:
+                now = monotonic()
+                if next_tick is not None and now >= next_tick:
+                    on_interval()
+                    next_tick = max(next_tick + interval, now)
+                if deadline is not None and now >= deadline:
+                    break
+                wait = POLL_TIMEOUT
+                for t in (next_tick, deadline):
+                    if t is not None:
+                        wait = min(wait, t - now)
+                seen += frames(handler, max(wait, 0), None if count is None else count - seen)
+        except KeyboardInterrupt:
+            pass
+        return seen
+
+    def readRing(self, handler, timeout, limit):
+        """Handles the frames of the next block of the ring, waiting up to
+        timeout seconds for it. Returns the number of frames handled"""
+        ring = self.ring
+        base = self.block * RING_BLOCK_SIZE
+        status, num_pkts, offset = BLOCK_HEADER.unpack_from(ring, base + BLOCK_STATUS_OFFSET)
+        if not status & TP_STATUS_USER:
+            self.poller.poll(timeout * 1000)
+            status, num_pkts, offset = BLOCK_HEADER.unpack_from(ring, base + BLOCK_STATUS_OFFSET)
+            if not status & TP_STATUS_USER:
+                return 0
+        # A count limit may leave the rest of the block unread
+        n = num_pkts if limit is None else min(num_pkts, limit)
+        unpack = FRAME_HEADER.unpack_from
+        offset += base
+        for _ in range(n):
+            next_offset, sec, nsec, snaplen, wire_len, frame_status, mac = unpack(ring, offset)
+            handler(ring, offset + mac, snaplen, wire_len)
+            offset += next_offset
+        BLOCK_STATUS.pack_into(ring, base + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+        self.block = (self.block + 1) % RING_BLOCK_NR
+        return n
+
+    def readSocket(self, handler, timeout, limit):
+        "Same as readRing, for one frame read from the socket"
+        self.sock.settimeout(timeout)
+        try:
+            # MSG_TRUNC returns the length of the frame, even when longer
+            wire_len = self.sock.recv_into(self.buf, RECV_SIZE, socket.MSG_TRUNC)
+        except socket.timeout:
+            return 0
+        handler(self.buf, 0, min(wire_len, RECV_SIZE), wire_len)
+        return 1
+
+
+class FlowCounters(object):
+    """Counts the packets and bytes of each IPv4 flow (source, destination,
+    protocol, source port, destination port) and the packets marked with
+    ECN Congestion Experienced. update is a PacketCapture handler."""
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        # flow -> [packets, bytes, CE packets, last TOS, packets and bytes
+        # at the previous report]
+        self.flows = {}
+        self.other = 0
+        self.last_report = monotonic()
+
+    def update(self, buf, offset, caplen, wire_len):
+        headers = decodeIPv4(buf, offset, caplen)
+        if headers is None:
+            self.other += 1
+            return
+        key = headers[:5]
+        counters = self.flows.get(key)
+        if counters is None:
+            counters = self.flows[key] = [0, 0, 0, 0, 0, 0]
+        tos = headers[5]
+        counters[0] += 1
+        counters[1] += wire_len
+        if tos & 3 == 3:
+            counters[2] += 1
+        counters[3] = tos
+
+    def report(self):
+        "Prints the counters and the rates since the previous report"
+        now = monotonic()
+        elapsed = now - self.last_report
+        self.last_report = now
+        active = []
+        for key, counters in self.flows.items():
+            delta = counters[0] - counters[4]
+            if delta:
+                active.append((delta, counters[1] - counters[5], key, counters))
+            counters[4] = counters[0]
+            counters[5] = counters[1]
+        active.sort(key=lambda flow: flow[0], reverse=True)
+        lines = ["%d active flows (%d total)" % (len(active), len(self.flows))]
+        for delta, delta_bytes, key, counters in active[:MAX_REPORTED_FLOWS]:
+            src, dst, proto, sport, dport = key
+            lines.append("  %s:%d -> %s:%d %s: %d packets, %.0f pps, %.3f Mbps, "
+                         "tos 0x%02x, %d ECN CE" % (
+                             socket.inet_ntoa(src), sport, socket.inet_ntoa(dst), dport,
+                             PROTO_NAMES.get(proto, proto), counters[0],
+                             delta / elapsed if elapsed > 0 else 0.0,
+                             delta_bytes * 8 / elapsed / 1e6 if elapsed > 0 else 0.0,
+                             counters[3], counters[2]))
+        if len(active) > MAX_REPORTED_FLOWS:
+            lines.append("  ... %d more" % (len(active) - MAX_REPORTED_FLOWS))
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+
+
+def addCaptureArguments(parser):
+    "Adds the options of captureFromArgs to an argparse parser"
+    group = parser.add_argument_group('capture')
+    group.add_argument('--interval', help='seconds between flow counter reports (default: 1)',
+                       type=float, default=1.0)
+    group.add_argument('--duration', help='capture duration in seconds', type=float)
+    group.add_argument('--count', help='number of packets to capture', type=int)
+    group.add_argument('--show', help='dissect and print every packet (slow)',
+                       action='store_true')
+    group.add_argument('--no-ring', help='read packets one by one instead of through '
+                                         'a TPACKET_V3 ring buffer',
+                       action='store_true')
+
+def captureFromArgs(iface, args, bpf=None, show=None, counters=None):
+    """Captures on iface as requested by the options of addCaptureArguments,
+    printing the counters periodically, and once more at the end. counters
+    is any object with the update and report methods of FlowCounters, by
+    default a FlowCounters. With --show, show(frame) is also called with
+    the bytes of each frame. Returns the counters."""
+    if counters is None:
+        counters = FlowCounters()
+    def countAndShow(buf, offset, caplen, wire_len):
+        counters.update(buf, offset, caplen, wire_len)
+        show(bytes(buf[offset:offset + caplen]))
+    handler = countAndShow if args.show and show is not None else counters.update
+    with PacketCapture(iface, bpf=bpf, use_ring=not args.no_ring) as capture:
+        capture.run(handler, duration=args.duration, count=args.count,
+                    interval=args.interval, on_interval=counters.report)
+    counters.report()
+    return counters
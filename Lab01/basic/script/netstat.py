@@ -13,9 +13,43 @@
 # limitations under the License.
 #
 
-import psutil
+import os
+
+# Kernel socket tables, one line per socket, see proc(5)
+PROC_NET_TCP_FILES = ['/proc/net/tcp', '/proc/net/tcp6']
+TCP_LISTEN_STATE = '0A'
+
+def _listening_ports_procfs():
+    ports = set()
+    for path in PROC_NET_TCP_FILES:
+        try:
+            with open(path) as f:
+                next(f) # header
+                for line in f:
+                    fields = line.split(None, 4)
+                    if fields[3] == TCP_LISTEN_STATE:
+                        ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+        except FileNotFoundError:
+            # e.g. IPv6 disabled in the kernel
+            continue
+    return ports
+
+def _listening_ports_psutil():
+    import psutil
+    return set(c.laddr[1] for c in psutil.net_connections(kind='inet')
+               if c.status == 'LISTEN')
+
+def listening_ports(ports=None):
+    """Returns the set of TCP ports with a listening socket, restricted to
+    ports if given. The socket tables are read once, whatever the number of
+    ports asked for."""
+    if os.path.exists(PROC_NET_TCP_FILES[0]):
+        listening = _listening_ports_procfs()
+    else:
+        listening = _listening_ports_psutil()
+    if ports is not None:
+        listening &= set(ports)
+    return listening
+
 def check_listening_on_port(port):
-    for c in psutil.net_connections(kind='inet'):
-        if c.status == 'LISTEN' and c.laddr[1] == port:
-            return True
-    return False
+    return port in listening_ports([port])
@@ -21,11 +21,14 @@ from sys import exit
 import os
 import tempfile
 import socket
-from time import sleep
+from time import sleep, time
 
 from netstat import check_listening_on_port
 
 SWITCH_START_TIMEOUT = 10 # seconds
+# Polling delays while waiting for a switch, doubled after each attempt
+SWITCH_POLL_INITIAL_DELAY = 0.01 # seconds
+SWITCH_POLL_MAX_DELAY = 0.5 # seconds
 
 class P4Host(Host):
     def config(self, **params):
@@ -57,6 +60,8 @@ class P4Host(Host):
 class P4Switch(Switch):
     """P4 virtual switch"""
     device_id = 0
+    # Seconds it took for the switch to be ready, set by start()
+    ready_time = None
 
     def __init__(self, name, sw_path = None, json_path = None,
                  thrift_port = None,
@@ -109,12 +114,16 @@ class P4Switch(Switch):
         server has been started. If the Thrift server is ready, we assume that
         the switch was started successfully. This is only reliable if the Thrift
         server is started at the end of the init process"""
+        start = time()
+        delay = SWITCH_POLL_INITIAL_DELAY
         while True:
             if not os.path.exists(os.path.join("/proc", str(pid))):
                 return False
             if check_listening_on_port(self.thrift_port):
+                self.ready_time = time() - start
                 return True
-            sleep(0.5)
+            sleep(delay)
+            delay = min(delay * 2, SWITCH_POLL_MAX_DELAY)
 
     def start(self, controllers):
         "Start up a new P4 switch"
@@ -147,7 +156,7 @@ class P4Switch(Switch):
         if not self.check_switch_started(pid):
             error("P4 switch {} did not start correctly.\n".format(self.name))
             exit(1)
-        info("P4 switch {} has been started.\n".format(self.name))
+        info("P4 switch {} has been started (ready in {:.3f}s).\n".format(self.name, self.ready_time))
 
     def stop(self):
         "Terminate P4 switch."
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+from p4.v1 import p4runtime_pb2
+
+from .helper import P4InfoHelper
+from .runtime_conf import readRuntimeConf
+from .switch import WRITE_BATCH_MAX_SIZE
+
+'''
+Compiled runtime configurations: the updates of a runtime configuration,
+already encoded, so that programming a switch does not parse any value.
+
+The file starts with MAGIC, the SHA-256 of the P4Info the configuration
+was compiled with and the length of the header (uint32), followed by the
+header: the members of the runtime configuration other than entry lists
+(target, p4info, bmv2_json...), in JSON. Then come records made of the
+length of a WriteRequest (uint32) followed by the WriteRequest, serialized
+in binary protobuf format, holding up to WRITE_BATCH_MAX_SIZE updates
+(without device or election id). All integers are little endian.
+
+program_switch loads files ending with COMPILED_CONF_SUFFIX directly, and
+refuses them when the P4Info they were compiled with has changed.
+
+Usage: python3 -m p4runtime_lib.compiled_conf s1-runtime.json s1-runtime.p4rtcfg
+'''
+
+MAGIC = b'P4RTCFG1'
+HEADER = struct.Struct('<32sI')
+RECORD = struct.Struct('<I')
+COMPILED_CONF_SUFFIX = '.p4rtcfg'
+
+
+class CompiledConfFormatException(Exception):
+    pass
+
+
+def p4infoDigest(p4info):
+    "SHA-256 of a P4Info message, independent of the P4Info file format"
+    return hashlib.sha256(p4info.SerializeToString(deterministic=True)).digest()
+
+def isCompiledConf(conf_file):
+    return getattr(conf_file, 'name', '').endswith(COMPILED_CONF_SUFFIX)
+
+def writeCompiledConf(f, sw_conf, p4info, updates, max_batch_size=WRITE_BATCH_MAX_SIZE):
+    """Writes a compiled configuration to the binary file object f, updates
+    being an iterable of Update messages. Returns the number of updates."""
+    header = json.dumps(sw_conf).encode('utf-8')
+    f.write(MAGIC)
+    f.write(HEADER.pack(p4infoDigest(p4info), len(header)))
+    f.write(header)
+    count = 0
+    request = p4runtime_pb2.WriteRequest()
+    for update in updates:
+        request.updates.add().CopyFrom(update)
+        count += 1
+        if len(request.updates) >= max_batch_size:
+            writeRequestRecord(f, request)
+            request = p4runtime_pb2.WriteRequest()
+    if len(request.updates):
+        writeRequestRecord(f, request)
+    return count
+
+def writeRequestRecord(f, request):
+    data = request.SerializeToString()
+    f.write(RECORD.pack(len(data)))
+    f.write(data)
+
+def readCompiledConf(f):
+    """Returns (sw_conf, p4info digest, requests) for the compiled
+    configuration file f (text or binary file object), requests being an
+    iterator of WriteRequest messages read as it is consumed."""
+    f = getattr(f, 'buffer', f)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise CompiledConfFormatException("not a compiled runtime configuration")
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise CompiledConfFormatException("truncated header")
+    digest, header_len = HEADER.unpack(data)
+    header = f.read(header_len)
+    if len(header) < header_len:
+        raise CompiledConfFormatException("truncated header")
+    return json.loads(header.decode('utf-8')), digest, readRequestRecords(f)
+
+def readRequestRecords(f):
+    while True:
+        data = f.read(RECORD.size)
+        if not data:
+            return
+        if len(data) < RECORD.size:
+            raise CompiledConfFormatException("truncated record")
+        length, = RECORD.unpack(data)
+        data = f.read(length)
+        if len(data) < length:
+            raise CompiledConfFormatException("truncated record")
+        request = p4runtime_pb2.WriteRequest()
+        request.ParseFromString(data)
+        yield request
+
+
+def compileRuntimeConf(conf_path, out_path, p4info_path=None, workdir=None):
+    """Compiles the runtime configuration at conf_path to out_path, using
+    the P4Info it references unless p4info_path is given. As in
+    program_switch, the referenced P4Info is relative to workdir, by default
+    the current directory (the exercise directory for run_exercise).
+    Returns the number of updates written."""
+    # simple_controller imports this module
+    from .simple_controller import buildEntryUpdate
+
+    with open(conf_path, 'r') as conf_file:
+        sw_conf, entries = readRuntimeConf(conf_file)
+        if p4info_path is None:
+            if 'p4info' not in sw_conf:
+                raise CompiledConfFormatException("%s does not reference a P4Info" % conf_path)
+            p4info_path = os.path.join(workdir if workdir is not None else os.getcwd(),
+                                       sw_conf['p4info'])
+        p4info_helper = P4InfoHelper(p4info_path)
+        updates = (buildEntryUpdate(list_name, entry, p4info_helper)
+                   for list_name, entry in entries)
+        # Written next to the output, so that a failed compilation does not
+        # leave a truncated file behind
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            count = writeCompiledConf(out, sw_conf, p4info_helper.p4info, updates)
+        os.replace(tmp_path, out_path)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runtime configuration compiler')
+    parser.add_argument('runtime_conf_file', help='runtime configuration (JSON or JSON Lines)',
+                        type=str)
+    parser.add_argument('output_file', help='compiled configuration (*%s), by default the '
+                                            'runtime configuration with that suffix'
+                                            % COMPILED_CONF_SUFFIX,
+                        type=str, nargs='?')
+    parser.add_argument('--p4info', help='P4Info file to compile with, by default the one '
+                                         'referenced by the runtime configuration',
+                        type=str, action="store")
+    parser.add_argument('--workdir', help='directory the P4Info referenced by the runtime '
+                                          'configuration is relative to, by default the '
+                                          'current directory',
+                        type=str, action="store")
+    args = parser.parse_args()
+
+    output_file = args.output_file
+    if output_file is None:
+        output_file = os.path.splitext(args.runtime_conf_file)[0] + COMPILED_CONF_SUFFIX
+    count = compileRuntimeConf(args.runtime_conf_file, output_file, p4info_path=args.p4info,
+                               workdir=args.workdir)
+    print("Compiled %d updates to %s" % (count, output_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -17,11 +17,20 @@ import socket
 
 import math
 
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, the bulk encoders also accept plain lists
+    numpy = None
+
 '''
 This package contains several helper functions for encoding to and decoding from byte strings:
 - integers
 - IPv4 address strings
 - Ethernet address strings
+
+The *Many variants encode a whole column of values (a list or a NumPy array)
+at once and return a list of byte strings.
 '''
 
 mac_pattern = re.compile('^([\da-fA-F]{2}:){5}([\da-fA-F]{2})$')
@@ -78,6 +87,93 @@ def encode(x, bitwidth):
     assert(len(encoded_bytes) == byte_len)
     return encoded_bytes
 
+def compileEncoder(bitwidth):
+    """Returns a function encoding single values of the given bitwidth.
+
+    The byte length and value range are computed once, and only the string
+    formats the field can hold are tried, so the returned function is meant
+    for encoding many values of the same field. Strings and numbers are
+    encoded exactly as by `encode`; bytes of the field length are taken as
+    already encoded.
+    """
+    byte_len = bitwidthToBytes(bitwidth)
+    limit = 1 << bitwidth
+
+    def encodeValue(x):
+        if type(x) == int:
+            if x >= limit:
+                raise Exception("Number, %d, does not fit in %d bits" % (x, bitwidth))
+            return x.to_bytes(byte_len, 'big')
+        if type(x) == str:
+            if byte_len == 6 and matchesMac(x):
+                return encodeMac(x)
+            if byte_len == 4 and matchesIPv4(x):
+                return encodeIPv4(x)
+        elif type(x) == bytes and len(x) == byte_len:
+            return x
+        # Anything else goes through the generic, type-sniffing encoder
+        return encode(x, bitwidth)
+
+    return encodeValue
+
+def isArray(values):
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+def encodeNumMany(numbers, bitwidth):
+    byte_len = bitwidthToBytes(bitwidth)
+    if len(numbers) == 0:
+        return []
+    if isArray(numbers) and numbers.dtype.kind in 'ui' and byte_len <= 8:
+        if numbers.min() < 0 or int(numbers.max()) >= 2 ** bitwidth:
+            raise Exception("Numbers do not fit in %d bits" % bitwidth)
+        # Big-endian 64-bit view of the column, keeping only the low bytes
+        raw = numbers.astype('>u8').view(numpy.uint8).reshape(-1, 8)
+        data = raw[:, 8 - byte_len:].tobytes()
+        return [data[i:i + byte_len] for i in range(0, len(data), byte_len)]
+    numbers = numbers.tolist() if isArray(numbers) else numbers
+    if max(numbers) >= 2 ** bitwidth:
+        raise Exception("Numbers do not fit in %d bits" % bitwidth)
+    return [n.to_bytes(byte_len, 'big') for n in numbers]
+
+def encodeIPv4Many(ip_addrs):
+    'Encodes IPv4 address strings, or addresses given as 32-bit integers'
+    if isArray(ip_addrs) and ip_addrs.dtype.kind in 'ui':
+        return encodeNumMany(ip_addrs, 32)
+    return [socket.inet_aton(a) for a in ip_addrs]
+
+def encodeMacMany(mac_addrs):
+    'Encodes Ethernet address strings, or addresses given as 48-bit integers'
+    if isArray(mac_addrs) and mac_addrs.dtype.kind in 'ui':
+        return encodeNumMany(mac_addrs, 48)
+    fromhex = bytes.fromhex
+    encoded = [fromhex(a.replace(':', '')) for a in mac_addrs]
+    if any(len(e) != 6 for e in encoded):
+        raise Exception("Invalid Ethernet address in %r" % (mac_addrs,))
+    return encoded
+
+def encodeMany(values, bitwidth):
+    """Encodes a column of values of the same type.
+
+    The type is inferred once, from the array dtype or from the first value,
+    instead of once per value as in `encode`.
+    """
+    if len(values) == 0:
+        return []
+    if isArray(values):
+        if values.dtype.kind in 'ui':
+            return encodeNumMany(values, bitwidth)
+        values = values.tolist()
+    byte_len = bitwidthToBytes(bitwidth)
+    first = values[0]
+    if type(first) == int:
+        return encodeNumMany(values, bitwidth)
+    if type(first) == str:
+        if byte_len == 6 and matchesMac(first):
+            return encodeMacMany(values)
+        if byte_len == 4 and matchesIPv4(first):
+            return encodeIPv4Many(values)
+    return [encode(x, bitwidth) for x in values]
+
 if __name__ == '__main__':
     # TODO These tests should be moved out of main eventually
     mac = "aa:bb:cc:dd:ee:ff"
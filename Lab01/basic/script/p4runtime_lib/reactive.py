@@ -0,0 +1,192 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from queue import Empty
+from time import monotonic
+
+from google.rpc import code_pb2
+
+from .switch import WRITE_BATCH_MAX_SIZE, WriteBatchException
+
+'''
+Framework for reactive controllers driven by P4Runtime digests.
+
+The data plane sends a digest (e.g. the source MAC and ingress port of an
+unknown host) instead of the whole packet. A DigestController subscribes to
+digests, turns each of them into table entries with a user handler, and
+coalesces the entries learned from many digests into batched writes.
+
+Example, L2 learning:
+
+    def learn(digest):
+        return [smac_encoder((digest['srcAddr'],)),
+                dmac_encoder((digest['srcAddr'], digest['port']))]
+
+    controller = DigestController(sw, p4info_helper)
+    controller.subscribe('mac_learn_digest_t', learn, max_list_size=100,
+                         max_timeout_ns=1000000)
+    controller.run()
+'''
+
+# Longest time learned entries wait before being written
+DIGEST_FLUSH_DELAY = 0.01 # seconds
+
+
+def entryKey(table_entry):
+    "Identifies a table entry by table, match and priority"
+    return (table_entry.table_id, table_entry.priority,
+            b''.join(m.SerializeToString(deterministic=True) for m in table_entry.match))
+
+
+class DigestController(object):
+    """Turns digests received on a SwitchConnection into batched table writes.
+
+    Handlers registered with subscribe() are called with each digest as a
+    {member name: value bytes} dict, and return the table entries to
+    install. Entries are written when max_batch_size of them are pending, or
+    flush_delay seconds after the oldest one was learned. An entry already
+    installed with the same action is not written again, one with another
+    action is modified. An entry the switch already holds (ALREADY_EXISTS)
+    is modified on the next flush, its installed action being unknown.
+    Entries not sent because the WriteRequest failed as a whole (counted in
+    stats['unsent']) are written again with the next flush.
+    """
+
+    def __init__(self, sw, p4info_helper, max_batch_size=WRITE_BATCH_MAX_SIZE,
+                 flush_delay=DIGEST_FLUSH_DELAY):
+        self.sw = sw
+        self.p4info_helper = p4info_helper
+        self.max_batch_size = max_batch_size
+        self.flush_delay = flush_delay
+        # digest id -> (member names, handler)
+        self.handlers = {}
+        # entry key -> serialized action of the installed entries, None
+        # when the action is unknown
+        self.installed = {}
+        # entry key -> table entry, waiting to be written
+        self.pending = {}
+        self.pending_since = None
+        self.stats = {'digests': 0, 'lists': 0, 'entries': 0, 'errors': 0, 'unsent': 0}
+
+    def subscribe(self, digest_name, handler, max_timeout_ns=0, max_list_size=1,
+                  ack_timeout_ns=1000000000):
+        digest_entry = self.p4info_helper.buildDigestEntry(
+            digest_name, max_timeout_ns=max_timeout_ns,
+            max_list_size=max_list_size, ack_timeout_ns=ack_timeout_ns)
+        digest_id = digest_entry.digest_id
+        self.handlers[digest_id] = (
+            self.p4info_helper.get_digest_member_names(digest_id), handler)
+        self.sw.WriteDigestEntry(digest_entry)
+
+    def handleDigestList(self, digest_list):
+        # Ack first, the switch keeps sending digests while we handle them
+        self.sw.AckDigestList(digest_list)
+        self.stats['lists'] += 1
+        handler_info = self.handlers.get(digest_list.digest_id)
+        if handler_info is None:
+            return
+        names, handler = handler_info
+        parse = self.p4info_helper.parseDigest
+        for data in digest_list.data:
+            self.stats['digests'] += 1
+            digest = parse(digest_list.digest_id, data, names)
+            for table_entry in handler(digest) or ():
+                self.learn(table_entry)
+
+    def learn(self, table_entry):
+        key = entryKey(table_entry)
+        action = table_entry.action.SerializeToString(deterministic=True)
+        if key not in self.pending and self.installed.get(key) == action:
+            return
+        if not self.pending:
+            self.pending_since = monotonic()
+        self.pending[key] = table_entry
+
+    def flush(self):
+        "Writes all the pending entries in batched WriteRequests"
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        batch = self.sw.WriteBatch(max_batch_size=self.max_batch_size)
+        keys = list(pending)
+        for key in keys:
+            if key in self.installed:
+                batch.ModifyTableEntry(pending[key])
+            else:
+                batch.InsertTableEntry(pending[key])
+        failed = set()
+        try:
+            batch.Flush()
+        except WriteBatchException as e:
+            for idx, update, p4_error in e.errors:
+                key = keys[idx]
+                failed.add(key)
+                if p4_error.canonical_code == code_pb2.ALREADY_EXISTS:
+                    # Installed by someone else, maybe with another action:
+                    # modify it on the next flush
+                    self.installed[key] = None
+                    self.requeue(key, pending[key])
+                else:
+                    self.stats['errors'] += 1
+            # Entries that could not be sent go out with the next flush
+            for idx, update in e.unsent:
+                key = keys[idx]
+                failed.add(key)
+                self.requeue(key, pending[key])
+                self.stats['unsent'] += 1
+        for key in keys:
+            if key not in failed:
+                self.installed[key] = pending[key].action.SerializeToString(deterministic=True)
+        self.stats['entries'] += len(keys) - len(failed)
+
+    def requeue(self, key, table_entry):
+        "Writes an entry again with the next flush, unless learned again since"
+        if key in self.pending:
+            return
+        if not self.pending:
+            self.pending_since = monotonic()
+        self.pending[key] = table_entry
+
+    def forget(self, table_entry):
+        "Removes an entry from the installed set, e.g. after an idle timeout"
+        self.installed.pop(entryKey(table_entry), None)
+
+    def poll(self, timeout=None):
+        """Handles the digests received within timeout seconds and writes the
+        entries that are due. Returns False once the stream is closed."""
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            wait = None if deadline is None else max(0, deadline - monotonic())
+            if self.pending:
+                due = self.pending_since + self.flush_delay - monotonic()
+                wait = max(0, due) if wait is None else max(0, min(wait, due))
+            try:
+                response = self.sw.stream.get('digest', timeout=wait)
+            except Empty:
+                response = False
+            if response is None:
+                self.flush()
+                return False
+            if response is not False:
+                self.handleDigestList(response.digest)
+            if self.pending and (len(self.pending) >= self.max_batch_size or
+                                 monotonic() - self.pending_since >= self.flush_delay):
+                self.flush()
+            if deadline is not None and monotonic() >= deadline:
+                return True
+
+    def run(self):
+        "Handles digests until the connection is shut down"
+        while self.poll(timeout=1):
+            pass
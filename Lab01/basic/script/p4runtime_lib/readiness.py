@@ -0,0 +1,83 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from time import monotonic, sleep
+
+import grpc
+from p4.v1 import p4runtime_pb2
+from p4.v1 import p4runtime_pb2_grpc
+
+'''
+Helpers to wait until P4Runtime servers answer requests.
+
+A switch is ready as soon as its gRPC server answers a cheap P4Runtime call
+(Capabilities). Probes are retried with an exponential backoff until a per-switch deadline.
+'''
+
+PROBE_INITIAL_DELAY = 0.01 # seconds
+PROBE_MAX_DELAY = 0.1 # seconds
+PROBE_TIMEOUT = 1 # seconds
+
+# Status codes meaning the server did not answer yet. Any other status
+# (including UNIMPLEMENTED) comes from a running P4Runtime server.
+NOT_READY_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+# Keep gRPC from waiting up to a second between reconnection attempts
+PROBE_CHANNEL_OPTIONS = [
+    ('grpc.initial_reconnect_backoff_ms', int(PROBE_INITIAL_DELAY * 1000)),
+    ('grpc.min_reconnect_backoff_ms', int(PROBE_INITIAL_DELAY * 1000)),
+    ('grpc.max_reconnect_backoff_ms', int(PROBE_MAX_DELAY * 1000)),
+]
+
+
+class SwitchNotReadyException(Exception):
+    pass
+
+
+def probeSwitch(stub, timeout=PROBE_TIMEOUT):
+    "Returns True if the P4Runtime server behind stub answers a request"
+    try:
+        stub.Capabilities(p4runtime_pb2.CapabilitiesRequest(), timeout=timeout)
+    except grpc.RpcError as e:
+        return e.code() not in NOT_READY_CODES
+    return True
+
+
+def waitForSwitch(address, timeout, alive=None,
+                  initial_delay=PROBE_INITIAL_DELAY, max_delay=PROBE_MAX_DELAY):
+    """Probes the P4Runtime server at address until it answers, and returns
+    the time it took in seconds.
+
+    alive is an optional function returning False when the switch can no
+    longer become ready (e.g. its process exited). Raises
+    SwitchNotReadyException when the switch is not ready after timeout
+    seconds or is not alive anymore.
+    """
+    start = monotonic()
+    deadline = start + timeout
+    delay = initial_delay
+    with grpc.insecure_channel(address, options=PROBE_CHANNEL_OPTIONS) as channel:
+        stub = p4runtime_pb2_grpc.P4RuntimeStub(channel)
+        while True:
+            if alive is not None and not alive():
+                raise SwitchNotReadyException(
+                    "switch at %s exited before being ready" % address)
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise SwitchNotReadyException(
+                    "switch at %s not ready after %.1fs" % (address, timeout))
+            if probeSwitch(stub, timeout=min(PROBE_TIMEOUT, remaining)):
+                return monotonic() - start
+            sleep(min(delay, max(0, deadline - monotonic())))
+            delay = min(delay * 2, max_delay)
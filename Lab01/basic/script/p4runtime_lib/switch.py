@@ -12,20 +12,73 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from queue import Queue
+from queue import Empty, Full, Queue
 from abc import abstractmethod
 from datetime import datetime
+from threading import Lock, Thread
+import atexit
+import hashlib
+import time
 
 import grpc
 from p4.v1 import p4runtime_pb2
 from p4.v1 import p4runtime_pb2_grpc
 from p4.tmp import p4config_pb2
 
+from .error_utils import parseGrpcErrorBinaryDetails
+from . import request_log
+
 MSG_LOG_MAX_LEN = 1024
+# Maximum number of messages waiting to be written by a GrpcRequestLogger
+LOG_QUEUE_MAX_LEN = 10000
+# Maximum number of stream messages of each type waiting to be consumed
+STREAM_QUEUE_MAX_LEN = 10000
+
+# Maximum number of updates sent in a single WriteRequest by WriteBatch
+WRITE_BATCH_MAX_SIZE = 1000
+# Maximum number of WriteRequests queued by a PipelinedWriteBatch
+WRITE_MAX_IN_FLIGHT = 2
 
 # List of all active connections
 connections = []
 
+SetPipelineRequest = p4runtime_pb2.SetForwardingPipelineConfigRequest
+
+def pipelineAction(action):
+    "Accepts a SetForwardingPipelineConfigRequest.Action value or name"
+    if isinstance(action, str):
+        return SetPipelineRequest.Action.Value(action)
+    return action
+
+def pipelineCookie(p4info, device_config_bytes):
+    "64-bit cookie identifying a P4Info and device config pair"
+    digest = hashlib.sha256(p4info.SerializeToString(deterministic=True))
+    digest.update(device_config_bytes)
+    return int.from_bytes(digest.digest()[:8], 'big')
+
+def buildSetPipelineRequest(device_id, p4info, device_config_bytes, action):
+    request = SetPipelineRequest()
+    request.election_id.low = 1
+    request.device_id = device_id
+    request.action = pipelineAction(action)
+    # COMMIT applies a previously saved config, it takes no config
+    if request.action != SetPipelineRequest.COMMIT:
+        config = request.config
+        config.p4info.CopyFrom(p4info)
+        config.p4_device_config = device_config_bytes
+        config.cookie.cookie = pipelineCookie(p4info, device_config_bytes)
+    return request
+
+def buildGetPipelineCookieRequest(device_id):
+    request = p4runtime_pb2.GetForwardingPipelineConfigRequest()
+    request.device_id = device_id
+    request.response_type = p4runtime_pb2.GetForwardingPipelineConfigRequest.COOKIE_ONLY
+    return request
+
+# Status codes of GetForwardingPipelineConfig on a switch without pipeline
+# config (BMv2 answers FAILED_PRECONDITION)
+NO_PIPELINE_CODES = (grpc.StatusCode.FAILED_PRECONDITION, grpc.StatusCode.NOT_FOUND)
+
 def ShutdownAllSwitchConnections():
     for c in connections:
         c.shutdown()
@@ -39,12 +92,14 @@ class SwitchConnection(object):
         self.device_id = device_id
         self.p4info = None
         self.channel = grpc.insecure_channel(self.address)
+        self.request_logger = None
         if proto_dump_file is not None:
-            interceptor = GrpcRequestLogger(proto_dump_file)
-            self.channel = grpc.intercept_channel(self.channel, interceptor)
+            self.request_logger = GrpcRequestLogger(proto_dump_file)
+            self.channel = grpc.intercept_channel(self.channel, self.request_logger)
         self.client_stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
         self.requests_stream = IterableQueue()
         self.stream_msg_resp = self.client_stub.StreamChannel(iter(self.requests_stream))
+        self.stream = StreamMessageDispatcher(self.stream_msg_resp, name=name)
         self.proto_dump_file = proto_dump_file
         connections.append(self)
 
@@ -52,9 +107,14 @@ class SwitchConnection(object):
     def buildDeviceConfig(self, **kwargs):
         return p4config_pb2.P4DeviceConfig()
 
+    def buildDeviceConfigBytes(self, **kwargs):
+        return self.buildDeviceConfig(**kwargs).SerializeToString()
+
     def shutdown(self):
         self.requests_stream.close()
         self.stream_msg_resp.cancel()
+        if self.request_logger is not None:
+            self.request_logger.close()
 
     def MasterArbitrationUpdate(self, dry_run=False, **kwargs):
         request = p4runtime_pb2.StreamMessageRequest()
@@ -66,24 +126,55 @@ class SwitchConnection(object):
             print("P4Runtime MasterArbitrationUpdate: ", request)
         else:
             self.requests_stream.put(request)
-            for item in self.stream_msg_resp:
-                return item # just one
+            return self.stream.get('arbitration')
 
-    def SetForwardingPipelineConfig(self, p4info, dry_run=False, **kwargs):
-        device_config = self.buildDeviceConfig(**kwargs)
-        request = p4runtime_pb2.SetForwardingPipelineConfigRequest()
-        request.election_id.low = 1
-        request.device_id = self.device_id
-        config = request.config
+    def SendPacketOut(self, packet_out):
+        "Queues a PacketOut message (see P4InfoHelper.buildPacketOut)"
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.packet.CopyFrom(packet_out)
+        self.requests_stream.put(request)
 
-        config.p4info.CopyFrom(p4info)
-        config.p4_device_config = device_config.SerializeToString()
+    def SendPacketOuts(self, packet_outs):
+        "Queues many PacketOut messages at once"
+        put = self.requests_stream.put
+        for packet_out in packet_outs:
+            put(p4runtime_pb2.StreamMessageRequest(packet=packet_out))
+
+    def GetPipelineCookie(self):
+        "Returns the cookie of the installed pipeline config, None if unset"
+        try:
+            response = self.client_stub.GetForwardingPipelineConfig(
+                buildGetPipelineCookieRequest(self.device_id))
+        except grpc.RpcError as e:
+            if e.code() in NO_PIPELINE_CODES:
+                return None
+            raise
+        if not response.config.HasField('cookie'):
+            return None
+        return response.config.cookie.cookie
+
+    def SetForwardingPipelineConfig(self, p4info, dry_run=False,
+                                    action=SetPipelineRequest.VERIFY_AND_COMMIT,
+                                    skip_if_installed=False, **kwargs):
+        """Pushes the pipeline config, returns False if it was skipped.
 
-        request.action = p4runtime_pb2.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT
+        Every pushed config carries a cookie hashing the P4Info and the
+        device config. With skip_if_installed, the config is not pushed (and
+        table state is kept) when the switch reports the same cookie.
+        """
+        device_config_bytes = b''
+        if pipelineAction(action) != SetPipelineRequest.COMMIT:
+            device_config_bytes = self.buildDeviceConfigBytes(**kwargs)
+        request = buildSetPipelineRequest(self.device_id, p4info,
+                                          device_config_bytes, action)
         if dry_run:
             print("P4Runtime SetForwardingPipelineConfig:", request)
-        else:
-            self.client_stub.SetForwardingPipelineConfig(request)
+            return True
+        if skip_if_installed and request.HasField('config') and \
+                self.GetPipelineCookie() == request.config.cookie.cookie:
+            return False
+        self.client_stub.SetForwardingPipelineConfig(request)
+        return True
 
     def WriteTableEntry(self, table_entry, dry_run=False):
         request = p4runtime_pb2.WriteRequest()
@@ -133,6 +224,17 @@ class SwitchConnection(object):
                 yield response
 
 
+    def ReadEntities(self, entities, dry_run=False):
+        "Reads all the given (possibly wildcard) entities in a single Read"
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        request.entities.extend(entities)
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            for response in self.client_stub.Read(request):
+                yield response
+
     def WritePREEntry(self, pre_entry, dry_run=False):
         request = p4runtime_pb2.WriteRequest()
         request.device_id = self.device_id
@@ -145,26 +247,555 @@ class SwitchConnection(object):
         else:
             self.client_stub.Write(request)
 
+    def WriteDigestEntry(self, digest_entry, dry_run=False):
+        "Subscribes to a digest (see P4InfoHelper.buildDigestEntry)"
+        request = p4runtime_pb2.WriteRequest()
+        request.device_id = self.device_id
+        request.election_id.low = 1
+        update = request.updates.add()
+        update.type = p4runtime_pb2.Update.INSERT
+        update.entity.digest_entry.CopyFrom(digest_entry)
+        if dry_run:
+            print("P4Runtime Write:", request)
+        else:
+            self.client_stub.Write(request)
+
+    def AckDigestList(self, digest_list):
+        "Acknowledges a DigestList, so that the switch can send the next ones"
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.digest_ack.digest_id = digest_list.digest_id
+        request.digest_ack.list_id = digest_list.list_id
+        self.requests_stream.put(request)
+
+    def WriteBatch(self, max_batch_size=WRITE_BATCH_MAX_SIZE, dry_run=False):
+        return WriteBatch(self, max_batch_size=max_batch_size, dry_run=dry_run)
+
+    def PipelinedWriteBatch(self, max_batch_size=WRITE_BATCH_MAX_SIZE,
+                            max_in_flight=WRITE_MAX_IN_FLIGHT, dry_run=False):
+        return PipelinedWriteBatch(self, max_batch_size=max_batch_size,
+                                   max_in_flight=max_in_flight, dry_run=dry_run)
+
+
+class WriteBatchException(Exception):
+    """Raised by WriteBatch.Flush when some updates of the batch failed.
+
+    `errors` is a list of (index, update, p4_error) tuples, where index is the
+    position of the update in the batch and p4_error the p4.Error Protobuf
+    message returned by the server for that update.
+
+    When a WriteRequest failed as a whole (e.g. the switch is UNAVAILABLE),
+    `cause` is that grpc.RpcError and `unsent` the list of (index, update)
+    of the updates of this request and of the following ones, which were
+    not sent. `errors` still holds the errors of the requests sent before.
+    """
+
+    def __init__(self, errors, unsent=None, cause=None):
+        self.errors = errors
+        self.unsent = unsent or []
+        self.cause = cause
+        message = "%d update(s) failed in write batch" % len(errors)
+        if cause is not None:
+            message += ", %d not sent: %s" % (len(self.unsent), cause)
+        super(WriteBatchException, self).__init__(message)
+
+
+class WriteBatch(object):
+    """Collects updates and sends them to the switch as batched WriteRequests.
+
+    Updates are buffered until Flush is called (or the batch is used as a
+    context manager and exits), then sent in WriteRequests holding at most
+    max_batch_size updates each. Failures are reported per update through
+    WriteBatchException once every request has been sent.
+    """
+
+    def __init__(self, sw, max_batch_size=WRITE_BATCH_MAX_SIZE, dry_run=False):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.sw = sw
+        self.max_batch_size = max_batch_size
+        self.dry_run = dry_run
+        self.updates = []
+        # Number of updates already flushed, used to report global indexes
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self.updates)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.Flush()
+
+    def AddUpdate(self, update_type, entity_field, message):
+        update = p4runtime_pb2.Update()
+        update.type = update_type
+        getattr(update.entity, entity_field).CopyFrom(message)
+        self.updates.append(update)
+        return update
+
+    def AddUpdates(self, updates):
+        "Adds already built Update messages, e.g. those of a WriteRequest"
+        self.updates.extend(updates)
+
+    def WriteTableEntry(self, table_entry):
+        # Same INSERT / MODIFY choice as SwitchConnection.WriteTableEntry
+        if table_entry.is_default_action:
+            return self.ModifyTableEntry(table_entry)
+        return self.InsertTableEntry(table_entry)
+
+    def InsertTableEntry(self, table_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.INSERT, 'table_entry', table_entry)
+
+    def ModifyTableEntry(self, table_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.MODIFY, 'table_entry', table_entry)
+
+    def DeleteTableEntry(self, table_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.DELETE, 'table_entry', table_entry)
+
+    def WritePREEntry(self, pre_entry):
+        return self.InsertPREEntry(pre_entry)
+
+    def InsertPREEntry(self, pre_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.INSERT,
+                              'packet_replication_engine_entry', pre_entry)
+
+    def ModifyPREEntry(self, pre_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.MODIFY,
+                              'packet_replication_engine_entry', pre_entry)
+
+    def DeletePREEntry(self, pre_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.DELETE,
+                              'packet_replication_engine_entry', pre_entry)
+
+    def InsertDigestEntry(self, digest_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.INSERT, 'digest_entry', digest_entry)
+
+    def ModifyDigestEntry(self, digest_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.MODIFY, 'digest_entry', digest_entry)
+
+    def DeleteDigestEntry(self, digest_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.DELETE, 'digest_entry', digest_entry)
+
+    def ModifyCounterEntry(self, counter_entry):
+        # Counter and meter entries always exist, they can only be modified
+        return self.AddUpdate(p4runtime_pb2.Update.MODIFY, 'counter_entry', counter_entry)
+
+    def ModifyMeterEntry(self, meter_entry):
+        return self.AddUpdate(p4runtime_pb2.Update.MODIFY, 'meter_entry', meter_entry)
+
+    def buildWriteRequest(self, updates):
+        request = p4runtime_pb2.WriteRequest()
+        request.device_id = self.sw.device_id
+        request.election_id.low = 1
+        request.updates.extend(updates)
+        return request
+
+    def takeWriteRequests(self, full_only=False):
+        """Empties the batch, yielding (offset, updates, request) for each
+        WriteRequest to send, offset being the global index of its first
+        update. With full_only, the updates that do not fill a whole
+        request are kept in the batch."""
+        end = len(self.updates)
+        if full_only:
+            end -= end % self.max_batch_size
+        updates, self.updates = self.updates[:end], self.updates[end:]
+        for start in range(0, len(updates), self.max_batch_size):
+            chunk = updates[start:start + self.max_batch_size]
+            offset = self.flushed
+            self.flushed += len(chunk)
+            yield offset, chunk, self.buildWriteRequest(chunk)
+
+    @staticmethod
+    def indexUpdates(offset, updates):
+        return [(offset + idx, update) for idx, update in enumerate(updates)]
+
+    @staticmethod
+    def indexErrors(grpc_error, offset, updates):
+        "Maps the errors of a failed WriteRequest back to its updates"
+        p4_errors = parseGrpcErrorBinaryDetails(grpc_error)
+        if p4_errors is None:
+            raise grpc_error
+        return [(offset + idx, updates[idx], p4_error)
+                for idx, p4_error in p4_errors]
+
+    def sendWriteRequest(self, offset, updates, request):
+        "Sends one WriteRequest, returns the errors of its updates"
+        if self.dry_run:
+            print("P4Runtime Write:", request)
+            return []
+        try:
+            self.sw.client_stub.Write(request)
+        except grpc.RpcError as e:
+            return self.indexErrors(e, offset, updates)
+        return []
+
+    def Flush(self):
+        errors = []
+        requests = self.takeWriteRequests()
+        for offset, updates, request in requests:
+            try:
+                errors += self.sendWriteRequest(offset, updates, request)
+            except grpc.RpcError as e:
+                # The switch did not process this request, nor the next ones
+                unsent = self.indexUpdates(offset, updates)
+                for offset, updates, request in requests:
+                    unsent += self.indexUpdates(offset, updates)
+                raise WriteBatchException(errors, unsent, e) from e
+        if errors:
+            raise WriteBatchException(errors)
+
+
+class PipelinedWriteBatch(WriteBatch):
+    """WriteBatch sending each WriteRequest as soon as it is full.
+
+    Requests are sent by a background thread, so that the caller can build
+    the next updates while a Write is in flight. At most max_in_flight
+    requests wait to be sent: adding updates blocks when the switch is
+    slower than the caller, which keeps memory use bounded however many
+    updates are written. Errors are reported by Flush.
+    """
+
+    def __init__(self, sw, max_batch_size=WRITE_BATCH_MAX_SIZE,
+                 max_in_flight=WRITE_MAX_IN_FLIGHT, dry_run=False):
+        super(PipelinedWriteBatch, self).__init__(sw, max_batch_size, dry_run)
+        self.requests = Queue(maxsize=max_in_flight)
+        self.errors = []
+        self.unsent = []
+        self.cause = None
+        self.exception = None
+        self.thread = None
+
+    def AddUpdate(self, update_type, entity_field, message):
+        update = super(PipelinedWriteBatch, self).AddUpdate(update_type, entity_field, message)
+        if len(self.updates) >= self.max_batch_size:
+            self.queueWriteRequests(full_only=True)
+        return update
+
+    def AddUpdates(self, updates):
+        super(PipelinedWriteBatch, self).AddUpdates(updates)
+        if len(self.updates) >= self.max_batch_size:
+            self.queueWriteRequests(full_only=True)
+
+    def queueWriteRequests(self, full_only=False):
+        if self.thread is None:
+            self.thread = Thread(target=self.sendWriteRequests,
+                                 name='PipelinedWriteBatch', daemon=True)
+            self.thread.start()
+        for item in self.takeWriteRequests(full_only):
+            self.requests.put(item)
+
+    def sendWriteRequests(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            if self.cause is not None:
+                # Requests following a failed one are not sent, but still
+                # drained so that the producer is never blocked
+                self.unsent += self.indexUpdates(item[0], item[1])
+                continue
+            if self.exception is not None:
+                continue
+            try:
+                self.errors += self.sendWriteRequest(*item)
+            except grpc.RpcError as e:
+                self.cause = e
+                self.unsent += self.indexUpdates(item[0], item[1])
+            except Exception as e:
+                self.exception = e
+
+    def Flush(self):
+        if self.updates:
+            self.queueWriteRequests()
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+        errors, self.errors = self.errors, []
+        unsent, self.unsent = self.unsent, []
+        cause, self.cause = self.cause, None
+        exception, self.exception = self.exception, None
+        if exception is not None:
+            raise exception
+        if cause is not None:
+            raise WriteBatchException(errors, unsent, cause) from cause
+        if errors:
+            raise WriteBatchException(errors)
+
+
+class AsyncWriteBatch(WriteBatch):
+    """WriteBatch for an AsyncSwitchConnection, Flush has to be awaited"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.Flush()
+
+    async def Flush(self):
+        errors = []
+        requests = self.takeWriteRequests()
+        for offset, updates, request in requests:
+            if self.dry_run:
+                print("P4Runtime Write:", request)
+                continue
+            try:
+                await self.sw.client_stub.Write(request)
+            except grpc.RpcError as e:
+                try:
+                    errors += self.indexErrors(e, offset, updates)
+                except grpc.RpcError:
+                    unsent = self.indexUpdates(offset, updates)
+                    for offset, updates, request in requests:
+                        unsent += self.indexUpdates(offset, updates)
+                    raise WriteBatchException(errors, unsent, e) from e
+        if errors:
+            raise WriteBatchException(errors)
+
+
+class AsyncSwitchConnection(object):
+    """asyncio version of SwitchConnection, built on grpc.aio.
+
+    All RPC methods are coroutines (or async generators for reads and stream
+    messages), so that many switches can be configured concurrently from a
+    single event loop, e.g. with asyncio.gather. Connections must be created
+    from a running event loop.
+    """
+
+    def __init__(self, name=None, address='127.0.0.1:50051', device_id=0,
+                 proto_dump_file=None):
+        self.name = name
+        self.address = address
+        self.device_id = device_id
+        self.p4info = None
+        interceptors = None
+        self.request_logger = None
+        if proto_dump_file is not None:
+            self.request_logger = AsyncGrpcRequestLogger(proto_dump_file)
+            interceptors = [self.request_logger]
+        self.channel = grpc.aio.insecure_channel(self.address,
+                                                 interceptors=interceptors)
+        self.client_stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
+        self.stream = self.client_stub.StreamChannel()
+        self.proto_dump_file = proto_dump_file
+        connections.append(self)
+
+    @abstractmethod
+    def buildDeviceConfig(self, **kwargs):
+        return p4config_pb2.P4DeviceConfig()
+
+    def buildDeviceConfigBytes(self, **kwargs):
+        return self.buildDeviceConfig(**kwargs).SerializeToString()
+
+    def shutdown(self):
+        self.stream.cancel()
+        if self.request_logger is not None:
+            self.request_logger.close()
+
+    async def close(self):
+        self.shutdown()
+        await self.channel.close()
+
+    async def SendStreamMessage(self, request):
+        await self.stream.write(request)
+
+    async def StreamMessages(self):
+        "Yields the StreamMessageResponse messages received from the switch"
+        while True:
+            response = await self.stream.read()
+            if response is grpc.aio.EOF:
+                return
+            yield response
+
+    async def MasterArbitrationUpdate(self, dry_run=False, **kwargs):
+        request = p4runtime_pb2.StreamMessageRequest()
+        request.arbitration.device_id = self.device_id
+        request.arbitration.election_id.high = 0
+        request.arbitration.election_id.low = 1
+
+        if dry_run:
+            print("P4Runtime MasterArbitrationUpdate: ", request)
+        else:
+            await self.SendStreamMessage(request)
+            async for item in self.StreamMessages():
+                return item # just one
+
+    async def GetPipelineCookie(self):
+        try:
+            response = await self.client_stub.GetForwardingPipelineConfig(
+                buildGetPipelineCookieRequest(self.device_id))
+        except grpc.RpcError as e:
+            if e.code() in NO_PIPELINE_CODES:
+                return None
+            raise
+        if not response.config.HasField('cookie'):
+            return None
+        return response.config.cookie.cookie
+
+    async def SetForwardingPipelineConfig(self, p4info, dry_run=False,
+                                          action=SetPipelineRequest.VERIFY_AND_COMMIT,
+                                          skip_if_installed=False, **kwargs):
+        device_config_bytes = b''
+        if pipelineAction(action) != SetPipelineRequest.COMMIT:
+            device_config_bytes = self.buildDeviceConfigBytes(**kwargs)
+        request = buildSetPipelineRequest(self.device_id, p4info,
+                                          device_config_bytes, action)
+        if dry_run:
+            print("P4Runtime SetForwardingPipelineConfig:", request)
+            return True
+        if skip_if_installed and request.HasField('config') and \
+                await self.GetPipelineCookie() == request.config.cookie.cookie:
+            return False
+        await self.client_stub.SetForwardingPipelineConfig(request)
+        return True
+
+    async def WriteTableEntry(self, table_entry, dry_run=False):
+        batch = self.WriteBatch(dry_run=dry_run)
+        batch.WriteTableEntry(table_entry)
+        await batch.Flush()
+
+    async def WritePREEntry(self, pre_entry, dry_run=False):
+        batch = self.WriteBatch(dry_run=dry_run)
+        batch.WritePREEntry(pre_entry)
+        await batch.Flush()
+
+    def WriteBatch(self, max_batch_size=WRITE_BATCH_MAX_SIZE, dry_run=False):
+        return AsyncWriteBatch(self, max_batch_size=max_batch_size, dry_run=dry_run)
+
+    async def ReadTableEntries(self, table_id=None, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        table_entry = entity.table_entry
+        if table_id is not None:
+            table_entry.table_id = table_id
+        else:
+            table_entry.table_id = 0
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            async for response in self.client_stub.Read(request):
+                yield response
+
+    async def ReadCounters(self, counter_id=None, index=None, dry_run=False):
+        request = p4runtime_pb2.ReadRequest()
+        request.device_id = self.device_id
+        entity = request.entities.add()
+        counter_entry = entity.counter_entry
+        if counter_id is not None:
+            counter_entry.counter_id = counter_id
+        else:
+            counter_entry.counter_id = 0
+        if index is not None:
+            counter_entry.index.index = index
+        if dry_run:
+            print("P4Runtime Read:", request)
+        else:
+            async for response in self.client_stub.Read(request):
+                yield response
+
+
 class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
                         grpc.UnaryStreamClientInterceptor):
-    """Implementation of a gRPC interceptor that logs request to a file"""
+    """Implementation of a gRPC interceptor that logs request to a file
 
-    def __init__(self, log_file):
+    Messages are queued and written by a background thread to a single open
+    file, so logging does not slow down the RPCs. Messages are only formatted
+    when they are written, and not at all when they are too long to be
+    logged. Logged messages must not be modified after being sent.
+
+    When the queue holds max_queue messages, callers block until there is
+    room, or the message is dropped (and counted in the log) when drop is
+    True. close() writes all the queued messages and closes the file.
+
+    When binary is True, which is the default for files named *.p4rtlog,
+    requests are stored untruncated in the request_log binary format instead
+    of text.
+    """
+
+    def __init__(self, log_file, max_queue=LOG_QUEUE_MAX_LEN, drop=False,
+                 binary=None):
         self.log_file = log_file
-        with open(self.log_file, 'w') as f:
-            # Clear content if it exists.
-            f.write("")
+        if binary is None:
+            binary = request_log.isBinaryLog(log_file)
+        self.binary = binary
+        # Opening in write mode clears content if it exists.
+        if binary:
+            self.file = open(self.log_file, 'wb')
+            request_log.writeHeader(self.file)
+        else:
+            self.file = open(self.log_file, 'w')
+        self.queue = Queue(max_queue)
+        self.drop = drop
+        self.dropped = 0
+        self.dropped_logged = 0
+        self.closed = False
+        self.close_lock = Lock()
+        self.writer = Thread(target=self.write_messages,
+                             name='GrpcRequestLogger(%s)' % log_file, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
 
     def log_message(self, method_name, body):
-        with open(self.log_file, 'a') as f:
-            ts = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            msg = str(body)
-            f.write("\n[%s] %s\n---\n" % (ts, method_name))
-            if len(msg) < MSG_LOG_MAX_LEN:
-                f.write(str(body))
-            else:
-                f.write("Message too long (%d bytes)! Skipping log...\n" % len(msg))
-            f.write('---\n')
+        if self.closed:
+            return
+        item = (time.time(), method_name, body)
+        if not self.drop:
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            self.dropped += 1
+
+    def write_messages(self):
+        f = self.file
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.write_message(f, *item)
+            if self.queue.empty():
+                f.flush()
+        self.write_dropped(f)
+        f.close()
+
+    def write_dropped(self, f):
+        dropped = self.dropped
+        if dropped != self.dropped_logged and not self.binary:
+            f.write("\n%d message(s) dropped, logger queue full\n" % (
+                dropped - self.dropped_logged))
+            self.dropped_logged = dropped
+
+    def write_message(self, f, timestamp, method_name, body):
+        if self.binary:
+            request_log.writeRecord(f, timestamp, method_name, body)
+            return
+        self.write_dropped(f)
+        ts = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        f.write("\n[%s] %s\n---\n" % (ts, method_name))
+        # The text format is never shorter than the binary encoding, so
+        # messages over the limit in binary are skipped without formatting
+        size = body.ByteSize()
+        msg = str(body) if size < MSG_LOG_MAX_LEN else None
+        if msg is not None and len(msg) < MSG_LOG_MAX_LEN:
+            f.write(msg)
+        else:
+            f.write("Message too long (%d bytes)! Skipping log...\n" % (
+                len(msg) if msg is not None else size))
+        f.write('---\n')
+
+    def close(self):
+        "Writes all the queued messages and closes the log file"
+        with self.close_lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.queue.put(None)
+        self.writer.join()
 
     def intercept_unary_unary(self, continuation, client_call_details, request):
         self.log_message(client_call_details.method, request)
@@ -174,6 +805,133 @@ class GrpcRequestLogger(grpc.UnaryUnaryClientInterceptor,
         self.log_message(client_call_details.method, request)
         return continuation(client_call_details, request)
 
+class AsyncGrpcRequestLogger(grpc.aio.UnaryUnaryClientInterceptor,
+                             grpc.aio.UnaryStreamClientInterceptor):
+    """grpc.aio interceptor logging requests with a GrpcRequestLogger"""
+
+    def __init__(self, log_file):
+        self.logger = GrpcRequestLogger(log_file)
+
+    def log_message(self, method_name, body):
+        # grpc.aio gives method names as bytes
+        if isinstance(method_name, bytes):
+            method_name = method_name.decode()
+        self.logger.log_message(method_name, body)
+
+    def close(self):
+        self.logger.close()
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        self.log_message(client_call_details.method, request)
+        return await continuation(client_call_details, request)
+
+    async def intercept_unary_stream(self, continuation, client_call_details, request):
+        self.log_message(client_call_details.method, request)
+        return await continuation(client_call_details, request)
+
+class StreamMessageDispatcher(object):
+    """Reads the StreamChannel responses of a switch in a background thread.
+
+    Each StreamMessageResponse is dispatched on its type ('arbitration',
+    'packet', 'digest', 'idle_timeout_notification', 'error', ...): to the
+    callback registered for the type with on(), or else to a bounded queue
+    read with get(). When a queue is full, new messages of that type are
+    dropped and counted in self.dropped. Exceptions raised by a callback are
+    counted in self.callback_errors, the last one being kept in
+    self.callback_error, and the following messages are still dispatched.
+    """
+
+    _end = object()
+
+    def __init__(self, stream_msg_resp, max_queue=STREAM_QUEUE_MAX_LEN, name=None):
+        self.stream_msg_resp = stream_msg_resp
+        self.max_queue = max_queue
+        self.queues = {}
+        self.callbacks = {}
+        self.dropped = {}
+        self.callback_errors = {}
+        self.callback_error = None
+        self.error = None
+        self.closed = False
+        self.lock = Lock()
+        self.reader = Thread(target=self.read_messages,
+                             name='StreamMessageDispatcher(%s)' % name, daemon=True)
+        self.reader.start()
+
+    def queue(self, kind):
+        with self.lock:
+            q = self.queues.get(kind)
+            if q is None:
+                q = self.queues[kind] = Queue(self.max_queue)
+                if self.closed:
+                    q.put(self._end)
+            return q
+
+    def on(self, kind, callback):
+        """Calls callback(response) from the reader thread for every message
+        of the given type, instead of queueing it. Callbacks must be quick,
+        they delay all the following messages."""
+        self.callbacks[kind] = callback
+
+    def get(self, kind, timeout=None):
+        """Returns the next message of the given type, waiting at most timeout
+        seconds (raises queue.Empty then). Returns None once the stream is
+        closed, or raises the error which closed it."""
+        q = self.queue(kind)
+        response = q.get(timeout=timeout)
+        if response is self._end:
+            # leave the marker for other consumers
+            q.put(self._end)
+            if self.error is not None:
+                raise self.error
+            return None
+        return response
+
+    def get_all(self, kind, max_messages=None):
+        "Returns the messages of the given type already received, without waiting"
+        q = self.queue(kind)
+        responses = []
+        while max_messages is None or len(responses) < max_messages:
+            try:
+                response = q.get_nowait()
+            except Empty:
+                break
+            if response is self._end:
+                q.put(self._end)
+                break
+            responses.append(response)
+        return responses
+
+    def read_messages(self):
+        try:
+            for response in self.stream_msg_resp:
+                kind = response.WhichOneof('update')
+                callback = self.callbacks.get(kind)
+                if callback is not None:
+                    try:
+                        callback(response)
+                    except Exception as e:
+                        self.callback_errors[kind] = self.callback_errors.get(kind, 0) + 1
+                        self.callback_error = e
+                    continue
+                try:
+                    self.queue(kind).put_nowait(response)
+                except Full:
+                    self.dropped[kind] = self.dropped.get(kind, 0) + 1
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.CANCELLED:
+                self.error = e
+        finally:
+            with self.lock:
+                self.closed = True
+                queues = list(self.queues.values())
+            for q in queues:
+                try:
+                    q.put_nowait(self._end)
+                except Full:
+                    # consumers will see the marker once they drained it
+                    q.put(self._end)
+
 class IterableQueue(Queue):
     _sentinel = object()
 
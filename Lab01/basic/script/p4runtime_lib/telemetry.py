@@ -0,0 +1,276 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import csv
+import json
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from time import monotonic, time
+
+import numpy
+from p4.v1 import p4runtime_pb2
+
+from .convert import decodeNum
+from .counters import BYTES, PACKETS, CounterSnapshot
+
+'''
+Periodic collection of counter and register values from many switches.
+
+Every interval (plus or minus a random jitter, so that switches are not
+all polled at the same instant) the collector reads all the tracked
+counters and registers of each switch with a single Read, switches being
+polled concurrently. Samples are kept in fixed-size ring buffers, so the
+memory used does not grow with time. Values the switch did not return are
+stored as NaN, and left out of rates and exports.
+'''
+
+
+class RingBuffer(object):
+    """Fixed capacity buffer of timestamped samples of shape `shape`, backed
+    by NumPy arrays. Once full, new samples overwrite the oldest ones."""
+
+    def __init__(self, capacity, shape, dtype=numpy.float64):
+        self.capacity = capacity
+        self.timestamps = numpy.zeros(capacity, dtype=numpy.float64)
+        self.values = numpy.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.count = 0
+        self.next = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, values):
+        self.timestamps[self.next] = timestamp
+        self.values[self.next] = values
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def series(self, last=None):
+        """Returns (timestamps, values) of the samples in chronological
+        order, only the last `last` ones if given."""
+        n = self.count if last is None else min(last, self.count)
+        order = (numpy.arange(self.next - n, self.next)) % self.capacity
+        return self.timestamps[order], self.values[order]
+
+
+class TrackedArray(object):
+    "Indexes of one counter or register array tracked by the collector"
+
+    def __init__(self, kind, name, entity_id, indexes, columns, capacity):
+        self.kind = kind
+        self.name = name
+        self.entity_id = entity_id
+        self.indexes = list(indexes)
+        self.positions = {index: pos for pos, index in enumerate(self.indexes)}
+        self.index_array = numpy.array(self.indexes, dtype=numpy.intp)
+        self.buffer = RingBuffer(capacity, (len(self.indexes), columns))
+
+
+class TelemetryCollector(object):
+    """Polls counters and registers of several switches at a fixed interval.
+
+    counters and registers map counter (resp. register) names to the list of
+    indexes to track, or to None to track every index of the array. The
+    last `history` samples of each switch are kept.
+    """
+
+    def __init__(self, switches, p4info_helper, counters=None, registers=None,
+                 interval=1.0, jitter=0.1, history=600):
+        self.switches = list(switches)
+        self.interval = interval
+        self.jitter = jitter
+        self.lock = Lock()
+        self.errors = {}
+        self.stop_event = Event()
+        self.thread = None
+
+        counters = counters or {}
+        # Counters are read as in CounterSnapshot.read, registers are added
+        # to the same Read request
+        self.counter_infos, self.entities = CounterSnapshot.readRequest(
+            p4info_helper, list(counters))
+        templates = []
+        for info, indexes in zip(self.counter_infos, counters.values()):
+            templates.append(('counter', info, indexes, 2))
+        for name, indexes in (registers or {}).items():
+            info = p4info_helper.get('registers', name=name)
+            templates.append(('register', info, indexes, 1))
+        for kind, info, indexes, columns in templates:
+            if indexes is not None and any(not 0 <= i < info.size for i in indexes):
+                raise ValueError("%s has %d indexes, cannot track %r" % (
+                    info.preamble.name, info.size, indexes))
+            if kind == 'register':
+                entity = p4runtime_pb2.Entity()
+                entity.register_entry.register_id = info.preamble.id
+                self.entities.append(entity)
+
+        # switch name -> {(kind, entity id): TrackedArray}
+        self.tracked = {}
+        for sw in self.switches:
+            self.tracked[sw.name] = {
+                (kind, info.preamble.id): TrackedArray(
+                    kind, info.preamble.name, info.preamble.id,
+                    range(info.size) if indexes is None else indexes, columns, history)
+                for kind, info, indexes, columns in templates}
+
+    def find(self, sw_name, name):
+        for tracked in self.tracked[sw_name].values():
+            if tracked.name == name:
+                return tracked
+        raise KeyError("%s does not track %r" % (sw_name, name))
+
+    def poll_switch(self, sw):
+        tracked_arrays = self.tracked[sw.name]
+        samples = {key: numpy.full(t.buffer.values.shape[1:], numpy.nan)
+                   for key, t in tracked_arrays.items() if key[0] == 'register'}
+        counter_entities = []
+        for response in sw.ReadEntities(self.entities):
+            for entity in response.entities:
+                if entity.HasField('counter_entry'):
+                    counter_entities.append(entity)
+                    continue
+                if not entity.HasField('register_entry'):
+                    continue
+                entry = entity.register_entry
+                key = ('register', entry.register_id)
+                tracked = tracked_arrays.get(key)
+                pos = tracked.positions.get(entry.index.index) if tracked else None
+                if pos is not None:
+                    samples[key][pos, 0] = decodeNum(entry.data.bitstring)
+        timestamp = time()
+        snapshot = CounterSnapshot.fromEntities(timestamp, self.counter_infos, counter_entities)
+        for info in self.counter_infos:
+            key = ('counter', info.preamble.id)
+            if info.preamble.name in snapshot.missing:
+                samples[key] = numpy.nan
+            else:
+                samples[key] = snapshot[info.preamble.name][tracked_arrays[key].index_array]
+        with self.lock:
+            for key, values in samples.items():
+                self.tracked[sw.name][key].buffer.append(timestamp, values)
+
+    def poll(self, pool=None):
+        "Polls every switch once, concurrently. Errors are kept in self.errors"
+        def poll_one(sw):
+            try:
+                self.poll_switch(sw)
+                self.errors.pop(sw.name, None)
+            except Exception as e:
+                # RPC errors, or unexpected replies: keep polling the others
+                self.errors[sw.name] = e
+        if not self.switches:
+            return
+        if pool is None:
+            with ThreadPoolExecutor(max_workers=len(self.switches)) as pool:
+                list(pool.map(poll_one, self.switches))
+        else:
+            list(pool.map(poll_one, self.switches))
+
+    def run(self):
+        "Polls until stop() is called"
+        with ThreadPoolExecutor(max_workers=max(1, len(self.switches))) as pool:
+            next_poll = monotonic()
+            while not self.stop_event.is_set():
+                self.poll(pool)
+                next_poll += self.interval
+                delay = next_poll - monotonic() + \
+                    random.uniform(-self.jitter, self.jitter) * self.interval
+                if delay < 0:
+                    # too slow to keep up, do not try to catch up
+                    next_poll = monotonic()
+                    delay = 0
+                self.stop_event.wait(delay)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = Thread(target=self.run, name='TelemetryCollector', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def series(self, sw_name, name, index, column=0, last=None):
+        """Returns (timestamps, values) of one tracked index, column being
+        PACKETS or BYTES for counters"""
+        tracked = self.find(sw_name, name)
+        with self.lock:
+            timestamps, values = tracked.buffer.series(last)
+        return timestamps, values[:, tracked.positions[index], column]
+
+    def rates(self, sw_name, name, index, column=BYTES, last=None):
+        "Returns (timestamps, per second rates between consecutive samples)"
+        timestamps, values = self.series(sw_name, name, index, column, last)
+        elapsed = numpy.diff(timestamps)
+        return timestamps[1:], numpy.diff(values) / numpy.where(elapsed > 0, elapsed, numpy.nan)
+
+    def rate(self, sw_name, name, index, column=BYTES, last=None):
+        "Returns the average rate over the last samples, None if unknown"
+        timestamps, values = self.series(sw_name, name, index, column, last)
+        read = ~numpy.isnan(values)
+        timestamps, values = timestamps[read], values[read]
+        if len(timestamps) < 2 or timestamps[-1] <= timestamps[0]:
+            return None
+        return (values[-1] - values[0]) / (timestamps[-1] - timestamps[0])
+
+    def percentile(self, sw_name, name, index, q, column=BYTES, last=None):
+        "Returns the q-th percentile of the rates over the last samples"
+        _, rates = self.rates(sw_name, name, index, column, last)
+        rates = rates[~numpy.isnan(rates)]
+        if len(rates) == 0:
+            return None
+        return float(numpy.percentile(rates, q))
+
+    def rows(self):
+        "Yields one dict per sample and tracked index, skipping values not read"
+        with self.lock:
+            for sw_name, tracked_arrays in self.tracked.items():
+                for tracked in tracked_arrays.values():
+                    timestamps, values = tracked.buffer.series()
+                    for ts, sample in zip(timestamps.tolist(), values.tolist()):
+                        for index, value in zip(tracked.indexes, sample):
+                            row = {'timestamp': ts, 'switch': sw_name,
+                                   'kind': tracked.kind, 'name': tracked.name,
+                                   'index': index}
+                            if math.isnan(value[0]):
+                                # Not returned by the switch
+                                continue
+                            if tracked.kind == 'counter':
+                                row['packets'] = int(value[PACKETS])
+                                row['bytes'] = int(value[BYTES])
+                            else:
+                                row['value'] = value[0]
+                            yield row
+
+    def to_csv(self, path):
+        fields = ['timestamp', 'switch', 'kind', 'name', 'index', 'packets', 'bytes', 'value']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.rows())
+
+    def to_json(self, path):
+        "Writes the samples as JSON lines"
+        with open(path, 'w') as f:
+            for row in self.rows():
+                f.write(json.dumps(row) + '\n')
+
+    def to_parquet(self, path):
+        # pandas and pyarrow are only needed for this export
+        import pandas
+        pandas.DataFrame(list(self.rows())).to_parquet(path)
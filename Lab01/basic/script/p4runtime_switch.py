@@ -15,7 +15,6 @@
 #
 
 import sys, os, tempfile, socket
-from time import sleep
 
 from mininet.node import Switch
 from mininet.moduledeps import pathCheck
@@ -23,6 +22,7 @@ from mininet.log import info, error, debug
 
 from p4_mininet import P4Switch, SWITCH_START_TIMEOUT
 from netstat import check_listening_on_port
+from p4runtime_lib.readiness import waitForSwitch, SwitchNotReadyException
 
 class P4RuntimeSwitch(P4Switch):
     "BMv2 switch with gRPC support"
@@ -90,12 +90,17 @@ class P4RuntimeSwitch(P4Switch):
 
 
     def check_switch_started(self, pid):
-        for _ in range(SWITCH_START_TIMEOUT * 2):
-            if not os.path.exists(os.path.join("/proc", str(pid))):
-                return False
-            if check_listening_on_port(self.grpc_port):
-                return True
-            sleep(0.5)
+        """While the process is running (pid exists), we probe the P4Runtime
+        server until it answers requests, for at most SWITCH_START_TIMEOUT
+        seconds. The time it took is stored in self.ready_time."""
+        try:
+            self.ready_time = waitForSwitch(
+                '127.0.0.1:%d' % self.grpc_port, SWITCH_START_TIMEOUT,
+                alive=lambda: os.path.exists(os.path.join("/proc", str(pid))))
+        except SwitchNotReadyException as e:
+            error("{}: {}\n".format(self.name, e))
+            return False
+        return True
 
     def start(self, controllers):
         info("Starting P4 switch {}.\n".format(self.name))
@@ -133,5 +138,5 @@ class P4RuntimeSwitch(P4Switch):
         if not self.check_switch_started(pid):
             error("P4 switch {} did not start correctly.\n".format(self.name))
             exit(1)
-        info("P4 switch {} has been started.\n".format(self.name))
+        info("P4 switch {} has been started (ready in {:.3f}s).\n".format(self.name, self.ready_time))
 
@@ -0,0 +1,85 @@
+import os
+import sys
+
+# The tests import p4runtime_lib and the scripts from the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+# Small P4Info with one entity of each kind the library handles
+P4INFO = '''
+tables {
+  preamble { id: 33554433 name: "MyIngress.ipv4_lpm" alias: "ipv4_lpm" }
+  match_fields { id: 1 name: "hdr.ipv4.dstAddr" bitwidth: 32 match_type: LPM }
+  action_refs { id: 16777217 }
+  action_refs { id: 16777218 }
+  size: 1024
+}
+tables {
+  preamble { id: 33554434 name: "MyIngress.acl" alias: "acl" }
+  match_fields { id: 1 name: "hdr.ethernet.dstAddr" bitwidth: 48 match_type: TERNARY }
+  match_fields { id: 2 name: "hdr.tcp.dstPort" bitwidth: 16 match_type: RANGE }
+  action_refs { id: 16777218 }
+  size: 256
+}
+tables {
+  preamble { id: 33554435 name: "MyIngress.smac" alias: "smac" }
+  match_fields { id: 1 name: "hdr.ethernet.srcAddr" bitwidth: 48 match_type: EXACT }
+  action_refs { id: 16777219 }
+  size: 1024
+}
+actions {
+  preamble { id: 16777217 name: "MyIngress.ipv4_forward" alias: "ipv4_forward" }
+  params { id: 1 name: "dstAddr" bitwidth: 48 }
+  params { id: 2 name: "port" bitwidth: 9 }
+}
+actions {
+  preamble { id: 16777218 name: "MyIngress.drop" alias: "drop" }
+}
+actions {
+  preamble { id: 16777219 name: "MyIngress.set_port" alias: "set_port" }
+  params { id: 1 name: "port" bitwidth: 9 }
+}
+counters {
+  preamble { id: 302000001 name: "MyIngress.port_counter" alias: "port_counter" }
+  spec { unit: BOTH }
+  size: 4
+}
+registers {
+  preamble { id: 369000001 name: "MyEgress.qdepth" alias: "qdepth" }
+  type_spec { bitstring { bit { bitwidth: 19 } } }
+  size: 4
+}
+digests {
+  preamble { id: 385000001 name: "mac_learn_digest_t" alias: "mac_learn_digest_t" }
+  type_spec { struct { name: "mac_learn_digest_t" } }
+}
+controller_packet_metadata {
+  preamble { id: 67146229 name: "packet_in" alias: "packet_in" }
+  metadata { id: 1 name: "ingress_port" bitwidth: 9 }
+}
+controller_packet_metadata {
+  preamble { id: 67121543 name: "packet_out" alias: "packet_out" }
+  metadata { id: 1 name: "egress_port" bitwidth: 9 }
+}
+type_info {
+  structs {
+    key: "mac_learn_digest_t"
+    value {
+      members { name: "srcAddr" type_spec { bitstring { bit { bitwidth: 48 } } } }
+      members { name: "port" type_spec { bitstring { bit { bitwidth: 9 } } } }
+    }
+  }
+}
+'''
+
+@pytest.fixture
+def p4info_path(tmp_path):
+    path = tmp_path / 'test.p4info.txt'
+    path.write_text(P4INFO)
+    return str(path)
+
+@pytest.fixture
+def p4info_helper(p4info_path):
+    from p4runtime_lib.helper import P4InfoHelper
+    return P4InfoHelper(p4info_path)
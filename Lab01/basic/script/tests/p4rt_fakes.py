@@ -0,0 +1,147 @@
+"""In-process stand-ins for a P4Runtime switch connection, used by the tests"""
+from queue import Queue
+
+import grpc
+from google.rpc import code_pb2, status_pb2
+from p4.v1 import p4runtime_pb2
+
+
+class FakeRpcError(grpc.RpcError):
+    "grpc.RpcError as raised by a stub, with optional binary status details"
+
+    def __init__(self, code, details='', status=None):
+        self._code = code
+        self._details = details
+        self._metadata = ()
+        if status is not None:
+            self._metadata = (('grpc-status-details-bin', status.SerializeToString()),)
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+    def trailing_metadata(self):
+        return self._metadata
+
+
+def writeError(codes):
+    """Returns the error of a WriteRequest whose updates failed with the
+    given canonical codes (one per update, code_pb2.OK for those applied)"""
+    status = status_pb2.Status(code=code_pb2.UNKNOWN, message='batch')
+    for code in codes:
+        status.details.add().Pack(p4runtime_pb2.Error(canonical_code=code))
+    return FakeRpcError(grpc.StatusCode.UNKNOWN, 'batch', status)
+
+
+def readBy(query, entity):
+    "Whether a Read of the (possibly wildcard) query entity returns entity"
+    kind = query.WhichOneof('entity')
+    if entity.WhichOneof('entity') != kind:
+        return False
+    query, entity = getattr(query, kind), getattr(entity, kind)
+    # table_id, counter_id, register_id...
+    id_field = query.DESCRIPTOR.fields[0].name
+    if getattr(query, id_field) not in (0, getattr(entity, id_field)):
+        return False
+    if 'index' in query.DESCRIPTOR.fields_by_name and query.HasField('index'):
+        return query.index.index == entity.index.index
+    return True
+
+
+def entityKey(entity):
+    "Entities with the same key replace each other when written"
+    if entity.HasField('table_entry'):
+        entry = entity.table_entry
+        return (entry.table_id, entry.priority, entry.is_default_action,
+                tuple(m.SerializeToString(deterministic=True) for m in entry.match))
+    return entity.SerializeToString(deterministic=True)
+
+
+class FakeStub(object):
+    """Records the requests it receives, applies writes to its entities and
+    answers reads from them. fail(request) and fail_read(request) may return
+    an exception to raise instead of answering a write or a read."""
+
+    # Entities per ReadResponse
+    read_chunk = 3
+
+    def __init__(self):
+        self.writes = []
+        self.reads = []
+        self.entities = []
+        self.fail = None
+        self.fail_read = None
+        self.pipelines = []
+
+    def Write(self, request):
+        self.writes.append(request)
+        if self.fail is not None:
+            e = self.fail(request)
+            if e is not None:
+                raise e
+        for update in request.updates:
+            key = entityKey(update.entity)
+            self.entities = [e for e in self.entities if entityKey(e) != key]
+            if update.type != p4runtime_pb2.Update.DELETE:
+                self.entities.append(update.entity)
+        return p4runtime_pb2.WriteResponse()
+
+    def Read(self, request):
+        self.reads.append(request)
+        if self.fail_read is not None:
+            e = self.fail_read(request)
+            if e is not None:
+                raise e
+        found = [e for query in request.entities for e in self.entities if readBy(query, e)]
+        return iter([p4runtime_pb2.ReadResponse(entities=found[i:i + self.read_chunk])
+                     for i in range(0, len(found), self.read_chunk)])
+
+    def SetForwardingPipelineConfig(self, request):
+        self.pipelines.append(request)
+        return p4runtime_pb2.SetForwardingPipelineConfigResponse()
+
+    def GetForwardingPipelineConfig(self, request):
+        # BMv2 fails the request until a pipeline config is pushed
+        if not self.pipelines:
+            raise FakeRpcError(grpc.StatusCode.FAILED_PRECONDITION, 'No forwarding pipeline config set')
+        response = p4runtime_pb2.GetForwardingPipelineConfigResponse()
+        response.config.cookie.CopyFrom(self.pipelines[-1].config.cookie)
+        return response
+
+
+class FakeSwitch(object):
+    def __init__(self, device_id=0, name='s1'):
+        self.name = name
+        self.device_id = device_id
+        self.client_stub = FakeStub()
+
+    def ReadEntities(self, entities):
+        return self.client_stub.Read(p4runtime_pb2.ReadRequest(
+            device_id=self.device_id, entities=entities))
+
+
+def fakeConnection(cls, stub=None, device_id=0):
+    "Instance of a SwitchConnection class talking to stub, without any channel"
+    sw = cls.__new__(cls)
+    sw.name = 'fake'
+    sw.device_id = device_id
+    sw.p4info = None
+    sw.client_stub = stub if stub is not None else FakeStub()
+    # StreamChannel requests are only queued
+    sw.requests_stream = Queue()
+    return sw
+
+
+class AsyncFakeStub(FakeStub):
+    "FakeStub for an AsyncSwitchConnection, whose RPCs are awaited"
+
+    async def Write(self, request):
+        return FakeStub.Write(self, request)
+
+    async def SetForwardingPipelineConfig(self, request):
+        return FakeStub.SetForwardingPipelineConfig(self, request)
+
+    async def GetForwardingPipelineConfig(self, request):
+        return FakeStub.GetForwardingPipelineConfig(self, request)
@@ -0,0 +1,123 @@
+import io
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from capture import (BPF_ACCEPT_SIZE, IPPROTO_TCP, IPPROTO_UDP, FlowCounters,
+                     PacketCapture, bpfFilter, decodeIPv4)
+
+pytest.importorskip('scapy.all')
+from scapy.all import ARP, IP, TCP, UDP, Dot1Q, Ether, IPOption_RR
+
+
+def runFilter(program, frame):
+    "Runs a classic BPF program on frame, returns the number of bytes kept"
+    a = x = pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        if code == 0x28:
+            a, = struct.unpack_from('!H', frame, k)
+        elif code == 0x30:
+            a = frame[k]
+        elif code == 0x48:
+            a, = struct.unpack_from('!H', frame, x + k)
+        elif code == 0xb1:
+            x = (frame[k] & 0x0f) * 4
+        elif code in (0x15, 0x45):
+            taken = a == k if code == 0x15 else a & k
+            pc += jt if taken else jf
+        elif code == 0x06:
+            return k
+        else:
+            raise AssertionError("unexpected BPF opcode 0x%x" % code)
+
+def accepts(program, packet):
+    return runFilter(program, bytes(packet)) == BPF_ACCEPT_SIZE
+
+UDP_4321 = Ether() / IP(src='10.0.1.1', dst='10.0.2.2') / UDP(sport=1234, dport=4321) / b'x'
+TCP_80 = Ether() / IP(src='10.0.1.1', dst='10.0.2.2', options=IPOption_RR()) / TCP(sport=80, dport=5555)
+
+def test_bpf_protocol_and_ports():
+    udp = bpfFilter(IPPROTO_UDP, dport=4321)
+    assert accepts(udp, UDP_4321)
+    assert not accepts(udp, Ether() / IP() / UDP(dport=4322))
+    assert not accepts(udp, Ether() / IP() / TCP(dport=4321))
+    assert not accepts(udp, Ether() / ARP())
+    # Either port, TCP or UDP, after IP options
+    any_80 = bpfFilter(port=80)
+    assert accepts(any_80, TCP_80)
+    assert accepts(any_80, Ether() / IP() / UDP(sport=5555, dport=80))
+    assert not accepts(any_80, UDP_4321)
+    # Fragments other than the first have no ports
+    assert not accepts(udp, Ether() / IP(frag=10) / UDP(dport=4321))
+
+def test_bpf_ethertypes():
+    assert accepts(bpfFilter(), Ether() / IP())
+    assert accepts(bpfFilter(ethertype=0x0806), Ether() / ARP())
+    assert not accepts(bpfFilter(ethertype=0x0806), Ether() / IP())
+    with pytest.raises(ValueError):
+        bpfFilter(IPPROTO_UDP, ethertype=0x0806)
+
+def test_decode_ipv4():
+    frame = bytes(UDP_4321)
+    src, dst, proto, sport, dport, tos, total_len, l4 = decodeIPv4(frame, 0, len(frame))
+    assert (socket.inet_ntoa(src), socket.inet_ntoa(dst)) == ('10.0.1.1', '10.0.2.2')
+    assert (proto, sport, dport, total_len, l4) == (IPPROTO_UDP, 1234, 4321, 29, 34)
+    # At an offset, behind a VLAN tag and IP options
+    frame = b'pad' + bytes(Ether() / Dot1Q(vlan=2) / IP(options=IPOption_RR(), tos=3) / TCP(dport=80))
+    headers = decodeIPv4(frame, 3, len(frame) - 3)
+    assert headers[2:6] == (IPPROTO_TCP, 20, 80, 3)
+    # Ethernet and VLAN, then an IP header with 4 bytes of options
+    assert headers[7] == 3 + 18 + 24
+    assert decodeIPv4(bytes(Ether() / ARP()), 0, 42) is None
+    # Truncated before the ports
+    frame = bytes(UDP_4321)[:36]
+    assert decodeIPv4(frame, 0, 36)[3:5] == (0, 0)
+
+def test_flow_counters():
+    out = io.StringIO()
+    counters = FlowCounters(out=out)
+    # The last packet of the UDP flow is marked ECN CE
+    ce = Ether() / IP(src='10.0.1.1', dst='10.0.2.2', tos=3) / UDP(sport=1234, dport=4321) / b'x'
+    for packet in [UDP_4321, UDP_4321, ce, TCP_80, Ether() / ARP()]:
+        frame = bytes(packet)
+        counters.update(frame, 0, len(frame), len(frame))
+    assert counters.other == 1
+    flow = counters.flows[(socket.inet_aton('10.0.1.1'), socket.inet_aton('10.0.2.2'),
+                           IPPROTO_UDP, 1234, 4321)]
+    assert flow[:4] == [3, 3 * len(UDP_4321), 1, 3]
+    counters.report()
+    report = out.getvalue()
+    assert report.startswith('2 active flows (2 total)')
+    assert '10.0.1.1:1234 -> 10.0.2.2:4321 udp: 3 packets' in report
+    counters.report()
+    assert out.getvalue().endswith('0 active flows (2 total)\n')
+
+@pytest.mark.parametrize('use_ring', [True, False])
+def test_capture_on_loopback(use_ring):
+    port = 40000 + use_ring
+    try:
+        capture = PacketCapture('lo', bpf=bpfFilter(IPPROTO_UDP, dport=port),
+                                ignore_outgoing=False, use_ring=use_ring)
+    except (PermissionError, OSError) as e:
+        pytest.skip("no AF_PACKET socket: %s" % e)
+    seen = []
+
+    def send():
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for i in range(5):
+                s.sendto(b'x' * i, ('127.0.0.1', port))
+                s.sendto(b'other', ('127.0.0.1', port + 10))
+                time.sleep(0.01)
+
+    sender = threading.Thread(target=send)
+    with capture:
+        sender.start()
+        n = capture.run(lambda buf, offset, caplen, wire_len: seen.append(
+            decodeIPv4(buf, offset, caplen)[4]), duration=2, count=5)
+    sender.join()
+    assert n == 5 and seen == [port] * 5
@@ -0,0 +1,84 @@
+import io
+import json
+import os
+
+import pytest
+
+pytest.importorskip('p4.tmp')
+
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib.compiled_conf import (CompiledConfFormatException, compileRuntimeConf,
+                                         p4infoDigest, readCompiledConf, writeCompiledConf)
+from p4runtime_lib.simple_controller import buildEntryUpdate
+
+RUNTIME_CONF = {
+    'target': 'bmv2',
+    'p4info': 'build/test.p4info.txt',
+    'bmv2_json': 'build/test.json',
+    'table_entries': [
+        {'table': 'MyIngress.ipv4_lpm', 'default_action': True,
+         'action_name': 'MyIngress.drop', 'action_params': {}},
+    ] + [
+        {'table': 'MyIngress.ipv4_lpm', 'match': {'hdr.ipv4.dstAddr': ['10.0.%d.0' % i, 24]},
+         'action_name': 'MyIngress.ipv4_forward',
+         'action_params': {'dstAddr': '08:00:00:00:01:11', 'port': i}}
+        for i in range(5)
+    ],
+    'multicast_group_entries': [
+        {'multicast_group_id': 1, 'replicas': [{'egress_port': 1, 'instance': 1}]},
+    ],
+}
+
+
+def updates(n):
+    for i in range(n):
+        update = p4runtime_pb2.Update(type=p4runtime_pb2.Update.INSERT)
+        update.entity.table_entry.priority = i + 1
+        yield update
+
+def test_round_trip(p4info_helper):
+    f = io.BytesIO()
+    sw_conf = {'target': 'bmv2', 'p4info': 'x.p4info.txt'}
+    assert writeCompiledConf(f, sw_conf, p4info_helper.p4info, updates(5), max_batch_size=2) == 5
+    f.seek(0)
+    header, digest, requests = readCompiledConf(f)
+    assert header == sw_conf
+    assert digest == p4infoDigest(p4info_helper.p4info)
+    requests = list(requests)
+    assert [len(r.updates) for r in requests] == [2, 2, 1]
+    assert [u for r in requests for u in r.updates] == list(updates(5))
+
+@pytest.mark.parametrize('cut', [4, 20, -1])
+def test_truncated_files(p4info_helper, cut):
+    f = io.BytesIO()
+    writeCompiledConf(f, {}, p4info_helper.p4info, updates(3))
+    with pytest.raises(CompiledConfFormatException):
+        header, digest, requests = readCompiledConf(io.BytesIO(f.getvalue()[:cut]))
+        list(requests)
+
+def test_compile_runtime_conf(p4info_helper, p4info_path, tmp_path):
+    # The P4Info is found relative to workdir, as for run_exercise
+    workdir = str(tmp_path)
+    os.mkdir(os.path.join(workdir, 'build'))
+    os.replace(p4info_path, os.path.join(workdir, RUNTIME_CONF['p4info']))
+    conf_path = str(tmp_path / 's1-runtime.json')
+    with open(conf_path, 'w') as f:
+        json.dump(RUNTIME_CONF, f)
+    out_path = str(tmp_path / 's1-runtime.p4rtcfg')
+    assert compileRuntimeConf(conf_path, out_path, workdir=workdir) == 7
+    with open(out_path, 'rb') as f:
+        header, digest, requests = readCompiledConf(f)
+        compiled = [u for r in requests for u in r.updates]
+    assert header == {k: RUNTIME_CONF[k] for k in ('target', 'p4info', 'bmv2_json')}
+    assert digest == p4infoDigest(p4info_helper.p4info)
+    assert compiled == [buildEntryUpdate(list_name, entry, p4info_helper)
+                        for list_name in ('table_entries', 'multicast_group_entries')
+                        for entry in RUNTIME_CONF[list_name]]
+    assert compiled[0].type == p4runtime_pb2.Update.MODIFY
+
+def test_compile_needs_a_p4info(tmp_path):
+    conf_path = str(tmp_path / 's1-runtime.json')
+    with open(conf_path, 'w') as f:
+        json.dump({'table_entries': []}, f)
+    with pytest.raises(CompiledConfFormatException):
+        compileRuntimeConf(conf_path, str(tmp_path / 'out.p4rtcfg'))
@@ -0,0 +1,52 @@
+import pytest
+
+from p4runtime_lib.convert import (compileEncoder, encode, encodeIPv4Many,
+                                   encodeMacMany, encodeMany, encodeNumMany)
+
+
+@pytest.mark.parametrize('value, bitwidth', [
+    (0, 9), (511, 9), (1337, 40), ('10.0.1.1', 32), ('08:00:00:00:01:11', 48),
+    ([7], 16), ((7,), 16),
+])
+def test_compiled_encoder_matches_encode(value, bitwidth):
+    assert compileEncoder(bitwidth)(value) == encode(value, bitwidth)
+
+def test_compiled_encoder_only_tries_formats_of_the_field_length():
+    # A string that is not an address of the field length is taken as
+    # already encoded, as by encode
+    assert compileEncoder(32)('abcd') == encode('abcd', 32) == 'abcd'
+    with pytest.raises(AssertionError):
+        compileEncoder(48)('10.0.1.1')
+
+def test_compiled_encoder_accepts_encoded_bytes():
+    assert compileEncoder(16)(b'\x01\x02') == b'\x01\x02'
+
+def test_compiled_encoder_range():
+    with pytest.raises(Exception, match='does not fit in 9 bits'):
+        compileEncoder(9)(512)
+
+@pytest.mark.parametrize('values, bitwidth', [
+    ([0, 1, 511], 9), (['10.0.1.1', '10.0.2.2'], 32),
+    (['08:00:00:00:01:11', 'ff:ff:ff:ff:ff:ff'], 48), ([], 16),
+])
+def test_encode_many_matches_encode(values, bitwidth):
+    assert encodeMany(values, bitwidth) == [encode(v, bitwidth) for v in values]
+
+def test_encode_many_range():
+    with pytest.raises(Exception, match='do not fit in 9 bits'):
+        encodeNumMany([1, 512], 9)
+
+def test_encode_many_arrays():
+    numpy = pytest.importorskip('numpy')
+    numbers = numpy.array([0, 1, 2 ** 20, 2 ** 32 - 1], dtype=numpy.uint32)
+    assert encodeMany(numbers, 32) == [encode(int(n), 32) for n in numbers]
+    assert encodeIPv4Many(numpy.array([0x0a000101], dtype=numpy.uint32)) == [b'\x0a\x00\x01\x01']
+    assert encodeMacMany(numpy.array([0x080000000111], dtype=numpy.uint64)) == \
+        [b'\x08\x00\x00\x00\x01\x11']
+    assert encodeMany(numpy.array(['10.0.1.1']), 32) == [b'\x0a\x00\x01\x01']
+    with pytest.raises(Exception):
+        encodeNumMany(numpy.array([-1, 1]), 9)
+
+def test_encode_mac_many_rejects_invalid_addresses():
+    with pytest.raises(Exception):
+        encodeMacMany(['08:00:00:00:01'])
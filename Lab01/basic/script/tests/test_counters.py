@@ -0,0 +1,70 @@
+import numpy
+import pytest
+from p4.v1 import p4runtime_pb2
+
+from p4runtime_lib.counters import BYTES, PACKETS, CounterSnapshot
+
+from p4rt_fakes import FakeSwitch
+
+COUNTER_ID = 302000001
+NAME = 'MyIngress.port_counter'
+
+
+def counterEntity(index, packets, byte_count, counter_id=COUNTER_ID):
+    entity = p4runtime_pb2.Entity()
+    counter = entity.counter_entry
+    counter.counter_id = counter_id
+    counter.index.index = index
+    counter.data.packet_count = packets
+    counter.data.byte_count = byte_count
+    return entity
+
+@pytest.fixture
+def sw():
+    sw = FakeSwitch()
+    sw.client_stub.entities = [counterEntity(i, i * 10, i * 1000) for i in range(4)]
+    return sw
+
+def test_all_counters_in_one_read(sw, p4info_helper):
+    snapshot = CounterSnapshot.read(sw, p4info_helper)
+    assert len(sw.client_stub.reads) == 1
+    query, = sw.client_stub.reads[0].entities
+    assert query.counter_entry.counter_id == 0
+    assert snapshot[NAME].shape == (4, 2)
+    assert snapshot[NAME][:, PACKETS].tolist() == [0, 10, 20, 30]
+    assert snapshot.bytes(NAME).tolist() == [0, 1000, 2000, 3000]
+    assert snapshot.packets(NAME, 2) == 20
+
+def test_counters_by_alias(sw, p4info_helper):
+    snapshot = CounterSnapshot.read(sw, p4info_helper, ['port_counter'])
+    query, = sw.client_stub.reads[0].entities
+    assert query.counter_entry.counter_id == COUNTER_ID
+    assert snapshot['port_counter'] is snapshot[NAME]
+    assert snapshot.bytes('port_counter', 3) == 3000
+
+def test_delta_and_rates(sw, p4info_helper):
+    first = CounterSnapshot.read(sw, p4info_helper)
+    sw.client_stub.entities = [counterEntity(i, i * 20, i * 3000) for i in range(4)]
+    second = CounterSnapshot.read(sw, p4info_helper)
+    second.timestamp = first.timestamp + 2
+    assert second.delta(first)[NAME][:, BYTES].tolist() == [0, 2000, 4000, 6000]
+    rates = second.rates(first)[NAME]
+    assert rates.dtype == numpy.float64
+    assert rates[3].tolist() == [15.0, 3000.0]
+    with pytest.raises(ValueError):
+        first.rates(second)
+
+def test_counters_not_returned_are_missing(p4info_helper):
+    sw = FakeSwitch()
+    snapshot = CounterSnapshot.read(sw, p4info_helper, ['port_counter'])
+    assert snapshot.missing == {NAME, 'port_counter'}
+    assert snapshot[NAME].sum() == 0
+
+def test_snapshot_from_entities(p4info_helper):
+    infos, entities = CounterSnapshot.readRequest(p4info_helper, [NAME])
+    assert [e.counter_entry.counter_id for e in entities] == [COUNTER_ID]
+    # Entities of other counters are ignored
+    snapshot = CounterSnapshot.fromEntities(
+        1.0, infos, [counterEntity(1, 5, 500), counterEntity(0, 1, 1, counter_id=7)])
+    assert snapshot.timestamp == 1.0 and not snapshot.missing
+    assert snapshot.packets(NAME).tolist() == [0, 5, 0, 0]
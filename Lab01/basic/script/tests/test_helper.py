@@ -0,0 +1,147 @@
+import os
+
+import pytest
+from p4.config.v1 import p4info_pb2
+from p4.v1 import p4data_pb2
+
+from p4runtime_lib import helper
+from p4runtime_lib.helper import P4InfoHelper, loadP4Info
+
+
+def test_lookup_by_name_alias_and_id(p4info_helper):
+    table = p4info_helper.get('tables', name='MyIngress.ipv4_lpm')
+    assert p4info_helper.get('tables', name='ipv4_lpm') is table
+    assert p4info_helper.get('tables', id=33554433) is table
+    assert p4info_helper.get_tables_id('ipv4_lpm') == 33554433
+    assert p4info_helper.get_actions_name(16777218) == 'MyIngress.drop'
+    assert p4info_helper.get_alias('counters', 302000001) == 'port_counter'
+
+def test_unknown_entities(p4info_helper):
+    with pytest.raises(AttributeError):
+        p4info_helper.get('tables', name='nope')
+    with pytest.raises(AttributeError):
+        p4info_helper.get('tables', id=1)
+    with pytest.raises(AttributeError):
+        p4info_helper.get('not_an_entity_type', name='ipv4_lpm')
+    with pytest.raises(AssertionError):
+        p4info_helper.get('tables', name='ipv4_lpm', id=33554433)
+
+def test_full_names_take_precedence_over_aliases(p4info_helper):
+    p4info = p4info_pb2.P4Info()
+    p4info.CopyFrom(p4info_helper.p4info)
+    # An alias equal to the full name of another action
+    drop = p4info.actions.add()
+    drop.preamble.id = 16777299
+    drop.preamble.name = 'MyEgress.drop'
+    drop.preamble.alias = 'MyIngress.drop'
+    p4info_helper.p4info = p4info
+    assert p4info_helper.get_actions_id('MyIngress.drop') == 16777218
+    assert p4info_helper.get_actions_id('MyEgress.drop') == 16777299
+
+def test_match_fields_and_params(p4info_helper):
+    assert p4info_helper.get_match_field_id('acl', 'hdr.tcp.dstPort') == 2
+    assert p4info_helper.get_match_field_name('MyIngress.acl', 1) == 'hdr.ethernet.dstAddr'
+    assert p4info_helper.get_action_param_id('ipv4_forward', 'port') == 2
+    assert p4info_helper.get_action_param_name('MyIngress.ipv4_forward', 1) == 'dstAddr'
+    with pytest.raises(AttributeError):
+        p4info_helper.get_match_field('ipv4_lpm', 'hdr.ipv4.srcAddr')
+    with pytest.raises(AttributeError):
+        p4info_helper.get_action_param('drop', 'port')
+
+def test_reassigning_p4info_rebuilds_the_index(p4info_helper, p4info_path):
+    p4info = p4info_pb2.P4Info()
+    p4info.CopyFrom(P4InfoHelper(p4info_path).p4info)
+    p4info.tables[0].preamble.id = 33554499
+    p4info_helper.p4info = p4info
+    assert p4info_helper.get_tables_id('ipv4_lpm') == 33554499
+    with pytest.raises(AttributeError):
+        p4info_helper.get('tables', id=33554433)
+
+def test_build_table_entry(p4info_helper):
+    entry = p4info_helper.buildTableEntry(
+        'MyIngress.ipv4_lpm',
+        match_fields={'hdr.ipv4.dstAddr': ('10.0.1.1', 32)},
+        action_name='MyIngress.ipv4_forward',
+        action_params={'dstAddr': '08:00:00:00:01:11', 'port': 1})
+    assert entry.table_id == 33554433
+    assert entry.match[0].lpm.value == b'\x0a\x00\x01\x01'
+    assert entry.match[0].lpm.prefix_len == 32
+    params = entry.action.action.params
+    assert [p.param_id for p in params] == [1, 2]
+    assert params[0].value == b'\x08\x00\x00\x00\x01\x11'
+
+def test_compiled_table_matches_build_table_entry(p4info_helper):
+    encoder = p4info_helper.compile_table('ipv4_lpm', action='ipv4_forward')
+    assert encoder.columns == ['hdr.ipv4.dstAddr', 'dstAddr', 'port']
+    rows = [(('10.0.%d.0' % i, 24), '08:00:00:00:01:%02x' % i, i) for i in range(3)]
+    for row, entry in zip(rows, encoder.encode_many(rows)):
+        assert entry == p4info_helper.buildTableEntry(
+            'ipv4_lpm', match_fields={'hdr.ipv4.dstAddr': row[0]},
+            action_name='ipv4_forward',
+            action_params={'dstAddr': row[1], 'port': row[2]})
+
+def test_compiled_table_rows_as_dicts(p4info_helper):
+    encoder = p4info_helper.compile_table('acl', action='drop')
+    entry = encoder({'hdr.ethernet.dstAddr': ('08:00:00:00:01:11', 'ff:ff:ff:ff:ff:ff'),
+                     'hdr.tcp.dstPort': (80, 443)}, priority=10)
+    assert entry == p4info_helper.buildTableEntry(
+        'acl', match_fields={'hdr.ethernet.dstAddr': ('08:00:00:00:01:11', 'ff:ff:ff:ff:ff:ff'),
+                             'hdr.tcp.dstPort': (80, 443)},
+        action_name='drop', priority=10)
+    with pytest.raises(ValueError):
+        encoder.encode([('08:00:00:00:01:11', 'ff:ff:ff:ff:ff:ff')])
+
+def test_compiled_default_action(p4info_helper):
+    encoder = p4info_helper.compile_table('ipv4_lpm', action='drop', default_action=True)
+    entry = encoder([])
+    assert entry.is_default_action and not entry.match
+    assert entry.action.action.action_id == 16777218
+
+def test_p4info_is_cached_next_to_the_text_file(p4info_path, monkeypatch):
+    p4info = loadP4Info(p4info_path)
+    assert loadP4Info(p4info_path) is p4info
+    assert os.path.exists(p4info_path + '.bin')
+    # A new process finds the binary cache instead of parsing the text
+    monkeypatch.setattr(helper, '_p4info_memo', {})
+    parsed = []
+    monkeypatch.setattr(helper.google.protobuf.text_format, 'Merge',
+                        lambda *args: parsed.append(args))
+    assert loadP4Info(p4info_path) == p4info
+    assert parsed == []
+
+def test_stale_or_broken_caches_are_ignored(p4info_path, monkeypatch):
+    loadP4Info(p4info_path)
+    with open(p4info_path, 'a') as f:
+        f.write('tables { preamble { id: 33554436 name: "MyEgress.t" } }\n')
+    monkeypatch.setattr(helper, '_p4info_memo', {})
+    assert len(loadP4Info(p4info_path).tables) == 4
+    with open(p4info_path + '.bin', 'wb') as f:
+        f.write(b'garbage')
+    monkeypatch.setattr(helper, '_p4info_memo', {})
+    assert len(loadP4Info(p4info_path).tables) == 4
+
+def test_cache_can_be_disabled(p4info_path):
+    P4InfoHelper(p4info_path, cache=False)
+    assert not os.path.exists(p4info_path + '.bin')
+
+def structData(*members):
+    return p4data_pb2.P4Data(struct=p4data_pb2.P4StructLike(
+        members=[p4data_pb2.P4Data(bitstring=m) for m in members]))
+
+def test_parse_digest(p4info_helper):
+    digest_id = p4info_helper.get_digests_id('mac_learn_digest_t')
+    assert p4info_helper.get_digest_member_names(digest_id) == ['srcAddr', 'port']
+    assert p4info_helper.parseDigest(digest_id, structData(b'\x08\x00\x00\x00\x01\x11', b'\x00\x01')) == \
+        {'srcAddr': b'\x08\x00\x00\x00\x01\x11', 'port': b'\x00\x01'}
+    assert p4info_helper.parseDigest(digest_id, p4data_pb2.P4Data(bitstring=b'\x01'), names=['port']) == \
+        {'port': b'\x01'}
+    with pytest.raises(Exception, match='Unsupported digest data'):
+        p4info_helper.parseDigest(digest_id, structData(b'\x01'))
+    with pytest.raises(Exception, match='Unsupported type'):
+        p4info_helper.parseDigest(digest_id, p4data_pb2.P4Data(struct=p4data_pb2.P4StructLike(
+            members=[structData(b'\x01'), p4data_pb2.P4Data(bitstring=b'\x01')])))
+
+def test_digest_entry(p4info_helper):
+    entry = p4info_helper.buildDigestEntry('mac_learn_digest_t', max_list_size=100)
+    assert entry.digest_id == 385000001
+    assert entry.config.max_list_size == 100
@@ -0,0 +1,15 @@
+import socket
+
+from netstat import check_listening_on_port, listening_ports
+
+
+def test_listening_ports():
+    with socket.socket() as listening, socket.socket() as bound:
+        listening.bind(('127.0.0.1', 0))
+        listening.listen()
+        bound.bind(('127.0.0.1', 0))
+        ports = [listening.getsockname()[1], bound.getsockname()[1]]
+        assert listening_ports(ports) == {ports[0]}
+        assert ports[0] in listening_ports()
+        assert check_listening_on_port(ports[0])
+        assert not check_listening_on_port(ports[1])
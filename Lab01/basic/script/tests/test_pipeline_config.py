@@ -0,0 +1,76 @@
+import asyncio
+
+import grpc
+import pytest
+
+pytest.importorskip('p4.tmp')
+
+from p4runtime_lib import bmv2
+from p4runtime_lib.bmv2 import AsyncBmv2SwitchConnection, Bmv2SwitchConnection
+
+from p4rt_fakes import AsyncFakeStub, FakeRpcError, fakeConnection
+
+
+@pytest.fixture
+def bmv2_json(tmp_path):
+    path = tmp_path / 'prog.json'
+    path.write_text('{"program": "basic.p4"}')
+    return str(path)
+
+def test_device_config_is_cached_by_content(bmv2_json, tmp_path, monkeypatch):
+    monkeypatch.setattr(bmv2, '_device_config_cache', {})
+    config, config_bytes = bmv2.getDeviceConfig(bmv2_json)
+    assert config.reassign and config.device_data == b'{"program": "basic.p4"}'
+    assert config_bytes == config.SerializeToString()
+    copy = tmp_path / 'copy.json'
+    copy.write_bytes(open(bmv2_json, 'rb').read())
+    assert bmv2.getDeviceConfig(str(copy)) is bmv2.getDeviceConfig(bmv2_json)
+    # A rewritten file is read again, whatever its size and mtime
+    with open(bmv2_json, 'w') as f:
+        f.write('{"program": "basic.p5"}')
+    assert bmv2.getDeviceConfig(bmv2_json)[0].device_data == b'{"program": "basic.p5"}'
+
+def test_skip_if_installed(p4info_helper, bmv2_json):
+    sw = fakeConnection(Bmv2SwitchConnection)
+    # Nothing is installed yet: the switch fails GetForwardingPipelineConfig
+    assert sw.GetPipelineCookie() is None
+    assert sw.SetForwardingPipelineConfig(p4info_helper.p4info, bmv2_json_file_path=bmv2_json,
+                                          skip_if_installed=True)
+    assert sw.GetPipelineCookie() == sw.client_stub.pipelines[0].config.cookie.cookie
+    assert not sw.SetForwardingPipelineConfig(p4info_helper.p4info, bmv2_json_file_path=bmv2_json,
+                                              skip_if_installed=True)
+    assert sw.SetForwardingPipelineConfig(p4info_helper.p4info, bmv2_json_file_path=bmv2_json)
+    assert len(sw.client_stub.pipelines) == 2
+
+def test_cookie_depends_on_the_config(p4info_helper, bmv2_json, tmp_path):
+    sw = fakeConnection(Bmv2SwitchConnection)
+    sw.SetForwardingPipelineConfig(p4info_helper.p4info, bmv2_json_file_path=bmv2_json)
+    other = tmp_path / 'other.json'
+    other.write_text('{"program": "other.p4"}')
+    assert sw.SetForwardingPipelineConfig(p4info_helper.p4info, bmv2_json_file_path=str(other),
+                                          skip_if_installed=True)
+    cookies = [r.config.cookie.cookie for r in sw.client_stub.pipelines]
+    assert cookies[0] != cookies[1]
+
+def test_cookie_errors_are_raised():
+    sw = fakeConnection(Bmv2SwitchConnection)
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+    def fail(request):
+        raise unavailable
+    sw.client_stub.GetForwardingPipelineConfig = fail
+    with pytest.raises(grpc.RpcError) as info:
+        sw.GetPipelineCookie()
+    assert info.value is unavailable
+
+def test_async_skip_if_installed(p4info_helper, bmv2_json):
+    sw = fakeConnection(AsyncBmv2SwitchConnection, AsyncFakeStub())
+
+    async def push():
+        assert await sw.GetPipelineCookie() is None
+        pushed = []
+        for i in range(2):
+            pushed.append(await sw.SetForwardingPipelineConfig(
+                p4info_helper.p4info, bmv2_json_file_path=bmv2_json, skip_if_installed=True))
+        return pushed
+
+    assert asyncio.run(push()) == [True, False]
@@ -0,0 +1,97 @@
+import grpc
+import pytest
+from google.rpc import code_pb2
+
+pytest.importorskip('p4.tmp')
+
+from p4.v1 import p4data_pb2, p4runtime_pb2
+from p4runtime_lib.reactive import DigestController
+from p4runtime_lib.switch import IterableQueue, StreamMessageDispatcher, SwitchConnection
+
+from p4rt_fakes import FakeRpcError, fakeConnection, writeError
+
+MAC = b'\x08\x00\x00\x00\x01\x11'
+
+
+def digestList(list_id, *macs_ports):
+    digest_list = p4runtime_pb2.DigestList(digest_id=385000001, list_id=list_id)
+    for mac, port in macs_ports:
+        digest_list.data.add().struct.members.extend([
+            p4data_pb2.P4Data(bitstring=mac), p4data_pb2.P4Data(bitstring=port)])
+    return digest_list
+
+@pytest.fixture
+def controller(p4info_helper):
+    sw = fakeConnection(SwitchConnection)
+    encoder = p4info_helper.compile_table('smac', action='set_port')
+    controller = DigestController(sw, p4info_helper, max_batch_size=2, flush_delay=0)
+    controller.subscribe('mac_learn_digest_t',
+                         lambda digest: [encoder((digest['srcAddr'], digest['port']))])
+    sw.client_stub.writes.clear()
+    return controller
+
+def writtenUpdates(sw):
+    updates = [(u.type, u.entity.table_entry.action.action.params[0].value)
+               for r in sw.client_stub.writes for u in r.updates]
+    sw.client_stub.writes.clear()
+    return updates
+
+def test_subscribe(p4info_helper):
+    sw = fakeConnection(SwitchConnection)
+    DigestController(sw, p4info_helper).subscribe('mac_learn_digest_t', list, max_list_size=10)
+    entity = sw.client_stub.writes[0].updates[0].entity
+    assert entity.digest_entry.digest_id == 385000001
+    assert entity.digest_entry.config.max_list_size == 10
+
+def test_learned_entries_are_written_once(controller):
+    sw = controller.sw
+    controller.handleDigestList(digestList(1, (MAC, b'\x00\x01'), (MAC, b'\x00\x01')))
+    ack = sw.requests_stream.get_nowait()
+    assert (ack.digest_ack.digest_id, ack.digest_ack.list_id) == (385000001, 1)
+    controller.flush()
+    assert writtenUpdates(sw) == [(p4runtime_pb2.Update.INSERT, b'\x00\x01')]
+    # Learned again with the same port: nothing to write
+    controller.handleDigestList(digestList(2, (MAC, b'\x00\x01')))
+    controller.flush()
+    assert writtenUpdates(sw) == []
+    # The host moved
+    controller.handleDigestList(digestList(3, (MAC, b'\x00\x02')))
+    controller.flush()
+    assert writtenUpdates(sw) == [(p4runtime_pb2.Update.MODIFY, b'\x00\x02')]
+    assert controller.stats['entries'] == 2 and controller.stats['digests'] == 4
+
+def test_existing_entries_are_modified(controller):
+    sw = controller.sw
+    sw.client_stub.fail = lambda request: writeError([code_pb2.ALREADY_EXISTS])
+    controller.handleDigestList(digestList(1, (MAC, b'\x00\x01')))
+    controller.flush()
+    sw.client_stub.fail = None
+    assert len(controller.pending) == 1
+    controller.flush()
+    assert writtenUpdates(sw) == [(p4runtime_pb2.Update.INSERT, b'\x00\x01'),
+                                  (p4runtime_pb2.Update.MODIFY, b'\x00\x01')]
+    assert controller.stats['errors'] == 0
+
+def test_unsent_entries_are_written_again(controller):
+    sw = controller.sw
+    sw.client_stub.fail = lambda request: FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+    macs = [MAC[:5] + bytes([i]) for i in range(3)]
+    controller.handleDigestList(digestList(1, *[(mac, b'\x00\x01') for mac in macs]))
+    controller.flush()
+    assert controller.stats['unsent'] == 3 and controller.stats['entries'] == 0
+    assert len(controller.pending) == 3
+    sw.client_stub.fail = None
+    sw.client_stub.writes.clear()
+    controller.flush()
+    assert len(writtenUpdates(sw)) == 3
+    assert controller.stats['entries'] == 3 and not controller.pending
+
+def test_poll(controller):
+    sw = controller.sw
+    stream = IterableQueue()
+    sw.stream = StreamMessageDispatcher(stream)
+    stream.put(p4runtime_pb2.StreamMessageResponse(digest=digestList(1, (MAC, b'\x00\x01'))))
+    assert controller.poll(timeout=0.1)
+    assert writtenUpdates(sw) == [(p4runtime_pb2.Update.INSERT, b'\x00\x01')]
+    stream.close()
+    assert not controller.poll(timeout=1)
@@ -0,0 +1,34 @@
+import socket
+from concurrent import futures
+
+import grpc
+import pytest
+from p4.v1 import p4runtime_pb2_grpc
+
+from p4runtime_lib.readiness import SwitchNotReadyException, waitForSwitch
+
+
+def freePort():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_ready_once_the_server_answers():
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=1))
+    # Capabilities answers UNIMPLEMENTED, which still comes from a server
+    p4runtime_pb2_grpc.add_P4RuntimeServicer_to_server(
+        p4runtime_pb2_grpc.P4RuntimeServicer(), server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    try:
+        assert waitForSwitch('127.0.0.1:%d' % port, timeout=5) < 5
+    finally:
+        server.stop(None)
+
+def test_not_ready_after_timeout():
+    with pytest.raises(SwitchNotReadyException, match='not ready'):
+        waitForSwitch('127.0.0.1:%d' % freePort(), timeout=0.2)
+
+def test_dead_switch_is_not_waited_for():
+    with pytest.raises(SwitchNotReadyException, match='exited'):
+        waitForSwitch('127.0.0.1:%d' % freePort(), timeout=60, alive=lambda: False)
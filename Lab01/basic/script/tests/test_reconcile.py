@@ -0,0 +1,82 @@
+import grpc
+import pytest
+from google.rpc import code_pb2
+
+pytest.importorskip('p4.tmp')
+
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib.reconcile import TableReconciler, tableEntryKey, tableEntryValue
+from p4runtime_lib.switch import SwitchConnection, WriteBatchException
+
+from p4rt_fakes import FakeRpcError, fakeConnection, writeError
+
+
+def lpmEntry(p4info_helper, i, port):
+    return p4info_helper.buildTableEntry(
+        'ipv4_lpm', match_fields={'hdr.ipv4.dstAddr': ('10.0.%d.0' % i, 24)},
+        action_name='ipv4_forward',
+        action_params={'dstAddr': '08:00:00:00:01:11', 'port': port})
+
+@pytest.fixture
+def sw():
+    return fakeConnection(SwitchConnection)
+
+def updateTypes(sw):
+    types = [[u.type for u in r.updates] for r in sw.client_stub.writes]
+    sw.client_stub.writes.clear()
+    return types
+
+def test_only_differences_are_written(sw, p4info_helper):
+    reconciler = TableReconciler(sw, p4info_helper)
+    desired = [lpmEntry(p4info_helper, i, 1) for i in range(3)]
+    assert reconciler.apply(desired) == {'insert': 3, 'modify': 0, 'delete': 0, 'unchanged': 0}
+    assert updateTypes(sw) == [[p4runtime_pb2.Update.INSERT] * 3]
+    assert reconciler.apply(desired) == {'insert': 0, 'modify': 0, 'delete': 0, 'unchanged': 3}
+    assert updateTypes(sw) == []
+    desired = [lpmEntry(p4info_helper, 0, 1), lpmEntry(p4info_helper, 1, 2),
+               lpmEntry(p4info_helper, 3, 1)]
+    assert reconciler.apply(desired) == {'insert': 1, 'modify': 1, 'delete': 1, 'unchanged': 1}
+    # Deletes are sent first, in their own request
+    assert updateTypes(sw) == [[p4runtime_pb2.Update.DELETE],
+                               [p4runtime_pb2.Update.MODIFY, p4runtime_pb2.Update.INSERT]]
+
+def test_default_entries_are_modified(sw, p4info_helper):
+    default = p4info_helper.buildTableEntry('ipv4_lpm', default_action=True, action_name='drop')
+    stats = TableReconciler(sw, p4info_helper).apply([default])
+    assert stats == {'insert': 0, 'modify': 1, 'delete': 0, 'unchanged': 0}
+
+def test_other_tables_are_left_alone(sw, p4info_helper):
+    acl = p4info_helper.buildTableEntry(
+        'acl', match_fields={'hdr.ethernet.dstAddr': ('08:00:00:00:01:11', 'ff:ff:ff:ff:ff:ff'),
+                             'hdr.tcp.dstPort': (80, 443)},
+        action_name='drop', priority=1)
+    sw.client_stub.entities.append(p4runtime_pb2.Entity(table_entry=acl))
+    TableReconciler(sw, p4info_helper).apply([lpmEntry(p4info_helper, 0, 1)])
+    assert len(sw.client_stub.entities) == 2
+    TableReconciler(sw, p4info_helper, tables=['ipv4_lpm', 'acl']).apply(
+        [lpmEntry(p4info_helper, 0, 1)])
+    assert len(sw.client_stub.entities) == 1
+
+def test_canonical_values_match(p4info_helper):
+    entry = lpmEntry(p4info_helper, 1, 1)
+    canonical = p4runtime_pb2.TableEntry()
+    canonical.CopyFrom(entry)
+    canonical.match[0].lpm.value = canonical.match[0].lpm.value.lstrip(b'\x00')
+    canonical.action.action.params[1].value = b'\x01'
+    assert tableEntryKey(canonical) == tableEntryKey(entry)
+    assert tableEntryValue(canonical) == tableEntryValue(entry)
+
+def test_errors_are_reported_once_all_is_sent(sw, p4info_helper):
+    sw.client_stub.fail = lambda request: writeError([code_pb2.OK, code_pb2.RESOURCE_EXHAUSTED])
+    with pytest.raises(WriteBatchException) as info:
+        TableReconciler(sw, p4info_helper).apply(
+            [lpmEntry(p4info_helper, i, 1) for i in range(2)])
+    assert [idx for idx, update, error in info.value.errors] == [1]
+
+def test_unavailable_switch(sw, p4info_helper):
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+    sw.client_stub.fail = lambda request: unavailable
+    with pytest.raises(WriteBatchException) as info:
+        TableReconciler(sw, p4info_helper).apply([lpmEntry(p4info_helper, 0, 1)])
+    assert info.value.cause is unavailable
+    assert len(info.value.unsent) == 1
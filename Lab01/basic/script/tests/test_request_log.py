@@ -0,0 +1,65 @@
+import pytest
+from p4.v1 import p4runtime_pb2
+
+from p4runtime_lib import request_log
+from p4runtime_lib.request_log import RequestLogFormatException, readRecords, replay
+
+WRITE = '/p4.v1.P4Runtime/Write'
+READ = '/p4.v1.P4Runtime/Read'
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = str(tmp_path / 'log.p4rtlog')
+    with open(path, 'wb') as f:
+        request_log.writeHeader(f, created=1000.0)
+        for i in range(4):
+            request = p4runtime_pb2.WriteRequest(device_id=1)
+            request.updates.add().entity.table_entry.priority = i + 1
+            request_log.writeRecord(f, 1000.0 + i, WRITE, request)
+        request_log.writeRecord(f, 1004.0, READ, p4runtime_pb2.ReadRequest(device_id=1))
+        # Methods outside of the log format are not recorded
+        assert not request_log.writeRecord(f, 1005.0, '/p4.v1.P4Runtime/Other',
+                                           p4runtime_pb2.ReadRequest())
+    return path
+
+def test_records_round_trip(log_file):
+    records = list(readRecords(log_file))
+    assert [(t, m) for t, m, r in records] == [
+        (1000.0, WRITE), (1001.0, WRITE), (1002.0, WRITE), (1003.0, WRITE), (1004.0, READ)]
+    assert records[2][2].updates[0].entity.table_entry.priority == 3
+
+def test_record_filters(log_file):
+    assert [t for t, m, r in readRecords(log_file, methods=['Read'])] == [1004.0]
+    assert [t for t, m, r in readRecords(log_file, start=1, end=3)] == [1001.0, 1002.0]
+
+def test_truncated_log(log_file):
+    data = open(log_file, 'rb').read()
+    with open(log_file, 'wb') as f:
+        f.write(data[:-3])
+    assert len(list(readRecords(log_file))) == 4
+
+def test_not_a_binary_log(tmp_path):
+    path = tmp_path / 'log.txt'
+    path.write_text('[2024-01-01 00:00:00.000] /p4.v1.P4Runtime/Write\n')
+    assert not request_log.isBinaryLog(str(path))
+    with pytest.raises(RequestLogFormatException):
+        list(readRecords(str(path)))
+
+def test_replay_rewrites_the_device_id(log_file):
+    sent = []
+
+    class Stub(object):
+        def Write(self, request):
+            sent.append(request)
+
+        def Read(self, request):
+            sent.append(request)
+            return iter([])
+
+    class Switch(object):
+        device_id = 7
+        client_stub = Stub()
+
+    assert replay(Switch(), readRecords(log_file)) == 5
+    assert [r.device_id for r in sent] == [7] * 5
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip('p4.tmp')
+
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib.request_log import readRecords
+from p4runtime_lib.switch import MSG_LOG_MAX_LEN, GrpcRequestLogger
+
+WRITE = '/p4.v1.P4Runtime/Write'
+
+
+def request(n_updates=1):
+    request = p4runtime_pb2.WriteRequest(device_id=1)
+    for i in range(n_updates):
+        request.updates.add().entity.table_entry.priority = i + 1
+    return request
+
+def test_messages_are_written_on_close(tmp_path):
+    log_file = str(tmp_path / 'log.txt')
+    logger = GrpcRequestLogger(log_file)
+    for i in range(3):
+        logger.log_message(WRITE, request())
+    logger.close()
+    text = open(log_file).read()
+    assert text.count(WRITE) == 3
+    assert 'device_id: 1' in text
+    # Messages logged after close are ignored
+    logger.log_message(WRITE, request())
+    logger.close()
+    assert open(log_file).read() == text
+
+def test_long_messages_are_skipped(tmp_path):
+    log_file = str(tmp_path / 'log.txt')
+    logger = GrpcRequestLogger(log_file)
+    big = request(MSG_LOG_MAX_LEN // 8)
+    logger.log_message(WRITE, big)
+    logger.close()
+    text = open(log_file).read()
+    assert 'Message too long' in text
+    assert 'priority' not in text
+
+def test_dropped_messages_are_counted(tmp_path):
+    log_file = str(tmp_path / 'log.txt')
+    logger = GrpcRequestLogger(log_file, max_queue=1, drop=True)
+    for i in range(1000):
+        logger.log_message(WRITE, request())
+    logger.close()
+    text = open(log_file).read()
+    assert text.count(WRITE) + logger.dropped == 1000
+    if logger.dropped:
+        assert 'dropped, logger queue full' in text
+
+def test_binary_log(tmp_path):
+    log_file = str(tmp_path / 'log.p4rtlog')
+    logger = GrpcRequestLogger(log_file)
+    big = request(MSG_LOG_MAX_LEN)
+    logger.log_message(WRITE, big)
+    logger.close()
+    # Binary logs keep long messages
+    assert [(m, r) for t, m, r in readRecords(log_file)] == [(WRITE, big)]
@@ -0,0 +1,68 @@
+import io
+import json
+import pathlib
+
+import pytest
+
+from p4runtime_lib import runtime_conf
+from p4runtime_lib.runtime_conf import ENTRY_LISTS, RuntimeConfFormatException, readRuntimeConf
+
+REPO = pathlib.Path(__file__).resolve().parents[4]
+RUNTIME_CONFS = sorted(REPO.glob('Lab*/**/*-runtime.json'))
+
+
+def expected(conf):
+    "(sw_conf, entries) as readRuntimeConf returns them, from a parsed config"
+    sw_conf = {k: v for k, v in conf.items() if k not in ENTRY_LISTS}
+    entries = [(k, e) for k in conf if k in ENTRY_LISTS for e in conf[k]]
+    return sw_conf, entries
+
+def read(text, name='s1-runtime.json'):
+    f = io.StringIO(text)
+    f.name = name
+    sw_conf, entries = readRuntimeConf(f)
+    return sw_conf, list(entries)
+
+@pytest.fixture(params=[1, 2, 3, 7, 1 << 16])
+def read_size(request, monkeypatch):
+    # Tiny buffers make every token cross a buffer boundary
+    monkeypatch.setattr(runtime_conf, 'READ_SIZE', request.param)
+    return request.param
+
+def test_repo_runtime_confs_exist():
+    assert len(RUNTIME_CONFS) >= 10
+
+@pytest.mark.parametrize('path', RUNTIME_CONFS, ids=lambda p: str(p.relative_to(REPO)))
+def test_repo_runtime_confs(path, read_size):
+    text = path.read_text()
+    assert read(text) == expected(json.loads(text))
+
+@pytest.mark.parametrize('text', [
+    '{"a":1.5e3,"b":-0.25E-2,"c":[10,200],"table_entries":[{"x":12345}]}',
+    '{"a": 1e10, "b": true, "c": null, "d": "1.5", "e": {"f": 123}}',
+    '{}',
+])
+def test_values_split_across_reads(text, read_size):
+    assert read(text) == expected(json.loads(text))
+
+def test_header_after_entries():
+    conf = {'table_entries': [{'table': 't', 'priority': 1}], 'target': 'bmv2',
+            'p4info': 'x.p4info.txt', 'bmv2_json': 'x.json'}
+    assert read(json.dumps(conf)) == expected(conf)
+
+def test_json_lines():
+    header = {'target': 'bmv2', 'p4info': 'x.p4info.txt', 'bmv2_json': 'x.json',
+              'multicast_group_entries': [{'multicast_group_id': 1, 'replicas': []}]}
+    lines = [json.dumps(header), json.dumps({'table': 't', 'match': {}}), '',
+             json.dumps({'clone_session_id': 5, 'replicas': []})]
+    sw_conf, entries = read('\n'.join(lines), name='s1-runtime.jsonl')
+    assert sw_conf == {'target': 'bmv2', 'p4info': 'x.p4info.txt', 'bmv2_json': 'x.json'}
+    assert [k for k, e in entries] == ['multicast_group_entries', 'table_entries',
+                                       'clone_session_entries']
+    with pytest.raises(RuntimeConfFormatException):
+        read('\n'.join(lines + ['{"unknown": 1}']), name='s1-runtime.jsonl')
+
+@pytest.mark.parametrize('text', ['[]', '{"a" 1}', '{"a": 1', '{"table_entries": [1 2]}', '{1: 2}'])
+def test_format_errors(text, read_size):
+    with pytest.raises(RuntimeConfFormatException):
+        read(text)
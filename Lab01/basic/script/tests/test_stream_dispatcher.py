@@ -0,0 +1,100 @@
+import grpc
+import pytest
+
+pytest.importorskip('p4.tmp')
+
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib.switch import IterableQueue, StreamMessageDispatcher
+
+from p4rt_fakes import FakeRpcError
+
+
+def packet(payload):
+    return p4runtime_pb2.StreamMessageResponse(packet=p4runtime_pb2.PacketIn(payload=payload))
+
+def digest(list_id):
+    return p4runtime_pb2.StreamMessageResponse(
+        digest=p4runtime_pb2.DigestList(digest_id=1, list_id=list_id))
+
+def test_messages_are_queued_by_type():
+    stream = IterableQueue()
+    dispatcher = StreamMessageDispatcher(stream)
+    for m in [packet(b'a'), digest(1), packet(b'b')]:
+        stream.put(m)
+    stream.close()
+    dispatcher.reader.join()
+    assert dispatcher.get('packet', timeout=1).packet.payload == b'a'
+    assert [m.digest.list_id for m in dispatcher.get_all('digest')] == [1]
+    assert [m.packet.payload for m in dispatcher.get_all('packet')] == [b'b']
+    # The stream is over
+    assert dispatcher.get('packet', timeout=1) is None
+    assert dispatcher.get('arbitration', timeout=1) is None
+
+def test_full_queues_drop_messages():
+    stream = IterableQueue()
+    dispatcher = StreamMessageDispatcher(stream, max_queue=2)
+    for i in range(5):
+        stream.put(packet(b'%d' % i))
+    stream.close()
+    # The reader waits for room in the queue to mark its end
+    assert [dispatcher.get('packet', timeout=1).packet.payload for i in range(2)] == [b'0', b'1']
+    assert dispatcher.get('packet', timeout=1) is None
+    assert dispatcher.dropped == {'packet': 3}
+
+def test_callbacks():
+    stream = IterableQueue()
+    dispatcher = StreamMessageDispatcher(stream)
+    received = []
+    dispatcher.on('digest', lambda m: received.append(m.digest.list_id))
+    for i in range(3):
+        stream.put(digest(i))
+    stream.put(packet(b'a'))
+    stream.close()
+    dispatcher.reader.join()
+    assert received == [0, 1, 2]
+    assert dispatcher.get_all('digest') == []
+    assert len(dispatcher.get_all('packet')) == 1
+
+def test_failing_callbacks_do_not_stop_the_reader():
+    stream = IterableQueue()
+    dispatcher = StreamMessageDispatcher(stream)
+    received = []
+
+    def callback(m):
+        if m.digest.list_id % 2:
+            raise ValueError(m.digest.list_id)
+        received.append(m.digest.list_id)
+
+    dispatcher.on('digest', callback)
+    for i in range(5):
+        stream.put(digest(i))
+    stream.put(packet(b'a'))
+    stream.close()
+    dispatcher.reader.join()
+    assert received == [0, 2, 4]
+    assert dispatcher.callback_errors == {'digest': 2}
+    assert dispatcher.callback_error.args == (3,)
+    assert dispatcher.get('packet', timeout=1).packet.payload == b'a'
+
+def test_stream_errors_are_raised_to_consumers():
+    error = FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+
+    def responses():
+        yield packet(b'a')
+        raise error
+
+    dispatcher = StreamMessageDispatcher(responses())
+    dispatcher.reader.join()
+    assert dispatcher.get('packet', timeout=1).packet.payload == b'a'
+    with pytest.raises(grpc.RpcError):
+        dispatcher.get('packet', timeout=1)
+
+def test_cancelled_streams_end_quietly():
+    def responses():
+        raise FakeRpcError(grpc.StatusCode.CANCELLED, 'cancelled')
+        yield
+
+    dispatcher = StreamMessageDispatcher(responses())
+    dispatcher.reader.join()
+    assert dispatcher.error is None
+    assert dispatcher.get('packet', timeout=1) is None
@@ -0,0 +1,91 @@
+import io
+import json
+
+import pytest
+from p4.v1 import p4runtime_pb2
+
+from p4runtime_lib.table_reader import TableReader, printTableRules
+
+from p4rt_fakes import FakeSwitch
+
+MAC = '08:00:00:00:01:11'
+MAC_BYTES = b'\x08\x00\x00\x00\x01\x11'
+
+
+@pytest.fixture
+def sw(p4info_helper):
+    sw = FakeSwitch()
+    for i in range(1, 4):
+        entry = p4info_helper.buildTableEntry(
+            'ipv4_lpm', match_fields={'hdr.ipv4.dstAddr': ('10.0.%d.0' % i, 24)},
+            action_name='ipv4_forward', action_params={'dstAddr': MAC, 'port': i})
+        sw.client_stub.entities.append(p4runtime_pb2.Entity(table_entry=entry))
+    acl = p4info_helper.buildTableEntry(
+        'acl', match_fields={'hdr.ethernet.dstAddr': (MAC, 'ff:ff:ff:ff:ff:ff'),
+                             'hdr.tcp.dstPort': (80, 443)},
+        action_name='drop', priority=10)
+    sw.client_stub.entities.append(p4runtime_pb2.Entity(table_entry=acl))
+    return sw
+
+def test_records(sw, p4info_helper):
+    records = list(TableReader(p4info_helper).records(sw))
+    assert len(sw.client_stub.reads) == 1
+    assert len(records) == 4
+    assert records[0] == {
+        'table': 'MyIngress.ipv4_lpm', 'priority': 0,
+        'match': {'hdr.ipv4.dstAddr': (b'\x0a\x00\x01\x00', 24)},
+        'action': 'MyIngress.ipv4_forward',
+        'params': {'dstAddr': MAC_BYTES, 'port': b'\x00\x01'}}
+    assert records[3]['match'] == {'hdr.ethernet.dstAddr': (MAC_BYTES, b'\xff' * 6),
+                                   'hdr.tcp.dstPort': (b'\x00\x50', b'\x01\xbb')}
+    assert (records[3]['action'], records[3]['params'], records[3]['priority']) == \
+        ('MyIngress.drop', {}, 10)
+
+def test_tables_filter(sw, p4info_helper):
+    reader = TableReader(p4info_helper)
+    assert [r['table'] for r in reader.records(sw, tables=['acl'])] == ['MyIngress.acl']
+    query, = sw.client_stub.reads[0].entities
+    assert query.table_entry.table_id == 33554434
+
+def test_action_profile_entries(p4info_helper):
+    reader = TableReader(p4info_helper)
+    entry = p4runtime_pb2.TableEntry(table_id=33554433)
+    entry.action.action_profile_member_id = 5
+    assert reader.decode(entry)['action_profile_member_id'] == 5
+    entry = p4runtime_pb2.TableEntry(table_id=33554433)
+    for port in (1, 2):
+        profile_action = entry.action.action_profile_action_set.action_profile_actions.add()
+        profile_action.action.action_id = 16777219
+        profile_action.action.params.add(param_id=1, value=bytes([0, port]))
+        profile_action.weight = port
+    assert reader.decode(entry)['action_profile_action_set'] == [
+        {'action': 'MyIngress.set_port', 'params': {'port': b'\x00\x01'}, 'weight': 1},
+        {'action': 'MyIngress.set_port', 'params': {'port': b'\x00\x02'}, 'weight': 2}]
+
+def test_unknown_ids(p4info_helper):
+    reader = TableReader(p4info_helper)
+    with pytest.raises(AttributeError):
+        reader.decode(p4runtime_pb2.TableEntry(table_id=1))
+
+def test_columns(sw, p4info_helper):
+    columns = TableReader(p4info_helper).columns(sw)
+    lpm = columns['MyIngress.ipv4_lpm']
+    assert lpm['port'] == [b'\x00\x01', b'\x00\x02', b'\x00\x03']
+    assert lpm['priority'] == [0, 0, 0]
+    acl = columns['MyIngress.acl']
+    assert acl['action'] == ['MyIngress.drop']
+    assert 'port' not in acl
+
+def test_json(sw, p4info_helper):
+    f = io.StringIO()
+    assert TableReader(p4info_helper).to_json(sw, f) == 4
+    record = json.loads(f.getvalue().splitlines()[0])
+    assert record['params'] == {'dstAddr': '0x080000000111', 'port': '0x0001'}
+    assert record['match'] == {'hdr.ipv4.dstAddr': ['0x0a000100', 24]}
+
+def test_print_table_rules(sw, p4info_helper, capsys):
+    printTableRules(p4info_helper, sw, tables=['ipv4_lpm'])
+    out = capsys.readouterr().out
+    assert out.count('MyIngress.ipv4_lpm:') == 3
+    assert '-> MyIngress.ipv4_forward' in out
+    assert "(param_value:b'\\x00\\x03')" in out
@@ -0,0 +1,111 @@
+import json
+import math
+
+import grpc
+import pytest
+from p4.v1 import p4runtime_pb2
+
+from p4runtime_lib.counters import PACKETS
+from p4runtime_lib.telemetry import RingBuffer, TelemetryCollector
+
+from p4rt_fakes import FakeRpcError, FakeSwitch
+from test_counters import counterEntity
+
+COUNTER = 'MyIngress.port_counter'
+REGISTER = 'MyEgress.qdepth'
+
+
+def registerEntity(index, value):
+    entity = p4runtime_pb2.Entity()
+    register = entity.register_entry
+    register.register_id = 369000001
+    register.index.index = index
+    register.data.bitstring = value.to_bytes(3, 'big')
+    return entity
+
+def setCounts(sw, scale):
+    sw.client_stub.entities = [counterEntity(i, i * scale, i * scale * 100) for i in range(4)]
+
+@pytest.fixture
+def switches():
+    return [FakeSwitch(name='s1'), FakeSwitch(name='s2')]
+
+@pytest.fixture
+def collector(switches, p4info_helper):
+    return TelemetryCollector(switches, p4info_helper, counters={'port_counter': [1, 3]},
+                              registers={'qdepth': None}, history=3)
+
+def test_ring_buffer():
+    buffer = RingBuffer(3, (1,))
+    for i in range(5):
+        buffer.append(float(i), [i * 10])
+    timestamps, values = buffer.series()
+    assert len(buffer) == 3
+    assert timestamps.tolist() == [2.0, 3.0, 4.0]
+    assert values[:, 0].tolist() == [20, 30, 40]
+    assert buffer.series(last=1)[0].tolist() == [4.0]
+
+def test_poll_reads_each_switch_once(collector, switches):
+    for scale, sw in enumerate(switches, 1):
+        setCounts(sw, scale)
+        sw.client_stub.entities.append(registerEntity(2, 17))
+    collector.poll()
+    for scale, sw in enumerate(switches, 1):
+        assert len(sw.client_stub.reads) == 1
+        timestamps, values = collector.series(sw.name, COUNTER, 3, PACKETS)
+        assert values.tolist() == [3 * scale]
+    _, qdepth = collector.series('s1', 'MyEgress.qdepth', 2)
+    assert qdepth.tolist() == [17]
+    # Register indexes the switch did not return are not exported
+    rows = [r for r in collector.rows() if r['switch'] == 's1']
+    assert [(r['kind'], r['index']) for r in rows] == [('counter', 1), ('counter', 3), ('register', 2)]
+    assert rows[1]['bytes'] == 300
+
+def test_rates(collector, switches):
+    for i in range(3):
+        setCounts(switches[0], i)
+        collector.poll()
+    timestamps, _ = collector.series('s1', COUNTER, 1)
+    elapsed = timestamps[-1] - timestamps[0]
+    assert collector.rate('s1', COUNTER, 1) == pytest.approx(200 / elapsed)
+    assert collector.rate('s1', COUNTER, 1, last=1) is None
+
+def test_errors_are_kept_per_switch(collector, switches):
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+    switches[0].client_stub.fail_read = lambda request: unavailable
+    # A reply the collector cannot use
+    switches[1].client_stub.entities = [counterEntity(9, 1, 1)]
+    collector.poll()
+    assert collector.errors['s1'] is unavailable
+    assert isinstance(collector.errors['s2'], IndexError)
+    switches[0].client_stub.fail_read = None
+    collector.poll()
+    assert 's1' not in collector.errors
+
+def test_counters_not_read_are_nan(collector, switches):
+    collector.poll()
+    _, values = collector.series('s1', COUNTER, 1)
+    assert math.isnan(values[0])
+    assert collector.rate('s1', COUNTER, 1) is None
+    assert list(collector.rows()) == []
+
+def test_invalid_indexes(switches, p4info_helper):
+    with pytest.raises(ValueError):
+        TelemetryCollector(switches, p4info_helper, counters={'port_counter': [4]})
+
+def test_no_switches(p4info_helper):
+    collector = TelemetryCollector([], p4info_helper, counters={'port_counter': None},
+                                   interval=0.01)
+    collector.poll()
+    collector.start()
+    collector.stop()
+    assert collector.errors == {}
+
+def test_exports(collector, switches, tmp_path):
+    setCounts(switches[0], 1)
+    collector.poll()
+    collector.to_json(str(tmp_path / 'tel.jsonl'))
+    rows = [json.loads(line) for line in open(str(tmp_path / 'tel.jsonl'))]
+    assert rows == list(collector.rows())
+    collector.to_csv(str(tmp_path / 'tel.csv'))
+    assert len(open(str(tmp_path / 'tel.csv')).readlines()) == len(rows) + 1
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from traffic import PacketTemplate, TrafficGenerator, checksumAdjust, flowVariants
+
+scapy = pytest.importorskip('scapy.all')
+from scapy.all import IP, TCP, UDP, Ether, IPOption_RR, Dot1Q
+
+
+def checksumsOk(frame):
+    "Whether the IP and L4 checksums of frame are those scapy computes"
+    packet = Ether(frame)
+    rebuilt = packet.copy()
+    del rebuilt[IP].chksum
+    l4 = rebuilt[IP].payload
+    if hasattr(l4, 'chksum'):
+        del l4.chksum
+    rebuilt = Ether(bytes(rebuilt))
+    return (packet[IP].chksum == rebuilt[IP].chksum and
+            getattr(packet[IP].payload, 'chksum', None) == getattr(rebuilt[IP].payload, 'chksum', None))
+
+@pytest.mark.parametrize('packet', [
+    Ether() / IP(dst='10.0.2.2') / UDP(sport=1234, dport=4321) / b'payload',
+    Ether() / IP(dst='10.0.2.2') / TCP(sport=1234, dport=80) / b'payload',
+    Ether() / Dot1Q(vlan=3) / IP(dst='10.0.2.2', options=IPOption_RR()) / UDP() / b'x',
+])
+def test_variants_keep_valid_checksums(packet):
+    template = PacketTemplate(bytes(packet))
+    frames = flowVariants(template, flows=20, sport=(49152, 65535), dport=[80, 443],
+                          tos=[0, 0x28, 0xb8], seed=1)
+    assert len(frames) == 20
+    for frame in frames:
+        assert checksumsOk(frame)
+        parsed = Ether(frame)
+        assert 49152 <= parsed[IP].payload.sport <= 65535
+        assert parsed[IP].payload.dport in (80, 443)
+        assert parsed[IP].tos in (0, 0x28, 0xb8)
+
+def test_udp_without_checksum():
+    packet = Ether() / IP() / UDP(chksum=0) / b'x'
+    frame = PacketTemplate(bytes(packet)).variant(sport=5000)
+    assert Ether(frame)[UDP].chksum == 0
+
+def test_non_ip_frames():
+    template = PacketTemplate(bytes(Ether(type=0x1234) / b'raw frame'))
+    assert flowVariants(template) == [template.frame]
+    with pytest.raises(ValueError):
+        template.variant(tos=1)
+
+def checksum(words):
+    total = sum(words)
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+def test_checksum_adjust():
+    rng = random.Random(1)
+    for _ in range(1000):
+        words = [rng.randrange(0x10000) for _ in range(10)]
+        old, new = words[3], rng.randrange(0x10000)
+        adjusted = checksumAdjust(checksum(words), old, new)
+        words[3] = new
+        # 0 and 0xffff are the same value in ones' complement
+        assert adjusted % 0xffff == checksum(words) % 0xffff
+
+@pytest.mark.parametrize('use_sendmmsg', [True, False])
+def test_generator_on_loopback(use_sendmmsg):
+    try:
+        generator = TrafficGenerator('lo', use_sendmmsg=use_sendmmsg)
+    except (PermissionError, OSError) as e:
+        pytest.skip("no AF_PACKET socket: %s" % e)
+    frames = flowVariants(PacketTemplate(bytes(Ether() / IP(dst='127.0.0.1') / UDP() / b'x')),
+                          flows=3, sport=(1024, 2048))
+    with generator:
+        stats = generator.run(frames, count=100, batch_size=8)
+        assert stats.packets == 100
+        assert stats.bytes == 100 * len(frames[0])
+        limited = generator.run(frames, pps=1000, duration=0.1)
+    assert 50 <= limited.packets <= 150
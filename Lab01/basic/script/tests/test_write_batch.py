@@ -0,0 +1,148 @@
+import asyncio
+
+import grpc
+import pytest
+from google.rpc import code_pb2
+
+pytest.importorskip('p4.tmp')
+
+from p4.v1 import p4runtime_pb2
+from p4runtime_lib.switch import (AsyncWriteBatch, PipelinedWriteBatch, WriteBatch,
+                                  WriteBatchException)
+
+from p4rt_fakes import AsyncFakeStub, FakeRpcError, FakeSwitch, writeError
+
+
+def entry(i):
+    return p4runtime_pb2.TableEntry(table_id=1, priority=i + 1)
+
+def test_flush_splits_updates_in_requests():
+    sw = FakeSwitch(device_id=3)
+    batch = WriteBatch(sw, max_batch_size=2)
+    for i in range(5):
+        batch.InsertTableEntry(entry(i))
+    assert len(batch) == 5
+    batch.Flush()
+    assert len(batch) == 0
+    writes = sw.client_stub.writes
+    assert [len(r.updates) for r in writes] == [2, 2, 1]
+    assert all(r.device_id == 3 and r.election_id.low == 1 for r in writes)
+    priorities = [u.entity.table_entry.priority for r in writes for u in r.updates]
+    assert priorities == [1, 2, 3, 4, 5]
+
+def test_update_types():
+    sw = FakeSwitch()
+    with WriteBatch(sw) as batch:
+        batch.WriteTableEntry(entry(0))
+        batch.WriteTableEntry(p4runtime_pb2.TableEntry(table_id=1, is_default_action=True))
+        batch.DeleteTableEntry(entry(1))
+    types = [u.type for u in sw.client_stub.writes[0].updates]
+    assert types == [p4runtime_pb2.Update.INSERT, p4runtime_pb2.Update.MODIFY,
+                     p4runtime_pb2.Update.DELETE]
+
+def test_context_manager_does_not_flush_on_error():
+    sw = FakeSwitch()
+    with pytest.raises(RuntimeError):
+        with WriteBatch(sw) as batch:
+            batch.InsertTableEntry(entry(0))
+            raise RuntimeError
+    assert sw.client_stub.writes == []
+
+def test_dry_run_sends_nothing(capsys):
+    sw = FakeSwitch()
+    batch = WriteBatch(sw, dry_run=True)
+    batch.InsertTableEntry(entry(0))
+    batch.Flush()
+    assert sw.client_stub.writes == []
+    assert 'P4Runtime Write' in capsys.readouterr().out
+
+def test_errors_are_indexed_across_requests():
+    sw = FakeSwitch()
+    # The second update of each request already exists
+    sw.client_stub.fail = lambda request: writeError(
+        [code_pb2.OK, code_pb2.ALREADY_EXISTS][:len(request.updates)])
+    batch = WriteBatch(sw, max_batch_size=2)
+    for i in range(5):
+        batch.InsertTableEntry(entry(i))
+    with pytest.raises(WriteBatchException) as info:
+        batch.Flush()
+    e = info.value
+    assert [idx for idx, update, error in e.errors] == [1, 3]
+    assert [update.entity.table_entry.priority for idx, update, error in e.errors] == [2, 4]
+    assert all(error.canonical_code == code_pb2.ALREADY_EXISTS for _, _, error in e.errors)
+    assert e.unsent == [] and e.cause is None
+    # Every request was still sent
+    assert len(sw.client_stub.writes) == 3
+
+def test_failed_request_reports_unsent_updates():
+    sw = FakeSwitch()
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+    sw.client_stub.fail = lambda request: (
+        unavailable if len(sw.client_stub.writes) == 2 else None)
+    batch = WriteBatch(sw, max_batch_size=2)
+    for i in range(5):
+        batch.InsertTableEntry(entry(i))
+    with pytest.raises(WriteBatchException) as info:
+        batch.Flush()
+    e = info.value
+    assert e.cause is unavailable
+    assert [idx for idx, update in e.unsent] == [2, 3, 4]
+    assert len(sw.client_stub.writes) == 2
+
+def test_async_batch():
+    sw = FakeSwitch()
+    sw.client_stub = AsyncFakeStub()
+    sw.client_stub.fail = lambda request: (
+        writeError([code_pb2.OK, code_pb2.NOT_FOUND]) if len(sw.client_stub.writes) == 1
+        else FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down'))
+
+    async def write():
+        async with AsyncWriteBatch(sw, max_batch_size=2) as batch:
+            for i in range(5):
+                batch.InsertTableEntry(entry(i))
+
+    with pytest.raises(WriteBatchException) as info:
+        asyncio.run(write())
+    e = info.value
+    assert [idx for idx, update, error in e.errors] == [1]
+    assert [idx for idx, update in e.unsent] == [2, 3, 4]
+
+def test_pipelined_batch_sends_full_requests_early():
+    sw = FakeSwitch()
+    batch = PipelinedWriteBatch(sw, max_batch_size=2, max_in_flight=1)
+    for i in range(5):
+        batch.InsertTableEntry(entry(i))
+    # The last update waits for Flush
+    assert len(batch) == 1
+    batch.Flush()
+    writes = sw.client_stub.writes
+    assert [len(r.updates) for r in writes] == [2, 2, 1]
+    priorities = [u.entity.table_entry.priority for r in writes for u in r.updates]
+    assert priorities == [1, 2, 3, 4, 5]
+    # The batch can be used again
+    batch.InsertTableEntry(entry(5))
+    batch.Flush()
+    assert len(writes) == 4
+
+def test_pipelined_batch_errors():
+    sw = FakeSwitch()
+    sw.client_stub.fail = lambda request: writeError([code_pb2.OK, code_pb2.ALREADY_EXISTS])
+    with pytest.raises(WriteBatchException) as info:
+        with PipelinedWriteBatch(sw, max_batch_size=2) as batch:
+            for i in range(4):
+                batch.InsertTableEntry(entry(i))
+    assert [idx for idx, update, error in info.value.errors] == [1, 3]
+
+def test_pipelined_batch_stops_after_a_failed_request():
+    sw = FakeSwitch()
+    unavailable = FakeRpcError(grpc.StatusCode.UNAVAILABLE, 'down')
+    sw.client_stub.fail = lambda request: unavailable
+    batch = PipelinedWriteBatch(sw, max_batch_size=2, max_in_flight=1)
+    # Adding updates never blocks, although nothing can be sent
+    for i in range(10):
+        batch.InsertTableEntry(entry(i))
+    with pytest.raises(WriteBatchException) as info:
+        batch.Flush()
+    assert info.value.cause is unavailable
+    assert [idx for idx, update in info.value.unsent] == list(range(10))
+    assert len(sw.client_stub.writes) == 1
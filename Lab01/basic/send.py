@@ -4,11 +4,17 @@ import sys
 import socket
 import random
 import struct
+import os
 
-from scapy.all import sendp, send, get_if_list, get_if_hwaddr
+from scapy.all import send, get_if_list, get_if_hwaddr
 from scapy.all import Packet
 from scapy.all import Ether, IP, UDP, TCP
 
+# Import the traffic generator from the script dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script'))
+from traffic import addTrafficArguments, sendFromArgs
+
 def get_if():
     ifs=get_if_list()
     iface=None # "h1-eth0"
@@ -22,19 +28,20 @@ def get_if():
     return iface
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('destination', type=str)
+    parser.add_argument('message', type=str)
+    addTrafficArguments(parser, count=1)
+    args = parser.parse_args()
 
-    if len(sys.argv)<3:
-        print('pass 2 arguments: <destination> "<message>"')
-        exit(1)
-
-    addr = socket.gethostbyname(sys.argv[1])
+    addr = socket.gethostbyname(args.destination)
     iface = get_if()
 
     print(("sending on interface %s to %s" % (iface, str(addr))))
     pkt =  Ether(src=get_if_hwaddr(iface), dst='ff:ff:ff:ff:ff:ff')
-    pkt = pkt /IP(dst=addr) / TCP(dport=1234, sport=random.randint(49152,65535)) / sys.argv[2]
+    pkt = pkt /IP(dst=addr) / TCP(dport=1234, sport=random.randint(49152,65535)) / args.message
     pkt.show2()
-    sendp(pkt, iface=iface, verbose=False)
+    sendFromArgs(iface, bytes(pkt), args)
 
 
 if __name__ == '__main__':
@@ -14,6 +14,15 @@ import p4runtime_lib.bmv2
 from p4runtime_lib.error_utils import printGrpcError
 from p4runtime_lib.switch import ShutdownAllSwitchConnections
 import p4runtime_lib.helper
+try:
+    # 需要NumPy，以及包含counters模块的utils
+    from p4runtime_lib.counters import CounterSnapshot
+except ImportError:
+    CounterSnapshot = None
+try:
+    from p4runtime_lib.table_reader import printTableRules
+except ImportError:
+    printTableRules = None
 
 #根据拓扑图可以得出的交换机到下一跳交换机的出端口
 SWITCH_TO_HOST_PORT = 1
@@ -72,6 +81,9 @@ def writeTunnelRules(p4info_helper, ingress_sw, egress_sw, tunnel_id,
 def readTableRules(p4info_helper, sw):
     #交换机流表规则的读取
     print('\n----- Reading tables rules for %s -----' % sw.name)
+    if printTableRules is not None:
+        printTableRules(p4info_helper, sw)
+        return
     for response in sw.ReadTableEntries():
         for entity in response.entities:
             entry = entity.table_entry
@@ -93,14 +105,32 @@ def readTableRules(p4info_helper, sw):
             print()
 
 
-def printCounter(p4info_helper, sw, counter_name, index):
-    for response in sw.ReadCounters(p4info_helper.get_counters_id(counter_name), index):
-        for entity in response.entities:
-            counter = entity.counter_entry
-            print("%s %s %d: %d packets (%d bytes)" % (
-                sw.name, counter_name, index,
-                counter.data.packet_count, counter.data.byte_count
-            ))
+TUNNEL_COUNTERS = ["MyIngress.ingressTunnelCounter", "MyIngress.egressTunnelCounter"]
+
+def readCounterSnapshots(p4info_helper, switches):
+    # 每个交换机只发送一次Read请求读取整个计数器数组，不能使用时返回None
+    if CounterSnapshot is None:
+        return None
+    return {sw.name: CounterSnapshot.read(sw, p4info_helper, TUNNEL_COUNTERS)
+            for sw in switches}
+
+def printCounter(p4info_helper, sw, counter_name, index, snapshots=None):
+    if snapshots is None:
+        # 逐个读取计数器
+        for response in sw.ReadCounters(p4info_helper.get_counters_id(counter_name), index):
+            for entity in response.entities:
+                counter = entity.counter_entry
+                print("%s %s %d: %d packets (%d bytes)" % (
+                    sw.name, counter_name, index,
+                    counter.data.packet_count, counter.data.byte_count
+                ))
+        return
+    # 计数器的值来自每个交换机一次读取的快照
+    snapshot = snapshots[sw.name]
+    print("%s %s %d: %d packets (%d bytes)" % (
+        sw.name, counter_name, index,
+        snapshot.packets(counter_name, index), snapshot.bytes(counter_name, index)
+    ))
 
 def main(p4info_file_path, bmv2_file_path):
     # Instantiate a P4Runtime helper from the p4info file
@@ -172,24 +202,25 @@ def main(p4info_file_path, bmv2_file_path):
         while True:
             sleep(2)
             print('\n----- Reading tunnel counters -----')
+            snapshots = readCounterSnapshots(p4info_helper, (s1, s2, s3))
             print('\n--s1->s2---')
-            printCounter(p4info_helper, s1, "MyIngress.ingressTunnelCounter", 100)
-            printCounter(p4info_helper, s2, "MyIngress.egressTunnelCounter", 100)
+            printCounter(p4info_helper, s1, "MyIngress.ingressTunnelCounter", 100, snapshots)
+            printCounter(p4info_helper, s2, "MyIngress.egressTunnelCounter", 100, snapshots)
             print('\n--s2->s1---')
-            printCounter(p4info_helper, s2, "MyIngress.ingressTunnelCounter", 200)
-            printCounter(p4info_helper, s1, "MyIngress.egressTunnelCounter", 200)
+            printCounter(p4info_helper, s2, "MyIngress.ingressTunnelCounter", 200, snapshots)
+            printCounter(p4info_helper, s1, "MyIngress.egressTunnelCounter", 200, snapshots)
             print('\n--s1->s3---')
-            printCounter(p4info_helper, s1, "MyIngress.ingressTunnelCounter", 300)
-            printCounter(p4info_helper, s3, "MyIngress.egressTunnelCounter", 300)
+            printCounter(p4info_helper, s1, "MyIngress.ingressTunnelCounter", 300, snapshots)
+            printCounter(p4info_helper, s3, "MyIngress.egressTunnelCounter", 300, snapshots)
             print('\n--s3->s1---')
-            printCounter(p4info_helper, s3, "MyIngress.ingressTunnelCounter", 400)
-            printCounter(p4info_helper, s1, "MyIngress.egressTunnelCounter", 400)
+            printCounter(p4info_helper, s3, "MyIngress.ingressTunnelCounter", 400, snapshots)
+            printCounter(p4info_helper, s1, "MyIngress.egressTunnelCounter", 400, snapshots)
             print('\n--s2->s3---')
-            printCounter(p4info_helper, s2, "MyIngress.ingressTunnelCounter", 500)
-            printCounter(p4info_helper, s3, "MyIngress.egressTunnelCounter", 500)
+            printCounter(p4info_helper, s2, "MyIngress.ingressTunnelCounter", 500, snapshots)
+            printCounter(p4info_helper, s3, "MyIngress.egressTunnelCounter", 500, snapshots)
             print('\n--s3->s2---')
-            printCounter(p4info_helper, s3, "MyIngress.ingressTunnelCounter", 600)
-            printCounter(p4info_helper, s2, "MyIngress.egressTunnelCounter", 600)
+            printCounter(p4info_helper, s3, "MyIngress.ingressTunnelCounter", 600, snapshots)
+            printCounter(p4info_helper, s2, "MyIngress.egressTunnelCounter", 600, snapshots)
     except KeyboardInterrupt:
         print(" Shutting down.")
     except grpc.RpcError as e:
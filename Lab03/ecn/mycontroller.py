@@ -14,6 +14,10 @@ import p4runtime_lib.bmv2
 from p4runtime_lib.error_utils import printGrpcError
 from p4runtime_lib.switch import ShutdownAllSwitchConnections
 import p4runtime_lib.helper
+try:
+    from p4runtime_lib.table_reader import printTableRules
+except ImportError:
+    printTableRules = None
 
 #根据topology.json及拓扑图可以得出各设备相连接的端口
 S1_TO_H1_PORT = 2
@@ -47,6 +51,9 @@ def writeTranRules(p4info_helper, ingress_sw,
 
 def readTableRules(p4info_helper, sw):
     print('\n----- Reading tables rules for %s -----' % sw.name)
+    if printTableRules is not None:
+        printTableRules(p4info_helper, sw)
+        return
     for response in sw.ReadTableEntries():
         for entity in response.entities:
             entry = entity.table_entry
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
+import argparse
 import sys
 import struct
+import os
 
-from scapy.all import sniff, sendp, hexdump, get_if_list, get_if_hwaddr
+from scapy.all import sendp, hexdump, get_if_list, get_if_hwaddr
 from scapy.all import Packet
-from scapy.all import IP, UDP, Raw
+from scapy.all import Ether, IP, UDP, Raw
 from scapy.layers.inet import _IPOption_HDR
 
+# Import the capture engine from parent utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '../../utils/'))
+from capture import IPPROTO_UDP, addCaptureArguments, bpfFilter, captureFromArgs
+
 def get_if():
     ifs=get_if_list()
     iface=None
@@ -27,11 +35,15 @@ def handle_pkt(pkt):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    addCaptureArguments(parser)
+    args = parser.parse_args()
+
     iface = 'eth0'
     print(("sniffing on %s" % iface))
     sys.stdout.flush()
-    sniff(filter="udp and port 4321", iface = iface,
-          prn = lambda x: handle_pkt(x))
+    captureFromArgs(iface, args, bpf=bpfFilter(IPPROTO_UDP, port=4321),
+                    show=lambda frame: handle_pkt(Ether(frame)))
 
 if __name__ == '__main__':
     main()
@@ -5,14 +5,19 @@ import sys
 import socket
 import random
 import struct
+import os
 
-from scapy.all import sendp, send, hexdump, get_if_list, get_if_hwaddr
+from scapy.all import send, hexdump, get_if_list, get_if_hwaddr
 from scapy.all import Packet, IPOption
 from scapy.all import Ether, IP, UDP
 from scapy.all import IntField, FieldListField, FieldLenField, ShortField
 from scapy.layers.inet import _IPOption_HDR
 
-from time import sleep
+# Import the traffic generator from parent utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '../../utils/'))
+from traffic import addTrafficArguments, sendFromArgs
 
 def get_if():
     ifs=get_if_list()
@@ -27,23 +32,22 @@ def get_if():
     return iface
 
 def main():
-
-    if len(sys.argv)<4:
-        print('pass 2 arguments: <destination> "<message>" <duration>')
-        exit(1)
-
-    addr = socket.gethostbyname(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('destination', type=str)
+    parser.add_argument('message', type=str)
+    parser.add_argument('duration', help='in seconds', type=float)
+    # One packet per second unless --pps or --bps is given, use e.g.
+    # --pps 5000 to congest the queue
+    addTrafficArguments(parser, pps=1)
+    args = parser.parse_args()
+
+    addr = socket.gethostbyname(args.destination)
     iface = get_if()
 
-    pkt = Ether(src=get_if_hwaddr(iface), dst="ff:ff:ff:ff:ff:ff") / IP(dst=addr, tos=1) / UDP(dport=4321, sport=1234) / sys.argv[2]
+    pkt = Ether(src=get_if_hwaddr(iface), dst="ff:ff:ff:ff:ff:ff") / IP(dst=addr, tos=1) / UDP(dport=4321, sport=1234) / args.message
     pkt.show2()
     #hexdump(pkt)
-    try:
-      for i in range(int(sys.argv[3])):
-        sendp(pkt, iface=iface)
-        sleep(1)
-    except KeyboardInterrupt:
-        raise
+    sendFromArgs(iface, bytes(pkt), args, duration=args.duration)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,192 @@
+import struct
+import sys
+from time import monotonic
+
+'''
+Decoding of the MRI IP option and per-switch queue depth statistics.
+
+The MRI option is decoded in place from the buffer holding the frame:
+
+    +------+--------+-------+------+--------+------+--------+---
+    | type | length | count | swid | qdepth | swid | qdepth | ...
+    +------+--------+-------+------+--------+------+--------+---
+       8       8       16      32     32
+
+The last switch of the path comes first. QueueDepthStats aggregates the
+queue depths reported by each switch over a sliding window, made of
+`slots` time slots (the oldest slot is dropped as a whole): sample count,
+min, mean, max, and percentiles and a histogram with one bin per queue
+depth below LINEAR_BINS, and one bin per power of two above.
+'''
+
+ETH_P_IP = 0x0800
+IPV4_OPTION_MRI = 31
+IPV4_OPTION_EOL = 0
+IPV4_OPTION_NOP = 1
+
+ETHERTYPE = struct.Struct('!H')
+MRI_COUNT = struct.Struct('!H')
+SWITCH_TRACE = struct.Struct('!II')
+
+LINEAR_BINS = 64
+HISTOGRAM_BINS = LINEAR_BINS + 32 - (LINEAR_BINS.bit_length() - 1)
+
+
+def mriOption(buf, offset, caplen):
+    """Returns (count, offset of the first switch trace) of the MRI option
+    of the IPv4 frame of caplen bytes at offset of buf, None if it has none"""
+    if caplen < 34 or ETHERTYPE.unpack_from(buf, offset + 12)[0] != ETH_P_IP:
+        return None
+    ip = offset + 14
+    end = min(ip + (buf[ip] & 0x0f) * 4, offset + caplen)
+    pos = ip + 20
+    while pos + 4 <= end:
+        option = buf[pos]
+        if option == IPV4_OPTION_EOL:
+            return None
+        if option == IPV4_OPTION_NOP:
+            pos += 1
+            continue
+        length = buf[pos + 1]
+        if option & 0x1f == IPV4_OPTION_MRI:
+            count, = MRI_COUNT.unpack_from(buf, pos + 2)
+            traces = pos + 4
+            # Never read past the option or the captured bytes
+            count = min(count, (min(pos + length, end) - traces) // SWITCH_TRACE.size)
+            return count, traces
+        if length < 2:
+            return None
+        pos += length
+    return None
+
+def decodeMRI(buf, offset, caplen):
+    """Returns an iterator of (swid, qdepth) over the switch traces of the
+    frame, read from buf without copy, or None when it has no MRI option"""
+    option = mriOption(buf, offset, caplen)
+    if option is None:
+        return None
+    count, traces = option
+    return SWITCH_TRACE.iter_unpack(memoryview(buf)[traces:traces + count * SWITCH_TRACE.size])
+
+
+def histogramBin(qdepth):
+    if qdepth < LINEAR_BINS:
+        return qdepth
+    return LINEAR_BINS + qdepth.bit_length() - LINEAR_BINS.bit_length()
+
+def binLow(b):
+    "Smallest queue depth of histogram bin b"
+    if b < LINEAR_BINS:
+        return b
+    return 1 << (b - LINEAR_BINS + LINEAR_BINS.bit_length() - 1)
+
+
+class SwitchQueueStats(object):
+    "Queue depths reported by one switch, per time slot"
+
+    def __init__(self, slots):
+        # Time slot held by each position, -1 for none
+        self.slot_ids = [-1] * slots
+        self.histograms = [None] * slots
+        self.counts = [0] * slots
+        self.sums = [0] * slots
+        self.mins = [0] * slots
+        self.maxs = [0] * slots
+
+    def add(self, slot, qdepth):
+        pos = slot % len(self.slot_ids)
+        if self.slot_ids[pos] != slot:
+            # Recycle the position of the oldest slot
+            self.slot_ids[pos] = slot
+            self.histograms[pos] = [0] * HISTOGRAM_BINS
+            self.counts[pos] = self.sums[pos] = 0
+            self.mins[pos] = self.maxs[pos] = qdepth
+        elif qdepth < self.mins[pos]:
+            self.mins[pos] = qdepth
+        elif qdepth > self.maxs[pos]:
+            self.maxs[pos] = qdepth
+        self.histograms[pos][histogramBin(qdepth)] += 1
+        self.counts[pos] += 1
+        self.sums[pos] += qdepth
+
+    def summary(self, slot):
+        """Returns the statistics of the window ending with time slot slot,
+        None when there was no sample"""
+        live = [pos for pos, slot_id in enumerate(self.slot_ids)
+                if slot - len(self.slot_ids) < slot_id <= slot]
+        samples = sum(self.counts[pos] for pos in live)
+        if not samples:
+            return None
+        histogram = [0] * HISTOGRAM_BINS
+        for pos in live:
+            for b, n in enumerate(self.histograms[pos]):
+                histogram[b] += n
+        return {'samples': samples,
+                'min': min(self.mins[pos] for pos in live),
+                'max': max(self.maxs[pos] for pos in live),
+                'mean': sum(self.sums[pos] for pos in live) / samples,
+                'p50': percentile(histogram, samples, 50),
+                'p99': percentile(histogram, samples, 99),
+                'histogram': [(binLow(b), n) for b, n in enumerate(histogram) if n]}
+
+def percentile(histogram, samples, q):
+    "Lowest queue depth of the bin holding the q-th percentile"
+    rank = samples * q / 100.0
+    seen = 0
+    for b, n in enumerate(histogram):
+        seen += n
+        if seen >= rank:
+            return binLow(b)
+    return binLow(len(histogram) - 1)
+
+
+class QueueDepthStats(object):
+    """Per-switch queue depth statistics over the last `window` seconds,
+    from the MRI option of captured packets. update is a PacketCapture
+    handler."""
+
+    def __init__(self, window=10.0, slots=10, out=sys.stdout):
+        self.slot_time = float(window) / slots
+        self.slots = slots
+        self.out = out
+        # swid -> SwitchQueueStats
+        self.switches = {}
+        self.packets = 0
+        self.other = 0
+
+    def currentSlot(self):
+        return int(monotonic() / self.slot_time)
+
+    def update(self, buf, offset, caplen, wire_len):
+        traces = decodeMRI(buf, offset, caplen)
+        if traces is None:
+            self.other += 1
+            return
+        self.packets += 1
+        slot = self.currentSlot()
+        switches = self.switches
+        for swid, qdepth in traces:
+            stats = switches.get(swid)
+            if stats is None:
+                stats = switches[swid] = SwitchQueueStats(self.slots)
+            stats.add(slot, qdepth)
+
+    def snapshot(self):
+        "Returns {swid: statistics} for the switches with samples in the window"
+        slot = self.currentSlot()
+        result = {}
+        for swid, stats in sorted(self.switches.items()):
+            summary = stats.summary(slot)
+            if summary is not None:
+                result[swid] = summary
+        return result
+
+    def report(self):
+        snapshot = self.snapshot()
+        lines = ["%d MRI packets, %d switches in the last %gs" % (
+            self.packets, len(snapshot), self.slot_time * self.slots)]
+        for swid, s in snapshot.items():
+            lines.append("  switch %d: %d samples, qdepth min %d mean %.1f p50 %d p99 %d max %d" % (
+                swid, s['samples'], s['min'], s['mean'], s['p50'], s['p99'], s['max']))
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
@@ -5,14 +5,19 @@ import sys
 import socket
 import random
 import struct
+import os
 
-from scapy.all import sendp, send, hexdump, get_if_list, get_if_hwaddr
+from scapy.all import send, hexdump, get_if_list, get_if_hwaddr
 from scapy.all import Packet, IPOption
 from scapy.all import Ether, IP, UDP
 from scapy.all import IntField, FieldListField, FieldLenField, ShortField, PacketListField
 from scapy.layers.inet import _IPOption_HDR
 
-from time import sleep
+# Import the traffic generator from parent utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '../../utils/'))
+from traffic import addTrafficArguments, sendFromArgs
 
 def get_if():
     ifs=get_if_list()
@@ -47,18 +52,20 @@ class IPOption_MRI(IPOption):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('destination', type=str)
+    parser.add_argument('message', type=str)
+    parser.add_argument('duration', help='in seconds', type=float)
+    addTrafficArguments(parser, pps=1)
+    args = parser.parse_args()
 
-    if len(sys.argv)<3:
-        print('pass 2 arguments: <destination> "<message>"')
-        exit(1)
-
-    addr = socket.gethostbyname(sys.argv[1])
+    addr = socket.gethostbyname(args.destination)
     iface = get_if()
 
     pkt = Ether(src=get_if_hwaddr(iface), dst="ff:ff:ff:ff:ff:ff") / IP(
         dst=addr, options = IPOption_MRI(count=0,
             swtraces=[])) / UDP(
-            dport=4321, sport=1234) / sys.argv[2]
+            dport=4321, sport=1234) / args.message
 
  #   pkt = Ether(src=get_if_hwaddr(iface), dst="ff:ff:ff:ff:ff:ff") / IP(
  #       dst=addr, options = IPOption_MRI(count=2,
@@ -66,12 +73,7 @@ def main():
  #           dport=4321, sport=1234) / sys.argv[2]
     pkt.show2()
     #hexdump(pkt)
-    try:
-      for i in range(int(sys.argv[3])):
-        sendp(pkt, iface=iface)
-        sleep(1)
-    except KeyboardInterrupt:
-        raise
+    sendFromArgs(iface, bytes(pkt), args, duration=args.duration)
 
 
 if __name__ == '__main__':
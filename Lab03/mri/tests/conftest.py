@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the modules of the lab directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
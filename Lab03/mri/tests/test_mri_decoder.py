@@ -0,0 +1,123 @@
+import io
+import struct
+
+import pytest
+
+import mri_decoder
+from mri_decoder import (HISTOGRAM_BINS, LINEAR_BINS, QueueDepthStats, binLow, decodeMRI,
+                         histogramBin, mriOption, percentile)
+
+
+def frame(options=b'', ethertype=0x0800, payload=b'payload'):
+    "Ethernet and IPv4 headers followed by options, padded to 32 bits"
+    options += b'\x00' * (-len(options) % 4)
+    ihl = 5 + len(options) // 4
+    ip = struct.pack('!BBHHHBBH4s4s', 0x40 | ihl, 0, 20 + len(options) + len(payload),
+                     1, 0, 64, 17, 0, bytes(4), bytes(4))
+    return b'\xff' * 12 + struct.pack('!H', ethertype) + ip + options + payload
+
+def mri(traces, count=None, length=None):
+    body = b''.join(struct.pack('!II', swid, qdepth) for swid, qdepth in traces)
+    if count is None:
+        count = len(traces)
+    if length is None:
+        length = 4 + len(body)
+    return struct.pack('!BBH', 0x80 | mri_decoder.IPV4_OPTION_MRI, length, count) + body
+
+def decode(buf, offset=0, caplen=None):
+    traces = decodeMRI(buf, offset, len(buf) - offset if caplen is None else caplen)
+    return None if traces is None else list(traces)
+
+def test_decode_traces():
+    buf = frame(mri([(3, 7), (2, 0), (1, 100)]))
+    assert decode(buf) == [(3, 7), (2, 0), (1, 100)]
+
+def test_decode_at_offset_of_a_larger_buffer():
+    buf = bytearray(b'\x00' * 5 + frame(mri([(1, 2)])) + b'\x00' * 5)
+    assert decode(buf, 5, len(buf) - 10) == [(1, 2)]
+
+def test_no_option():
+    assert decode(frame()) is None
+    assert decode(frame(mri([(1, 2)]), ethertype=0x86dd)) is None
+    assert decode(frame(b'\x00' + mri([(1, 2)]))) is None
+    # Too short to be IPv4
+    assert decode(b'\x00' * 20) is None
+
+def test_nop_and_other_options_are_skipped():
+    other = struct.pack('!BB2s', 0x82, 4, b'ab')
+    buf = frame(b'\x01' + other + mri([(1, 2)]))
+    assert decode(buf) == [(1, 2)]
+
+def test_count_is_bounded_by_the_option_and_capture():
+    # More traces announced than the option holds
+    assert decode(frame(mri([(1, 2), (3, 4)], count=5))) == [(1, 2), (3, 4)]
+    assert decode(frame(mri([(1, 2), (3, 4)], length=12))) == [(1, 2)]
+    buf = frame(mri([(1, 2), (3, 4)]), payload=b'')
+    assert decode(buf, 0, len(buf) - 4) == [(1, 2)]
+    assert mriOption(buf, 0, len(buf)) == (2, 14 + 20 + 4)
+
+def test_histogram_bins():
+    assert [histogramBin(q) for q in (0, 1, LINEAR_BINS - 1)] == [0, 1, LINEAR_BINS - 1]
+    assert histogramBin(LINEAR_BINS) == LINEAR_BINS
+    assert histogramBin(2 * LINEAR_BINS - 1) == LINEAR_BINS
+    assert histogramBin(2 * LINEAR_BINS) == LINEAR_BINS + 1
+    # qdepth is 19 bits in mri.p4, and bins cover 32 bits
+    assert histogramBin(2 ** 32 - 1) == HISTOGRAM_BINS - 1
+    for q in (0, 5, 63, 64, 100, 1000, 2 ** 19 - 1):
+        assert binLow(histogramBin(q)) <= q
+        assert histogramBin(binLow(histogramBin(q))) == histogramBin(q)
+
+def test_percentile():
+    histogram = [0] * HISTOGRAM_BINS
+    histogram[1] = 50
+    histogram[histogramBin(1000)] = 50
+    assert percentile(histogram, 100, 50) == 1
+    assert percentile(histogram, 100, 51) == binLow(histogramBin(1000)) == 512
+    assert percentile(histogram, 100, 99) == 512
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(mri_decoder, 'monotonic', clock)
+    return clock
+
+def test_stats(clock):
+    out = io.StringIO()
+    stats = QueueDepthStats(window=10, slots=10, out=out)
+    for qdepth in (4, 2, 9):
+        buf = frame(mri([(2, qdepth * 10), (1, qdepth)]))
+        stats.update(buf, 0, len(buf), len(buf))
+    buf = frame()
+    stats.update(buf, 0, len(buf), len(buf))
+    assert (stats.packets, stats.other) == (3, 1)
+    snapshot = stats.snapshot()
+    assert sorted(snapshot) == [1, 2]
+    s = snapshot[1]
+    assert (s['samples'], s['min'], s['max'], s['mean']) == (3, 2, 9, 5.0)
+    assert (s['p50'], s['p99']) == (4, 9)
+    assert s['histogram'] == [(2, 1), (4, 1), (9, 1)]
+    assert (snapshot[2]['min'], snapshot[2]['max']) == (20, 90)
+    stats.report()
+    assert "switch 1: 3 samples, qdepth min 2 mean 5.0 p50 4 p99 9 max 9" in out.getvalue()
+
+def test_window_drops_old_slots(clock):
+    stats = QueueDepthStats(window=10, slots=10)
+    for qdepth in (1, 2):
+        buf = frame(mri([(1, qdepth)]))
+        stats.update(buf, 0, len(buf), len(buf))
+        clock.now += 5
+    buf = frame(mri([(1, 3)]))
+    stats.update(buf, 0, len(buf), len(buf))
+    # The first sample is now 10s old
+    s = stats.snapshot()[1]
+    assert (s['samples'], s['min'], s['max']) == (2, 2, 3)
+    clock.now += 20
+    assert stats.snapshot() == {}
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
 import socket
+import sys
 
-from scapy.all import sendp, send, hexdump, get_if_list, get_if_hwaddr
+from scapy.all import send, hexdump, get_if_list, get_if_hwaddr
 from scapy.all import Ether, IP, UDP, TCP
 
-from time import sleep
+# Import the traffic generator from parent utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '../../utils/'))
+from traffic import addTrafficArguments, sendFromArgs
 
 
 def get_if():
@@ -27,6 +33,7 @@ def main():
     parser.add_argument("--des", help="IP address of the destination", type=str)
     parser.add_argument("--m", help="Raw Message", type=str)
     parser.add_argument("--dur", help="in seconds", type=str)
+    addTrafficArguments(parser, pps=1)
     args = parser.parse_args()
 
     if args.p and args.des and args.m and args.dur:
@@ -35,21 +42,11 @@ def main():
         if args.p == 'UDP':
             pkt = Ether(src=get_if_hwaddr(iface), dst="ff:ff:ff:ff:ff:ff") / IP(dst=addr, tos=1) / UDP(dport=4321, sport=1234) / args.m
             pkt.show2()
-            try:
-                for i in range(int(args.dur)):
-                    sendp(pkt, iface=iface)
-                    sleep(1)
-            except KeyboardInterrupt:
-                raise
+            sendFromArgs(iface, bytes(pkt), args, duration=float(args.dur))
         elif args.p == 'TCP':
             pkt = Ether(src=get_if_hwaddr(iface), dst="ff:ff:ff:ff:ff:ff") / IP(dst=addr, tos=1) / TCP() / args.m
             pkt.show2()
-            try:
-                for i in range(int(args.dur)):
-                    sendp(pkt, iface=iface)
-                    sleep(1)
-            except KeyboardInterrupt:
-                raise
+            sendFromArgs(iface, bytes(pkt), args, duration=float(args.dur))
 
 
 if __name__ == '__main__':
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
+import argparse
 import sys
 import struct
 import os
 
-from scapy.all import sniff, sendp, hexdump, get_if_list, get_if_hwaddr
+from scapy.all import sendp, hexdump, get_if_list, get_if_hwaddr
 from scapy.all import Packet, IPOption
 from scapy.all import ShortField, IntField, LongField, BitField, FieldListField, FieldLenField
-from scapy.all import IP, TCP, UDP, Raw
+from scapy.all import Ether, IP, TCP, UDP, Raw
 from scapy.layers.inet import _IPOption_HDR
 
+# Import the capture engine from the utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils'))
+from capture import addCaptureArguments, bpfFilter, captureFromArgs
+
 def get_if():
     ifs=get_if_list()
     iface=None
@@ -49,14 +55,19 @@ def handle_pkt(pkt, input_dport):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', help='destination port', type=int)
+    addCaptureArguments(parser)
+    args = parser.parse_args()
+
     # ifaces = filter(lambda i: 'eth' in i, os.listdir('/sys/class/net/'))
     ifaces = [i for i in os.listdir('/sys/class/net/') if 'eth' in i]
 
     iface = ifaces[0]
     print ("sniffing on %s" % iface)
     sys.stdout.flush()
-    sniff(iface = iface,
-          prn = lambda x: handle_pkt(x, int(sys.argv[1])))
+    captureFromArgs(iface, args, bpf=bpfFilter(dport=args.port),
+                    show=lambda frame: handle_pkt(Ether(frame), args.port))
 
 if __name__ == '__main__':
     main()
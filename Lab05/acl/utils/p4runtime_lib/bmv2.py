@@ -12,19 +12,53 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from .switch import SwitchConnection
+import hashlib
+
+from .switch import AsyncSwitchConnection, SwitchConnection
 from p4.tmp import p4config_pb2
 
+# SHA-256 of a BMv2 JSON file -> (device config, serialized device config)
+_device_config_cache = {}
+
+
+def getDeviceConfig(bmv2_json_file_path):
+    """Returns (device config, serialized device config) for a BMv2 JSON file.
+
+    Both are built once per file content, identified by its SHA-256, and
+    shared by every connection, so pushing the same program to several
+    switches encodes it once.
+    """
+    with open(bmv2_json_file_path, 'rb') as f:
+        device_data = f.read()
+    key = hashlib.sha256(device_data).digest()
+    cached = _device_config_cache.get(key)
+    if cached is None:
+        device_config = p4config_pb2.P4DeviceConfig()
+        device_config.reassign = True
+        device_config.device_data = device_data
+        cached = (device_config, device_config.SerializeToString())
+        _device_config_cache[key] = cached
+    return cached
+
 
 def buildDeviceConfig(bmv2_json_file_path=None):
     "Builds the device config for BMv2"
     device_config = p4config_pb2.P4DeviceConfig()
-    device_config.reassign = True
-    with open(bmv2_json_file_path) as f:
-        device_config.device_data = f.read().encode('utf-8')
+    device_config.CopyFrom(getDeviceConfig(bmv2_json_file_path)[0])
     return device_config
 
 
 class Bmv2SwitchConnection(SwitchConnection):
     def buildDeviceConfig(self, **kwargs):
         return buildDeviceConfig(**kwargs)
+
+    def buildDeviceConfigBytes(self, bmv2_json_file_path=None):
+        return getDeviceConfig(bmv2_json_file_path)[1]
+
+
+class AsyncBmv2SwitchConnection(AsyncSwitchConnection):
+    def buildDeviceConfig(self, **kwargs):
+        return buildDeviceConfig(**kwargs)
+
+    def buildDeviceConfigBytes(self, bmv2_json_file_path=None):
+        return getDeviceConfig(bmv2_json_file_path)[1]
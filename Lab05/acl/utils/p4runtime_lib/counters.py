@@ -0,0 +1,120 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from time import monotonic
+
+import numpy
+from p4.v1 import p4runtime_pb2
+
+
+PACKETS = 0
+BYTES = 1
+
+
+class CounterSnapshot(object):
+    """Values of whole counter arrays, read from a switch in a single RPC.
+
+    counters maps counter names to arrays of shape (size, 2) holding the
+    packet and byte counts (columns PACKETS and BYTES) of each index.
+    missing holds the names of the counters the switch returned no value
+    for, whose arrays are left at zero.
+    """
+
+    def __init__(self, timestamp, counters, missing=()):
+        self.timestamp = timestamp
+        self.counters = counters
+        self.missing = set(missing)
+
+    @staticmethod
+    def readRequest(p4info_helper, counter_names=None):
+        """Returns (counter infos, entities to read) for the given counters,
+        all the counters of the P4 program if None"""
+        if counter_names is None:
+            infos = list(p4info_helper.p4info.counters)
+            # counter_id 0 reads every index of every counter
+            entity = p4runtime_pb2.Entity()
+            entity.counter_entry.counter_id = 0
+            return infos, [entity]
+        infos = [p4info_helper.get('counters', name=name) for name in counter_names]
+        entities = []
+        for info in infos:
+            entity = p4runtime_pb2.Entity()
+            entity.counter_entry.counter_id = info.preamble.id
+            entities.append(entity)
+        return infos, entities
+
+    @classmethod
+    def fromEntities(cls, timestamp, infos, entities, counter_names=None):
+        """Builds a snapshot of the counters of infos from the entities read
+        from a switch, other entities being ignored. counter_names are the
+        names the counters were asked by, kept as aliases."""
+        counters = {}
+        by_id = {}
+        for info in infos:
+            array = numpy.zeros((info.size, 2), dtype=numpy.uint64)
+            counters[info.preamble.name] = array
+            by_id[info.preamble.id] = array
+        unread = set(by_id)
+        for entity in entities:
+            counter = entity.counter_entry
+            array = by_id.get(counter.counter_id)
+            if array is None:
+                continue
+            unread.discard(counter.counter_id)
+            row = array[counter.index.index]
+            row[PACKETS] = counter.data.packet_count
+            row[BYTES] = counter.data.byte_count
+        missing = {info.preamble.name for info in infos if info.preamble.id in unread}
+        # Name given by the caller (e.g. an alias) -> full name
+        if counter_names is not None:
+            for name, info in zip(counter_names, infos):
+                counters[name] = counters[info.preamble.name]
+                if info.preamble.name in missing:
+                    missing.add(name)
+        return cls(timestamp, counters, missing)
+
+    @classmethod
+    def read(cls, sw, p4info_helper, counter_names=None):
+        """Reads the given counters (all the counters of the P4 program if
+        None) with one wildcard Read request."""
+        infos, entities = cls.readRequest(p4info_helper, counter_names)
+        timestamp = monotonic()
+        return cls.fromEntities(
+            timestamp, infos,
+            (entity for response in sw.ReadEntities(entities) for entity in response.entities),
+            counter_names)
+
+    def __getitem__(self, counter_name):
+        return self.counters[counter_name]
+
+    def packets(self, counter_name, index=None):
+        column = self.counters[counter_name][:, PACKETS]
+        return column if index is None else int(column[index])
+
+    def bytes(self, counter_name, index=None):
+        column = self.counters[counter_name][:, BYTES]
+        return column if index is None else int(column[index])
+
+    def delta(self, previous):
+        "Returns {counter name: counts since the previous snapshot}"
+        return {name: array.astype(numpy.int64) - previous.counters[name].astype(numpy.int64)
+                for name, array in self.counters.items() if name in previous.counters}
+
+    def rates(self, previous):
+        """Returns {counter name: packets and bytes per second since the
+        previous snapshot}, as float arrays of shape (size, 2)."""
+        elapsed = self.timestamp - previous.timestamp
+        if elapsed <= 0:
+            raise ValueError("previous snapshot is not older than this one")
+        return {name: delta / elapsed for name, delta in self.delta(previous).items()}
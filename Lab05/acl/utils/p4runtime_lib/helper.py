@@ -12,34 +12,158 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import hashlib
+import os
 import re
+import tempfile
 
+import google.protobuf.message
 import google.protobuf.text_format
 from p4.v1 import p4runtime_pb2
 from p4.config.v1 import p4info_pb2
 
-from .convert import encode
+from .convert import compileEncoder, encode
 
-class P4InfoHelper(object):
-    def __init__(self, p4_info_filepath):
+# Suffix of the binary P4Info cache stored next to the text file
+P4INFO_CACHE_SUFFIX = '.bin'
+
+# In-process memo: (path, mtime, size) -> P4Info, shared by all helpers
+_p4info_memo = {}
+
+def readP4InfoCache(cache_filepath, text, stat):
+    """Returns the P4Info stored in cache_filepath if it was built from the
+    given text, None otherwise. The content hash is only computed when the
+    mtime or size recorded in the cache differ from those of the text file."""
+    try:
+        with open(cache_filepath, 'rb') as f:
+            header = f.readline().split()
+            data = f.read()
+    except OSError:
+        return None
+    if len(header) != 3:
+        return None
+    digest, mtime, size = header
+    if (int(mtime), int(size)) != (stat.st_mtime_ns, stat.st_size) and \
+            digest.decode() != hashlib.sha256(text).hexdigest():
+        return None
+    p4info = p4info_pb2.P4Info()
+    try:
+        p4info.ParseFromString(data)
+    except google.protobuf.message.DecodeError:
+        return None
+    return p4info
+
+def writeP4InfoCache(cache_filepath, text, stat, p4info):
+    header = '%s %d %d\n' % (hashlib.sha256(text).hexdigest(),
+                             stat.st_mtime_ns, stat.st_size)
+    try:
+        # Write to a temporary file first so that readers never see a
+        # partially written cache
+        fd, tmp_filepath = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(cache_filepath)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header.encode())
+            f.write(p4info.SerializeToString())
+        os.replace(tmp_filepath, cache_filepath)
+    except OSError:
+        # The cache is only an optimization, e.g. the directory may be read-only
+        pass
+
+def loadP4Info(p4_info_filepath, cache=True):
+    """Loads a P4Info from its text format file.
+
+    Parsing the text format is slow, so the result is memoized in-process and,
+    when cache is True, stored in binary format next to the text file to be
+    reused by later runs. The returned P4Info may be shared: do not modify it.
+    """
+    stat = os.stat(p4_info_filepath)
+    key = (os.path.realpath(p4_info_filepath), stat.st_mtime_ns, stat.st_size)
+    p4info = _p4info_memo.get(key)
+    if p4info is not None:
+        return p4info
+
+    with open(p4_info_filepath, 'rb') as p4info_f:
+        text = p4info_f.read()
+    cache_filepath = p4_info_filepath + P4INFO_CACHE_SUFFIX
+    if cache:
+        p4info = readP4InfoCache(cache_filepath, text, stat)
+    if p4info is None:
         p4info = p4info_pb2.P4Info()
         # Load the p4info file into a skeleton P4Info object
-        with open(p4_info_filepath) as p4info_f:
-            google.protobuf.text_format.Merge(p4info_f.read(), p4info)
-        self.p4info = p4info
+        google.protobuf.text_format.Merge(text.decode('utf-8'), p4info)
+        if cache:
+            writeP4InfoCache(cache_filepath, text, stat, p4info)
+    _p4info_memo[key] = p4info
+    return p4info
+
+def indexFields(fields):
+    "Returns ({name: field}, {id: field}) for match fields or action params"
+    names = {}
+    ids = {}
+    for f in fields:
+        names.setdefault(f.name, f)
+        ids.setdefault(f.id, f)
+    return names, ids
+
+class P4InfoHelper(object):
+    def __init__(self, p4_info_filepath, cache=True):
+        self.p4info = loadP4Info(p4_info_filepath, cache=cache)
+
+    @property
+    def p4info(self):
+        return self._p4info
+
+    @p4info.setter
+    def p4info(self, p4info):
+        # Lookup tables are rebuilt whenever the P4Info object is swapped
+        self._p4info = p4info
+        self.buildIndex()
+
+    def buildIndex(self):
+        """Builds the name/alias/id dictionaries used by all lookups, so that
+        none of them has to scan the P4Info message."""
+        # entity_type -> {name or alias: entity} and {id: entity}
+        self._names = {}
+        self._ids = {}
+        for field in self._p4info.DESCRIPTOR.fields:
+            if field.message_type is None or \
+                    'preamble' not in field.message_type.fields_by_name:
+                continue
+            entities = getattr(self._p4info, field.name)
+            names = {}
+            ids = {}
+            for o in entities:
+                names.setdefault(o.preamble.name, o)
+                ids.setdefault(o.preamble.id, o)
+            # Full names take precedence over aliases
+            for o in entities:
+                if o.preamble.alias:
+                    names.setdefault(o.preamble.alias, o)
+            self._names[field.name] = names
+            self._ids[field.name] = ids
+
+        # table name or alias -> ({match field name: field}, {id: field})
+        self._match_fields = {
+            name: indexFields(t.match_fields)
+            for name, t in self._names['tables'].items()}
+        # action name or alias -> ({param name: param}, {id: param})
+        self._action_params = {
+            name: indexFields(a.params)
+            for name, a in self._names['actions'].items()}
 
     def get(self, entity_type, name=None, id=None):
         if name is not None and id is not None:
             raise AssertionError("name or id must be None")
 
-        for o in getattr(self.p4info, entity_type):
-            pre = o.preamble
-            if name:
-                if (pre.name == name or pre.alias == name):
-                    return o
-            else:
-                if pre.id == id:
-                    return o
+        if entity_type not in self._names:
+            raise AttributeError("P4Info has no entity type %r" % entity_type)
+
+        if name:
+            o = self._names[entity_type].get(name)
+        else:
+            o = self._ids[entity_type].get(id)
+        if o is not None:
+            return o
 
         if name:
             raise AttributeError("Could not find %r of type %s" % (name, entity_type))
@@ -73,16 +197,14 @@ class P4InfoHelper(object):
         raise AttributeError("%r object has no attribute %r" % (self.__class__, attr))
 
     def get_match_field(self, table_name, name=None, id=None):
-        for t in self.p4info.tables:
-            pre = t.preamble
-            if pre.name == table_name:
-                for mf in t.match_fields:
-                    if name is not None:
-                        if mf.name == name:
-                            return mf
-                    elif id is not None:
-                        if mf.id == id:
-                            return mf
+        index = self._match_fields.get(table_name)
+        if index is not None:
+            if name is not None:
+                mf = index[0].get(name)
+            else:
+                mf = index[1].get(id)
+            if mf is not None:
+                return mf
         raise AttributeError("%r has no attribute %r" % (table_name, name if name is not None else id))
 
     def get_match_field_id(self, table_name, match_field_name):
@@ -132,17 +254,18 @@ class P4InfoHelper(object):
             raise Exception("Unsupported match type with type %r" % match_type)
 
     def get_action_param(self, action_name, name=None, id=None):
-        for a in self.p4info.actions:
-            pre = a.preamble
-            if pre.name == action_name:
-                for p in a.params:
-                    if name is not None:
-                        if p.name == name:
-                            return p
-                    elif id is not None:
-                        if p.id == id:
-                            return p
-        raise AttributeError("action %r has no param %r, (has: %r)" % (action_name, name if name is not None else id, a.params))
+        index = self._action_params.get(action_name)
+        if index is not None:
+            if name is not None:
+                p = index[0].get(name)
+            else:
+                p = index[1].get(id)
+            if p is not None:
+                return p
+            params = list(index[0].values())
+        else:
+            params = []
+        raise AttributeError("action %r has no param %r, (has: %r)" % (action_name, name if name is not None else id, params))
 
     def get_action_param_id(self, action_name, param_name):
         return self.get_action_param(action_name, name=param_name).id
@@ -189,6 +312,86 @@ class P4InfoHelper(object):
                 ])
         return table_entry
 
+    def compile_table(self, table_name, action=None, match_fields=None,
+                      action_params=None, default_action=False):
+        """Returns a TableEntryEncoder building entries of table_name.
+
+        match_fields and action_params give the order in which values appear
+        in the rows passed to the encoder. They default to all the match
+        fields of the table and all the params of the action, in P4Info order.
+        """
+        return TableEntryEncoder(self, table_name, action=action,
+                                 match_fields=match_fields,
+                                 action_params=action_params,
+                                 default_action=default_action)
+
+    def buildPacketOut(self, payload, metadata=None):
+        """Builds a PacketOut message, metadata maps the names of the
+        packet_out header fields to their values"""
+        packet_out = p4runtime_pb2.PacketOut()
+        packet_out.payload = payload
+        if metadata:
+            header = self.get('controller_packet_metadata', name='packet_out')
+            fields = indexFields(header.metadata)[0]
+            for name, value in metadata.items():
+                field = fields[name]
+                m = packet_out.metadata.add()
+                m.metadata_id = field.id
+                m.value = encode(value, field.bitwidth)
+        return packet_out
+
+    def parsePacketIn(self, packet_in):
+        """Returns (payload, {metadata name: value bytes}) for a PacketIn"""
+        header = self.get('controller_packet_metadata', name='packet_in')
+        fields = indexFields(header.metadata)[1]
+        return packet_in.payload, {
+            fields[m.metadata_id].name: m.value for m in packet_in.metadata}
+
+    def buildDigestEntry(self, digest_name, max_timeout_ns=0, max_list_size=1,
+                         ack_timeout_ns=1000000000):
+        """Builds the DigestEntry configuring how the switch sends a digest:
+        a DigestList is sent when it holds max_list_size digests or its
+        oldest digest is max_timeout_ns old."""
+        digest_entry = p4runtime_pb2.DigestEntry()
+        digest_entry.digest_id = self.get_digests_id(digest_name)
+        digest_entry.config.max_timeout_ns = max_timeout_ns
+        digest_entry.config.max_list_size = max_list_size
+        digest_entry.config.ack_timeout_ns = ack_timeout_ns
+        return digest_entry
+
+    def get_digest_member_names(self, digest_id):
+        """Returns the names of the struct members of a digest, in order, or
+        the name of the digest itself for a bitstring digest"""
+        digest = self.get('digests', id=digest_id)
+        spec_type = digest.type_spec.WhichOneof('type_spec')
+        if spec_type == 'bitstring':
+            return [digest.preamble.name]
+        if spec_type != 'struct':
+            raise Exception("Unsupported type %r for digest %s" % (spec_type, digest.preamble.name))
+        struct_name = digest.type_spec.struct.name
+        return [m.name for m in self.p4info.type_info.structs[struct_name].members]
+
+    def parseDigest(self, digest_id, data, names=None):
+        """Returns {member name: value bytes} for a P4Data of a DigestList.
+
+        Only structs of bitstrings and single bitstrings are supported. names
+        are the digest member names, looked up when not given.
+        """
+        if names is None:
+            names = self.get_digest_member_names(digest_id)
+        data_type = data.WhichOneof('data')
+        if data_type == 'bitstring' and len(names) == 1:
+            return {names[0]: data.bitstring}
+        if data_type != 'struct' or len(data.struct.members) != len(names):
+            raise Exception("Unsupported digest data %r for digest members %r" % (data_type, names))
+        digest = {}
+        for name, member in zip(names, data.struct.members):
+            if member.WhichOneof('data') != 'bitstring':
+                raise Exception("Unsupported type %r for digest member %s" % (
+                    member.WhichOneof('data'), name))
+            digest[name] = member.bitstring
+        return digest
+
     def buildMulticastGroupEntry(self, multicast_group_id, replicas):
         mc_entry = p4runtime_pb2.PacketReplicationEngineEntry()
         mc_entry.multicast_group_entry.multicast_group_id = multicast_group_id
@@ -210,3 +413,112 @@ class P4InfoHelper(object):
             r.instance = replica['instance']
             clone_entry.clone_session_entry.replicas.extend([r])
         return clone_entry
+
+
+class TableEntryEncoder(object):
+    """Reusable encoder turning rows of values into TableEntry messages.
+
+    Table, match field and action param ids, bitwidths and match types are
+    resolved once when the encoder is created. A row is either a sequence
+    holding the match values followed by the action param values, in the
+    order given to P4InfoHelper.compile_table, or a dict keyed by match
+    field and param names. Match values use the same forms as
+    buildTableEntry: (value, prefix_len) for LPM, (value, mask) for ternary
+    and (low, high) for range matches.
+    """
+
+    def __init__(self, p4info_helper, table_name, action=None,
+                 match_fields=None, action_params=None, default_action=False):
+        table = p4info_helper.get('tables', name=table_name)
+        self.table_name = table_name
+        self.table_id = table.preamble.id
+        self.default_action = default_action
+
+        if match_fields is None:
+            match_fields = [] if default_action else [mf.name for mf in table.match_fields]
+        self.match_field_names = list(match_fields)
+        self.match_builders = [
+            self.compileMatchField(p4info_helper.get_match_field(table_name, name))
+            for name in self.match_field_names]
+
+        self.action_name = action
+        self.param_names = []
+        self.param_encoders = []
+        if action is not None:
+            action_info = p4info_helper.get('actions', name=action)
+            self.action_id = action_info.preamble.id
+            if action_params is None:
+                action_params = [p.name for p in action_info.params]
+            self.param_names = list(action_params)
+            for name in self.param_names:
+                p = p4info_helper.get_action_param(action, name)
+                self.param_encoders.append((p.id, compileEncoder(p.bitwidth)))
+        self.columns = self.match_field_names + self.param_names
+
+    @staticmethod
+    def compileMatchField(p4info_match):
+        "Returns a function filling a FieldMatch message from a match value"
+        field_id = p4info_match.id
+        enc = compileEncoder(p4info_match.bitwidth)
+        match_type = p4info_match.match_type
+        if match_type == p4info_pb2.MatchField.EXACT:
+            def build(m, v):
+                m.field_id = field_id
+                m.exact.value = enc(v)
+        elif match_type == p4info_pb2.MatchField.LPM:
+            def build(m, v):
+                m.field_id = field_id
+                lpm = m.lpm
+                lpm.value = enc(v[0])
+                lpm.prefix_len = v[1]
+        elif match_type == p4info_pb2.MatchField.TERNARY:
+            def build(m, v):
+                m.field_id = field_id
+                ternary = m.ternary
+                ternary.value = enc(v[0])
+                ternary.mask = enc(v[1])
+        elif match_type == p4info_pb2.MatchField.RANGE:
+            def build(m, v):
+                m.field_id = field_id
+                r = m.range
+                r.low = enc(v[0])
+                r.high = enc(v[1])
+        else:
+            raise Exception("Unsupported match type with type %r" % match_type)
+        return build
+
+    def encode(self, row, priority=None):
+        if isinstance(row, dict):
+            row = [row[name] for name in self.columns]
+        n_match = len(self.match_builders)
+        if len(row) != n_match + len(self.param_encoders):
+            raise ValueError("%s expects %d values per row (%s), got %d" % (
+                self.table_name, len(self.columns), ', '.join(self.columns), len(row)))
+
+        table_entry = p4runtime_pb2.TableEntry()
+        table_entry.table_id = self.table_id
+        if priority is not None:
+            table_entry.priority = priority
+        if n_match:
+            add_match = table_entry.match.add
+            for build, value in zip(self.match_builders, row):
+                build(add_match(), value)
+        if self.default_action:
+            table_entry.is_default_action = True
+        if self.action_name is not None:
+            action = table_entry.action.action
+            action.action_id = self.action_id
+            add_param = action.params.add
+            for (param_id, enc), value in zip(self.param_encoders, row[n_match:]):
+                param = add_param()
+                param.param_id = param_id
+                param.value = enc(value)
+        return table_entry
+
+    __call__ = encode
+
+    def encode_many(self, rows, priority=None):
+        "Yields one TableEntry per row"
+        encode = self.encode
+        for row in rows:
+            yield encode(row, priority)
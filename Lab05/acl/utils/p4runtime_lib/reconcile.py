@@ -0,0 +1,183 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from p4.v1 import p4runtime_pb2
+
+from .switch import WRITE_BATCH_MAX_SIZE, WriteBatchException
+
+'''
+Desired-state reconciliation of table entries.
+
+Instead of inserting every entry of a config (which fails on entries that
+are already installed), TableReconciler reads the entries of the switch
+once, diffs them against the desired entries and only writes the
+difference: INSERT for missing entries, MODIFY for entries with another
+action, DELETE for installed entries that are not desired anymore.
+
+Entries are matched by table, priority and match fields, and compared by
+action. Byte strings are compared without their leading zeros, since
+servers may return them in canonical (shortest) form.
+'''
+
+
+def canonical(value):
+    return value.lstrip(b'\x00')
+
+def matchKey(m):
+    match_type = m.WhichOneof('field_match_type')
+    if match_type == 'exact':
+        return (m.field_id, canonical(m.exact.value))
+    elif match_type == 'lpm':
+        return (m.field_id, canonical(m.lpm.value), m.lpm.prefix_len)
+    elif match_type == 'ternary':
+        return (m.field_id, canonical(m.ternary.value), canonical(m.ternary.mask))
+    elif match_type == 'range':
+        return (m.field_id, canonical(m.range.low), canonical(m.range.high))
+    elif match_type == 'optional':
+        return (m.field_id, canonical(m.optional.value))
+    return (m.field_id, m.SerializeToString(deterministic=True))
+
+def tableEntryKey(table_entry):
+    """Identifies a table entry by table, priority and match fields, in any
+    order. All the default entries of a table share the same key."""
+    if table_entry.is_default_action:
+        return (table_entry.table_id, 'default')
+    return (table_entry.table_id, table_entry.priority,
+            tuple(sorted(matchKey(m) for m in table_entry.match)))
+
+def tableEntryValue(table_entry):
+    "What has to be modified when it differs between two entries of the same key"
+    action = table_entry.action
+    action_type = action.WhichOneof('type')
+    if action_type == 'action':
+        value = (action.action.action_id,
+                 tuple(sorted((p.param_id, canonical(p.value)) for p in action.action.params)))
+    elif action_type is None:
+        value = None
+    else:
+        value = getattr(action, action_type)
+        if not isinstance(value, int):
+            value = value.SerializeToString(deterministic=True)
+    return (action_type, value, table_entry.idle_timeout_ns, table_entry.metadata)
+
+
+class TableReconciler(object):
+    """Brings the table entries of a switch to a desired state.
+
+    Only the tables listed in `tables` (names or ids) are reconciled: their
+    entries that are not desired are deleted. When tables is None, the
+    tables having at least one desired entry are reconciled.
+    """
+
+    def __init__(self, sw, p4info_helper, tables=None,
+                 max_batch_size=WRITE_BATCH_MAX_SIZE):
+        self.sw = sw
+        self.p4info_helper = p4info_helper
+        self.max_batch_size = max_batch_size
+        self.table_ids = None
+        if tables is not None:
+            self.table_ids = set(t if isinstance(t, int) else p4info_helper.get_tables_id(t)
+                                 for t in tables)
+
+    def readCurrent(self, table_ids, default_table_ids=()):
+        """Returns {key: table entry} for the installed entries of the given
+        tables, and for the default entries of default_table_ids, read with
+        a single Read request."""
+        entities = []
+        for table_id in sorted(table_ids):
+            entity = p4runtime_pb2.Entity()
+            entity.table_entry.table_id = table_id
+            entities.append(entity)
+        for table_id in sorted(default_table_ids):
+            entity = p4runtime_pb2.Entity()
+            entity.table_entry.table_id = table_id
+            entity.table_entry.is_default_action = True
+            entities.append(entity)
+        current = {}
+        if not entities:
+            return current
+        for response in self.sw.ReadEntities(entities):
+            for entity in response.entities:
+                if entity.HasField('table_entry'):
+                    current[tableEntryKey(entity.table_entry)] = entity.table_entry
+        return current
+
+    def diff(self, desired_entries):
+        """Returns (inserts, modifies, deletes, unchanged): the entries to
+        write with each update type, and the number of desired entries that
+        are already installed."""
+        desired = {}
+        for table_entry in desired_entries:
+            # A later entry with the same key replaces an earlier one
+            desired[tableEntryKey(table_entry)] = table_entry
+
+        table_ids = self.table_ids
+        if table_ids is None:
+            table_ids = set(e.table_id for e in desired.values() if not e.is_default_action)
+        default_table_ids = set(e.table_id for e in desired.values() if e.is_default_action)
+        current = self.readCurrent(table_ids, default_table_ids)
+
+        inserts = []
+        modifies = []
+        unchanged = 0
+        for key, table_entry in desired.items():
+            installed = current.get(key)
+            if installed is None:
+                # Default entries always exist, they can only be modified
+                if table_entry.is_default_action:
+                    modifies.append(table_entry)
+                else:
+                    inserts.append(table_entry)
+            elif tableEntryValue(installed) != tableEntryValue(table_entry):
+                modifies.append(table_entry)
+            else:
+                unchanged += 1
+        deletes = [table_entry for key, table_entry in current.items()
+                   if key not in desired and not table_entry.is_default_action]
+        return inserts, modifies, deletes, unchanged
+
+    def apply(self, desired_entries, dry_run=False):
+        """Writes the minimal updates making the installed entries match
+        desired_entries, and returns the number of entries of each kind.
+        Raises WriteBatchException, once all the updates were sent, when some
+        of them failed (indexes count deletes, then modifies, then inserts),
+        or as soon as a WriteRequest could not be sent at all."""
+        inserts, modifies, deletes, unchanged = self.diff(desired_entries)
+        batch = self.sw.WriteBatch(max_batch_size=self.max_batch_size, dry_run=dry_run)
+        errors = []
+        # Deletes go first and separately, so that they free table space
+        # before the inserts: updates of one WriteRequest can be applied in
+        # any order
+        for table_entry in deletes:
+            batch.DeleteTableEntry(table_entry)
+        try:
+            batch.Flush()
+        except WriteBatchException as e:
+            if e.cause is not None:
+                raise
+            errors += e.errors
+        for table_entry in modifies:
+            batch.ModifyTableEntry(table_entry)
+        for table_entry in inserts:
+            batch.InsertTableEntry(table_entry)
+        try:
+            batch.Flush()
+        except WriteBatchException as e:
+            if e.cause is not None:
+                raise WriteBatchException(errors + e.errors, e.unsent, e.cause) from e.cause
+            errors += e.errors
+        if errors:
+            raise WriteBatchException(errors)
+        return {'insert': len(inserts), 'modify': len(modifies),
+                'delete': len(deletes), 'unchanged': unchanged}
@@ -0,0 +1,192 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import argparse
+import struct
+import sys
+import time
+
+from p4.v1 import p4runtime_pb2
+
+'''
+Binary P4Runtime request log, written by GrpcRequestLogger when the dump file
+name ends with BINARY_LOG_SUFFIX, and a tool to read it and replay it.
+
+The file starts with MAGIC and the time the log was created (float64, seconds
+since the epoch). Each request is then stored as a record: timestamp
+(float64), method id (uint8), length of the request (uint32), followed by the
+request serialized in binary protobuf format. All integers are little endian.
+Unlike the text log, requests are never truncated.
+
+The tool is run as a module, from the directory holding p4runtime_lib:
+
+    python3 -m p4runtime_lib.request_log [-a ADDR] log.p4rtlog
+'''
+
+MAGIC = b'P4RTLOG1'
+HEADER = struct.Struct('<d')
+RECORD = struct.Struct('<dBI')
+BINARY_LOG_SUFFIX = '.p4rtlog'
+
+# method id -> (method name, request message class)
+METHODS = {
+    1: ('/p4.v1.P4Runtime/Write', p4runtime_pb2.WriteRequest),
+    2: ('/p4.v1.P4Runtime/Read', p4runtime_pb2.ReadRequest),
+    3: ('/p4.v1.P4Runtime/SetForwardingPipelineConfig',
+        p4runtime_pb2.SetForwardingPipelineConfigRequest),
+    4: ('/p4.v1.P4Runtime/GetForwardingPipelineConfig',
+        p4runtime_pb2.GetForwardingPipelineConfigRequest),
+    5: ('/p4.v1.P4Runtime/Capabilities', p4runtime_pb2.CapabilitiesRequest),
+}
+METHOD_IDS = {name: method_id for method_id, (name, _) in METHODS.items()}
+
+
+class RequestLogFormatException(Exception):
+    pass
+
+
+def isBinaryLog(log_file):
+    return log_file.endswith(BINARY_LOG_SUFFIX)
+
+def methodShortName(method_name):
+    return method_name.rsplit('/', 1)[-1]
+
+def writeHeader(f, created=None):
+    f.write(MAGIC)
+    f.write(HEADER.pack(time.time() if created is None else created))
+
+def writeRecord(f, timestamp, method_name, body):
+    method_id = METHOD_IDS.get(method_name)
+    if method_id is None:
+        return False
+    data = body.SerializeToString()
+    f.write(RECORD.pack(timestamp, method_id, len(data)))
+    f.write(data)
+    return True
+
+def readRecords(log_file, methods=None, start=None, end=None):
+    """Yields (timestamp, method name, request) for the requests of a binary
+    log. methods restricts the output to the given method names (full or
+    short, e.g. 'Write'), start and end to requests sent in [start, end)
+    seconds after the log was created."""
+    if methods is not None:
+        methods = set(methodShortName(m) for m in methods)
+    with open(log_file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise RequestLogFormatException("%s is not a binary request log" % log_file)
+        created, = HEADER.unpack(f.read(HEADER.size))
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                # end of file, or record truncated by an interrupted writer
+                return
+            timestamp, method_id, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            if method_id not in METHODS:
+                raise RequestLogFormatException("unknown method id %d" % method_id)
+            offset = timestamp - created
+            if start is not None and offset < start:
+                continue
+            if end is not None and offset >= end:
+                return
+            method_name, request_class = METHODS[method_id]
+            if methods is not None and methodShortName(method_name) not in methods:
+                continue
+            request = request_class()
+            request.ParseFromString(data)
+            yield timestamp, method_name, request
+
+
+def sendRequest(client_stub, method_name, request):
+    rpc = getattr(client_stub, methodShortName(method_name))
+    response = rpc(request)
+    if methodShortName(method_name) == 'Read':
+        # Read is server streaming, drain the responses
+        for _ in response:
+            pass
+
+def replay(sw, records, speed=None):
+    """Sends logged requests to the switch of connection sw, rewriting their
+    device id. With speed=None requests are sent back to back, otherwise the
+    original gaps between requests are kept, divided by speed. Returns the
+    number of requests sent."""
+    count = 0
+    first = None
+    replay_start = time.monotonic()
+    for timestamp, method_name, request in records:
+        if speed is not None:
+            if first is None:
+                first = timestamp
+            delay = (timestamp - first) / speed - (time.monotonic() - replay_start)
+            if delay > 0:
+                time.sleep(delay)
+        if hasattr(request, 'device_id'):
+            request.device_id = sw.device_id
+        sendRequest(sw.client_stub, method_name, request)
+        count += 1
+    return count
+
+
+def dump(records):
+    for timestamp, method_name, request in records:
+        ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
+        print("[%s.%03d] %s (%d bytes)" % (ts, int(timestamp * 1000) % 1000,
+                                           method_name, request.ByteSize()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='P4Runtime binary request log tool')
+    parser.add_argument('log_file', help='binary request log (*%s)' % BINARY_LOG_SUFFIX,
+                        type=str)
+    parser.add_argument('-m', '--method', help='only use requests of this method (e.g. Write), can be repeated',
+                        type=str, action="append")
+    parser.add_argument('--start', help='skip requests sent less than START seconds after the log was created',
+                        type=float, action="store")
+    parser.add_argument('--end', help='skip requests sent END seconds or more after the log was created',
+                        type=float, action="store")
+    parser.add_argument('-a', '--p4runtime-server-addr',
+                        help='replay the requests to this P4Runtime server (e.g. 127.0.0.1:50051), '
+                             'otherwise print them',
+                        type=str, action="store")
+    parser.add_argument('-d', '--device-id', help='device ID of the switch to replay to',
+                        type=int, action="store", default=0)
+    parser.add_argument('-s', '--speed', help='replay at SPEED times the original rate, '
+                                              'as fast as possible if not set',
+                        type=float, action="store")
+    args = parser.parse_args()
+
+    records = readRecords(args.log_file, methods=args.method,
+                          start=args.start, end=args.end)
+    if args.p4runtime_server_addr is None:
+        dump(records)
+        return
+
+    from .switch import SwitchConnection, ShutdownAllSwitchConnections
+    sw = SwitchConnection(address=args.p4runtime_server_addr,
+                          device_id=args.device_id)
+    try:
+        sw.MasterArbitrationUpdate()
+        start = time.monotonic()
+        count = replay(sw, records, speed=args.speed)
+        elapsed = time.monotonic() - start
+        print("Replayed %d requests in %.3fs (%.1f requests/s)" % (
+            count, elapsed, count / elapsed if elapsed > 0 else 0), file=sys.stderr)
+    finally:
+        ShutdownAllSwitchConnections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import itertools
+import json
+import re
+
+'''
+Streaming reader of runtime configuration files.
+
+A runtime configuration is read as a header (target, p4info, bmv2_json...)
+followed by a stream of entries, so that configurations with millions of
+entries never have to be held in memory. Two formats are accepted:
+
+- the usual JSON object (sN-runtime.json), parsed incrementally: the
+  elements of its entry lists are decoded one at a time;
+- JSON Lines (*.jsonl): the first line is the header object, every other
+  line is an entry, whose kind is given by its keys ("table",
+  "multicast_group_id" or "clone_session_id").
+'''
+
+ENTRY_LISTS = ('table_entries', 'multicast_group_entries', 'clone_session_entries')
+# Keys the entries of each list are recognized by in JSON Lines files
+ENTRY_KEYS = (('table', 'table_entries'),
+              ('multicast_group_id', 'multicast_group_entries'),
+              ('clone_session_id', 'clone_session_entries'))
+HEADER_KEYS = ('target', 'p4info', 'bmv2_json')
+JSONL_SUFFIX = '.jsonl'
+READ_SIZE = 1 << 16 # characters
+# Characters a JSON number may still continue with
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+
+class RuntimeConfFormatException(Exception):
+    pass
+
+
+class JsonStream(object):
+    "Incremental tokenizer over a text file object"
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        "Reads more of the file, returns False at end of file"
+        if self.eof:
+            return False
+        data = self.f.read(READ_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        # Drop what was already parsed
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        "Returns the next non whitespace character, '' at end of file"
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if c not in chars or c == '':
+            raise RuntimeConfFormatException(
+                "expected %s, found %r" % (' or '.join(repr(x) for x in chars), c or 'end of file'))
+        self.pos += 1
+        return c
+
+    def value(self):
+        "Decodes the next JSON value"
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if not self.fill():
+                    raise RuntimeConfFormatException(str(e))
+                continue
+            # A number may continue past the end of the buffer, e.g. 1.5e3
+            # read as 1 or 1.5 when the buffer ends after '1.' or '1.5e'
+            if NUMBER_TAIL.fullmatch(self.buf, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iterJson(f):
+    """Yields (key, value) for the members of the JSON object of file f, and
+    (list name, entry) for each element of the ENTRY_LISTS members."""
+    stream = JsonStream(f)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        if not isinstance(key, str):
+            raise RuntimeConfFormatException("expected an object key, found %r" % (key,))
+        stream.expect(':')
+        if key in ENTRY_LISTS and stream.peek() == '[':
+            stream.expect('[')
+            if stream.peek() != ']':
+                while True:
+                    yield key, stream.value()
+                    if stream.expect(',]') == ']':
+                        break
+            else:
+                stream.expect(']')
+        else:
+            yield key, stream.value()
+        if stream.expect(',}') == '}':
+            return
+
+def iterJsonLines(f):
+    "Same as iterJson, for a JSON Lines runtime configuration"
+    lines = (line for line in f if line.strip())
+    header = next(lines, None)
+    if header is None:
+        return
+    for key, value in json.loads(header).items():
+        if key in ENTRY_LISTS:
+            for entry in value:
+                yield key, entry
+        else:
+            yield key, value
+    for line in lines:
+        entry = json.loads(line)
+        for entry_key, list_name in ENTRY_KEYS:
+            if entry_key in entry:
+                yield list_name, entry
+                break
+        else:
+            raise RuntimeConfFormatException("unknown entry %s" % line.strip())
+
+def isJsonLines(f):
+    return getattr(f, 'name', '').endswith(JSONL_SUFFIX)
+
+def readRuntimeConf(f):
+    """Returns (sw_conf, entries) for the runtime configuration file f:
+    sw_conf is the dict of its members other than entry lists, entries an
+    iterator of (list name, entry), read from f as it is consumed.
+
+    The header is normally written before the entries. Otherwise the
+    entries met before the end of the header have to be kept in memory.
+    """
+    items = iterJsonLines(f) if isJsonLines(f) else iterJson(f)
+    sw_conf = {}
+    for key, value in items:
+        if key in ENTRY_LISTS:
+            pending = [(key, value)]
+            break
+        sw_conf[key] = value
+    else:
+        return sw_conf, iter(())
+
+    if any(k not in sw_conf for k in HEADER_KEYS if k != 'bmv2_json' or
+           sw_conf.get('target', 'bmv2') == 'bmv2'):
+        for key, value in items:
+            if key in ENTRY_LISTS:
+                pending.append((key, value))
+            else:
+                sw_conf[key] = value
+        return sw_conf, iter(pending)
+    return sw_conf, itertools.chain(pending, items)
@@ -19,8 +19,20 @@ import json
 import os
 import sys
 
+from google.rpc import code_pb2
+from p4.v1 import p4runtime_pb2
+
 from . import bmv2
 from . import helper
+from .compiled_conf import (isCompiledConf, readCompiledConf, p4infoDigest,
+                            CompiledConfFormatException)
+from .reconcile import TableReconciler
+from .runtime_conf import readRuntimeConf, RuntimeConfFormatException
+from .switch import WriteBatchException
+
+
+# Entries of each kind logged one by one, the others are only counted
+LOG_MAX_ENTRIES = 100
 
 
 def error(msg):
@@ -49,6 +61,10 @@ def main():
     parser.add_argument("-c", '--runtime-conf-file',
                         help="path to input runtime configuration file (JSON)",
                         type=str, action="store", required=True)
+    parser.add_argument('-r', '--reconcile',
+                        help='keep the pipeline config if already installed, and only write '
+                             'the table entries that differ from the runtime configuration',
+                        action="store_true", default=False)
 
     args = parser.parse_args()
 
@@ -60,7 +76,8 @@ def main():
                        device_id=args.device_id,
                        sw_conf_file=sw_conf_file,
                        workdir=workdir,
-                       proto_dump_fpath=args.proto_dump_file)
+                       proto_dump_fpath=args.proto_dump_file,
+                       reconcile=args.reconcile)
 
 
 def check_switch_conf(sw_conf, workdir):
@@ -88,17 +105,37 @@ def check_switch_conf(sw_conf, workdir):
             raise ConfException("file does not exist %s" % real_path)
 
 
-def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath):
-    sw_conf = json_load_byteified(sw_conf_file)
+def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath,
+                   reconcile=False):
+    """Programs a switch with a runtime configuration.
+
+    With reconcile, the pipeline config is only pushed if another one is
+    installed, and the installed table entries are brought to the state of
+    the configuration (see TableReconciler) instead of being inserted.
+
+    Entries are read from the file as they are written (see runtime_conf),
+    encoding overlapping the Write RPCs, so that memory use does not grow
+    with the number of entries (except for the table entries reconciled).
+    Compiled configurations (see compiled_conf) are sent as they are.
+    """
+    compiled = isCompiledConf(sw_conf_file)
     try:
+        if compiled:
+            sw_conf, p4info_digest, requests = readCompiledConf(sw_conf_file)
+        else:
+            sw_conf, entries = readRuntimeConf(sw_conf_file)
         check_switch_conf(sw_conf=sw_conf, workdir=workdir)
-    except ConfException as e:
+    except (ConfException, RuntimeConfFormatException, CompiledConfFormatException) as e:
         error("While parsing input runtime configuration: %s" % str(e))
         return
 
     info('Using P4Info file %s...' % sw_conf['p4info'])
     p4info_fpath = os.path.join(workdir, sw_conf['p4info'])
     p4info_helper = helper.P4InfoHelper(p4info_fpath)
+    if compiled and p4infoDigest(p4info_helper.p4info) != p4info_digest:
+        error("Runtime configuration was compiled with another P4Info than %s, "
+              "it has to be compiled again" % sw_conf['p4info'])
+        return
 
     target = sw_conf['target']
 
@@ -116,37 +153,102 @@ def program_switch(addr, device_id, sw_conf_file, workdir, proto_dump_fpath):
         if target == "bmv2":
             info("Setting pipeline config (%s)..." % sw_conf['bmv2_json'])
             bmv2_json_fpath = os.path.join(workdir, sw_conf['bmv2_json'])
-            sw.SetForwardingPipelineConfig(p4info=p4info_helper.p4info,
-                                           bmv2_json_file_path=bmv2_json_fpath)
+            if not sw.SetForwardingPipelineConfig(p4info=p4info_helper.p4info,
+                                                  bmv2_json_file_path=bmv2_json_fpath,
+                                                  skip_if_installed=reconcile):
+                info("Pipeline config already installed, keeping it")
         else:
             raise Exception("Should not be here")
 
-        if 'table_entries' in sw_conf:
-            table_entries = sw_conf['table_entries']
-            info("Inserting %d table entries..." % len(table_entries))
-            for entry in table_entries:
-                info(tableEntryToString(entry))
-                insertTableEntry(sw, entry, p4info_helper)
-
-        if 'multicast_group_entries' in sw_conf:
-            group_entries = sw_conf['multicast_group_entries']
-            info("Inserting %d group entries..." % len(group_entries))
-            for entry in group_entries:
-                info(groupEntryToString(entry))
-                insertMulticastGroupEntry(sw, entry, p4info_helper)
-
-        if 'clone_session_entries' in sw_conf:
-            clone_entries = sw_conf['clone_session_entries']
-            info("Inserting %d clone entries..." % len(clone_entries))
-            for entry in clone_entries:
-                info(cloneEntryToString(entry))
-                insertCloneGroupEntry(sw, entry, p4info_helper)
+        # All entries are sent to the switch in as few Write RPCs as
+        # possible, each one as soon as it is full
+        batch = sw.PipelinedWriteBatch()
+        desired = []
+
+        if compiled:
+            info("Writing compiled updates...")
+            updates = 0
+            for request in requests:
+                updates += len(request.updates)
+                if not reconcile:
+                    batch.AddUpdates(request.updates)
+                    continue
+                for update in request.updates:
+                    if update.entity.HasField('table_entry'):
+                        desired.append(update.entity.table_entry)
+                    else:
+                        batch.AddUpdates([update])
+            info("Read %d updates" % updates)
+        else:
+            info("Inserting entries...")
+            counts = {'table_entries': 0, 'multicast_group_entries': 0,
+                      'clone_session_entries': 0}
+            for key, entry in entries:
+                counts[key] += 1
+                if key == 'table_entries':
+                    if counts[key] <= LOG_MAX_ENTRIES:
+                        info(tableEntryToString(entry))
+                    if reconcile:
+                        desired.append(buildTableEntry(entry, p4info_helper))
+                    else:
+                        insertTableEntry(batch, entry, p4info_helper)
+                elif key == 'multicast_group_entries':
+                    if counts[key] <= LOG_MAX_ENTRIES:
+                        info(groupEntryToString(entry))
+                    insertMulticastGroupEntry(batch, entry, p4info_helper)
+                else:
+                    if counts[key] <= LOG_MAX_ENTRIES:
+                        info(cloneEntryToString(entry))
+                    insertCloneGroupEntry(batch, entry, p4info_helper)
+            for key, count in counts.items():
+                if count > LOG_MAX_ENTRIES:
+                    info("(%d more %s not shown)" % (count - LOG_MAX_ENTRIES, key.replace('_', ' ')))
+            info("Read %d table entries, %d group entries, %d clone entries" % (
+                counts['table_entries'], counts['multicast_group_entries'],
+                counts['clone_session_entries']))
+
+        if reconcile and desired:
+            info("Reconciling %d table entries..." % len(desired))
+            try:
+                stats = TableReconciler(sw, p4info_helper).apply(desired)
+            except WriteBatchException as e:
+                for idx, update, p4_error in e.errors:
+                    error("%s of entry %d failed: %s" % (
+                        p4runtime_pb2.Update.Type.Name(update.type), idx, p4_error.message))
+                raise
+            info("%(insert)d inserted, %(modify)d modified, %(delete)d deleted, "
+                 "%(unchanged)d unchanged" % stats)
+
+        try:
+            batch.Flush()
+        except WriteBatchException as e:
+            errors = e.errors
+            if e.cause is not None:
+                for idx, update, p4_error in errors:
+                    error("Write of entry %d failed: %s" % (idx, p4_error.message))
+                error("%d entries not written: %s" % (len(e.unsent), e.cause))
+                raise
+            if reconcile:
+                # Groups and sessions left by a previous run are modified
+                for idx, update, p4_error in errors:
+                    if p4_error.canonical_code == code_pb2.ALREADY_EXISTS:
+                        batch.ModifyPREEntry(update.entity.packet_replication_engine_entry)
+                errors = [err for err in errors
+                          if err[2].canonical_code != code_pb2.ALREADY_EXISTS]
+                try:
+                    batch.Flush()
+                except WriteBatchException as retry:
+                    errors += retry.errors
+            for idx, update, p4_error in errors:
+                error("Write of entry %d failed: %s" % (idx, p4_error.message))
+            if errors:
+                raise WriteBatchException(errors)
 
     finally:
         sw.shutdown()
 
 
-def insertTableEntry(sw, flow, p4info_helper):
+def buildTableEntry(flow, p4info_helper):
     table_name = flow['table']
     match_fields = flow.get('match') # None if not found
     action_name = flow['action_name']
@@ -154,7 +256,7 @@ def insertTableEntry(sw, flow, p4info_helper):
     action_params = flow['action_params']
     priority = flow.get('priority')  # None if not found
 
-    table_entry = p4info_helper.buildTableEntry(
+    return p4info_helper.buildTableEntry(
         table_name=table_name,
         match_fields=match_fields,
         default_action=default_action,
@@ -162,7 +264,9 @@ def insertTableEntry(sw, flow, p4info_helper):
         action_params=action_params,
         priority=priority)
 
-    sw.WriteTableEntry(table_entry)
+
+def insertTableEntry(sw, flow, p4info_helper):
+    sw.WriteTableEntry(buildTableEntry(flow, p4info_helper))
 
 
 def json_load_byteified(file_handle):
@@ -228,6 +332,27 @@ def insertCloneGroupEntry(sw, rule, p4info_helper):
                                                        rule.get('packet_length_bytes', 0))
     sw.WritePREEntry(clone_entry)
 
+def buildEntryUpdate(list_name, entry, p4info_helper):
+    """Returns the Update message program_switch sends for an entry of the
+    list_name list of a runtime configuration"""
+    update = p4runtime_pb2.Update()
+    update.type = p4runtime_pb2.Update.INSERT
+    if list_name == 'table_entries':
+        table_entry = buildTableEntry(entry, p4info_helper)
+        if table_entry.is_default_action:
+            update.type = p4runtime_pb2.Update.MODIFY
+        update.entity.table_entry.CopyFrom(table_entry)
+    elif list_name == 'multicast_group_entries':
+        update.entity.packet_replication_engine_entry.CopyFrom(
+            p4info_helper.buildMulticastGroupEntry(entry["multicast_group_id"], entry['replicas']))
+    elif list_name == 'clone_session_entries':
+        update.entity.packet_replication_engine_entry.CopyFrom(
+            p4info_helper.buildCloneSessionEntry(entry['clone_session_id'], entry['replicas'],
+                                                 entry.get('packet_length_bytes', 0)))
+    else:
+        raise ConfException("unknown entry list '%s'" % list_name)
+    return update
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,204 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+
+from p4.config.v1 import p4info_pb2
+from p4.v1 import p4runtime_pb2
+
+'''
+Reading and decoding the table entries of a switch.
+
+TableReader resolves every table, match field, action and action param id
+of the P4Info once, then decodes the entries of Read responses as they are
+streamed, into records:
+
+    {'table': 'MyIngress.ipv4_lpm', 'priority': 0,
+     'match': {'hdr.ipv4.dstAddr': (b'\\n\\x00\\x01\\x01', 32)},
+     'action': 'MyIngress.ipv4_forward',
+     'params': {'dstAddr': b'\\x08\\x00\\x00\\x00\\x01\\x11', 'port': b'\\x00\\x01'}}
+
+Match values have the same form as P4InfoHelper.get_match_field_value:
+bytes for exact matches, (value, prefix_len) for LPM, (value, mask) for
+ternary and (low, high) for range matches. Entries using an action profile
+have action None and an 'action_profile_member_id' or
+'action_profile_group_id' key instead of params, or for one-shot action
+selector programming an 'action_profile_action_set' key holding the list
+of {'action', 'params', 'weight'} of its actions.
+'''
+
+# Match type -> function returning the value of a FieldMatch
+MATCH_VALUE_GETTERS = {
+    p4info_pb2.MatchField.EXACT: lambda m: m.exact.value,
+    p4info_pb2.MatchField.LPM: lambda m: (m.lpm.value, m.lpm.prefix_len),
+    p4info_pb2.MatchField.TERNARY: lambda m: (m.ternary.value, m.ternary.mask),
+    p4info_pb2.MatchField.RANGE: lambda m: (m.range.low, m.range.high),
+    p4info_pb2.MatchField.OPTIONAL: lambda m: m.optional.value,
+}
+
+
+def jsonValue(o):
+    "json.dumps default hook: byte strings are written as hex strings"
+    if isinstance(o, bytes):
+        return '0x' + o.hex()
+    raise TypeError("Object of type %s is not JSON serializable" % type(o).__name__)
+
+
+class TableReader(object):
+    """Streams and decodes the table entries of switches.
+
+    tables, where accepted, restricts the read to the given table names (or
+    aliases) or ids, filtered by the switch. When it is None, all the
+    tables are read with a single wildcard entity.
+    """
+
+    def __init__(self, p4info_helper):
+        self.p4info_helper = p4info_helper
+        # table id -> (table name, {match field id: (name, value getter)})
+        self.tables = {}
+        for table in p4info_helper.p4info.tables:
+            self.tables[table.preamble.id] = (table.preamble.name, {
+                mf.id: (mf.name, MATCH_VALUE_GETTERS.get(mf.match_type))
+                for mf in table.match_fields})
+        # action id -> (action name, {param id: param name})
+        self.actions = {}
+        for action in p4info_helper.p4info.actions:
+            self.actions[action.preamble.id] = (
+                action.preamble.name, {p.id: p.name for p in action.params})
+
+    def tableIds(self, tables):
+        ids = []
+        for table in tables:
+            if isinstance(table, int):
+                ids.append(table)
+            else:
+                ids.append(self.p4info_helper.get_tables_id(table))
+        return ids
+
+    def read(self, sw, tables=None):
+        "Yields the TableEntry messages of the switch, as they are received"
+        entities = []
+        for table_id in self.tableIds(tables) if tables is not None else [0]:
+            entity = p4runtime_pb2.Entity()
+            # table_id 0 reads the entries of every table
+            entity.table_entry.table_id = table_id
+            entities.append(entity)
+        for response in sw.ReadEntities(entities):
+            for entity in response.entities:
+                if entity.HasField('table_entry'):
+                    yield entity.table_entry
+
+    def decode(self, table_entry):
+        "Returns the record of a TableEntry"
+        table = self.tables.get(table_entry.table_id)
+        if table is None:
+            raise AttributeError("Could not find id %r of type tables" % table_entry.table_id)
+        table_name, match_fields = table
+
+        match = {}
+        for m in table_entry.match:
+            name, get_value = match_fields.get(m.field_id, (m.field_id, None))
+            if get_value is None:
+                match[name] = self.p4info_helper.get_match_field_value(m)
+            else:
+                match[name] = get_value(m)
+
+        record = {'table': table_name, 'priority': table_entry.priority,
+                  'match': match, 'action': None, 'params': {}}
+        action_type = table_entry.action.WhichOneof('type')
+        if action_type == 'action':
+            record['action'], record['params'] = self.decodeAction(table_entry.action.action)
+        elif action_type == 'action_profile_action_set':
+            actions = []
+            for profile_action in table_entry.action.action_profile_action_set.action_profile_actions:
+                action_name, params = self.decodeAction(profile_action.action)
+                actions.append({'action': action_name, 'params': params,
+                                'weight': profile_action.weight})
+            record[action_type] = actions
+        elif action_type is not None:
+            record[action_type] = getattr(table_entry.action, action_type)
+        return record
+
+    def decodeAction(self, action):
+        "Returns (action name, {param name: value}) of an Action message"
+        action_info = self.actions.get(action.action_id)
+        if action_info is None:
+            raise AttributeError("Could not find id %r of type actions" % action.action_id)
+        action_name, params = action_info
+        return action_name, {params.get(p.param_id, p.param_id): p.value
+                             for p in action.params}
+
+    def records(self, sw, tables=None):
+        "Yields the records of the table entries of the switch"
+        decode = self.decode
+        for table_entry in self.read(sw, tables):
+            yield decode(table_entry)
+
+    def to_json(self, sw, f, tables=None):
+        """Writes the records to the file object f as JSON lines, byte
+        strings being written as hex strings. Returns the number of entries"""
+        count = 0
+        for record in self.records(sw, tables):
+            f.write(json.dumps(record, default=jsonValue))
+            f.write('\n')
+            count += 1
+        return count
+
+    def columns(self, sw, tables=None):
+        """Reads the entries into columns: returns {table name: {column:
+        list of values}}, with the columns 'priority', one per match field,
+        'action' and one per action param (None for the entries whose
+        action has no such param). Each table can be given to
+        pandas.DataFrame as is."""
+        result = {}
+        for record in self.records(sw, tables):
+            table = result.get(record['table'])
+            if table is None:
+                table = result[record['table']] = {'priority': [], 'action': []}
+            n = len(table['priority'])
+            for values in (record['match'], record['params']):
+                for name, value in values.items():
+                    column = table.get(name)
+                    if column is None:
+                        column = table[name] = [None] * n
+                    column.append(value)
+            table['priority'].append(record['priority'])
+            table['action'].append(record['action'])
+            # Pad the columns this entry has no value for
+            n += 1
+            for column in table.values():
+                if len(column) < n:
+                    column.append(None)
+        return result
+
+
+def printTableRules(p4info_helper, sw, tables=None):
+    """Prints the table entries of the switch, in the format of the
+    readTableRules functions of the lab controllers"""
+    for record in TableReader(p4info_helper).records(sw, tables):
+        print("%s:" % record['table'])
+        for match_name, value in record['match'].items():
+            print("%s" % match_name)
+            print("(match_type:%r)" % (value,))
+        for action in record.get('action_profile_action_set', [record]):
+            if action['action'] is None:
+                continue
+            print("-> %s" % action['action'])
+            for params_name, value in action['params'].items():
+                print(" %s" % params_name)
+                print("(param_value:%r)" % value)
+        for key in ('action_profile_member_id', 'action_profile_group_id'):
+            if key in record:
+                print("-> %s %d" % (key, record[key]))
+        print()
@@ -20,7 +20,8 @@
 # environment used by the P4 tutorial.
 #
 import os, sys, json, subprocess, re, argparse
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import time
 
 from p4_mininet import P4Switch, P4Host
 
@@ -132,6 +133,7 @@ class ExerciseRunner:
 
             switch_json : string // json of the compiled p4 example
             bmv2_exe    : string // name or path of the p4 switch binary
+            parallelism : int    // number of switches programmed concurrently
 
             topo : Topo object   // The mininet topology instance
             net : Mininet object // The mininet instance
@@ -150,7 +152,8 @@ class ExerciseRunner:
 
 
     def __init__(self, topo_file, log_dir, pcap_dir,
-                       switch_json, bmv2_exe='simple_switch', quiet=False):
+                       switch_json, bmv2_exe='simple_switch', quiet=False,
+                       parallelism=1):
         """ Initializes some attributes and reads the topology json. Does not
             actually run the exercise. Use run_exercise() for that.
 
@@ -162,6 +165,7 @@ class ExerciseRunner:
                 switch_json : string  // Path to a compiled p4 json for bmv2
                 bmv2_exe    : string  // Path to the p4 behavioral binary
                 quiet : bool          // Enable/disable script debug messages
+                parallelism : int     // Number of switches programmed concurrently
         """
 
         self.quiet = quiet
@@ -182,6 +186,7 @@ class ExerciseRunner:
         self.pcap_dir = pcap_dir
         self.switch_json = switch_json
         self.bmv2_exe = bmv2_exe
+        self.parallelism = max(1, parallelism)
 
 
     def run_exercise(self):
@@ -189,18 +194,17 @@ class ExerciseRunner:
             and starts the mininet CLI. This is the main method to run after
             initializing the object.
         """
-        # Initialize mininet with the topology specified by the config
+        # Initialize mininet with the topology specified by the config.
+        # Switches only return from start() once they answer requests.
         self.create_network()
         self.net.start()
-        sleep(1)
+        self.report_switches_ready()
 
-        # some programming that must happen after the net has started
+        # some programming that must happen after the net has started.
+        # program_switches only returns once every switch is configured.
         self.program_hosts()
         self.program_switches()
 
-        # wait for that to finish. Not sure how to do this better
-        sleep(1)
-
         self.do_net_cli()
         # stop right after the CLI is exited
         self.net.stop()
@@ -257,6 +261,14 @@ class ExerciseRunner:
                       switch = defaultSwitchClass,
                       controller = None)
 
+    def report_switches_ready(self):
+        """ Logs how long each P4 switch took to be ready after being started.
+        """
+        for s in self.net.switches:
+            ready_time = getattr(s, 'ready_time', None)
+            if ready_time is not None:
+                self.logger('%s ready in %.3fs' % (s.name, ready_time))
+
     def program_switch_p4runtime(self, sw_name, sw_dict):
         """ This method will use P4Runtime to program the switch using the
             content of the runtime JSON file as input.
@@ -289,19 +301,62 @@ class ExerciseRunner:
         with open(cli_input_commands, 'r') as fin:
             cli_outfile = '%s/%s_cli_output.log'%(self.log_dir, sw_name)
             with open(cli_outfile, 'w') as fout:
-                subprocess.Popen([cli, '--thrift-port', str(thrift_port)],
-                                 stdin=fin, stdout=fout)
+                cli_proc = subprocess.Popen([cli, '--thrift-port', str(thrift_port)],
+                                            stdin=fin, stdout=fout)
+                # wait for all the commands to be applied
+                if cli_proc.wait() != 0:
+                    raise Exception('%s exited with code %d, see %s' % (
+                        cli, cli_proc.returncode, cli_outfile))
+
+    def program_switch(self, sw_name, sw_dict):
+        """ Programs a single switch with its command and/or runtime JSON
+            files, returns the time it took in seconds.
+        """
+        start = time()
+        if 'cli_input' in sw_dict:
+            self.program_switch_cli(sw_name, sw_dict)
+        if 'runtime_json' in sw_dict:
+            self.program_switch_p4runtime(sw_name, sw_dict)
+        return time() - start
 
     def program_switches(self):
         """ This method will program each switch using the BMv2 CLI and/or
             P4Runtime, depending if any command or runtime JSON files were
             provided for the switches.
+
+            Up to self.parallelism switches are programmed concurrently. The
+            method returns once all of them are done, prints how long each
+            one took and raises an exception listing every switch that
+            could not be programmed.
         """
-        for sw_name, sw_dict in self.switches.items():
-            if 'cli_input' in sw_dict:
-                self.program_switch_cli(sw_name, sw_dict)
-            if 'runtime_json' in sw_dict:
-                self.program_switch_p4runtime(sw_name, sw_dict)
+        to_program = [(sw_name, sw_dict) for sw_name, sw_dict in self.switches.items()
+                      if 'cli_input' in sw_dict or 'runtime_json' in sw_dict]
+        if not to_program:
+            return
+
+        start = time()
+        timings = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            futures = {pool.submit(self.program_switch, sw_name, sw_dict): sw_name
+                       for sw_name, sw_dict in to_program}
+            for future in as_completed(futures):
+                sw_name = futures[future]
+                try:
+                    timings[sw_name] = future.result()
+                except Exception as e:
+                    errors[sw_name] = e
+
+        self.logger('Programmed %d switch(es) in %.3fs (parallelism %d)' % (
+            len(timings), time() - start, self.parallelism))
+        for sw_name, sw_dict in to_program:
+            if sw_name in timings:
+                self.logger('  %s: %.3fs' % (sw_name, timings[sw_name]))
+            else:
+                self.logger('  %s: FAILED (%s)' % (sw_name, errors[sw_name]))
+        if errors:
+            raise Exception('Failed to program switch(es): %s' % ', '.join(
+                '%s (%s)' % (sw_name, e) for sw_name, e in sorted(errors.items())))
 
     def program_hosts(self):
         """ Execute any commands provided in the topology.json file on each Mininet host
@@ -369,6 +424,8 @@ def get_args():
     parser.add_argument('-j', '--switch_json', type=str, required=False)
     parser.add_argument('-b', '--behavioral-exe', help='Path to behavioral executable',
                                 type=str, required=False, default='simple_switch')
+    parser.add_argument('-P', '--parallelism', help='Number of switches programmed concurrently',
+                        type=int, required=False, default=1)
     return parser.parse_args()
 
 
@@ -378,7 +435,8 @@ if __name__ == '__main__':
 
     args = get_args()
     exercise = ExerciseRunner(args.topo, args.log_dir, args.pcap_dir,
-                              args.switch_json, args.behavioral_exe, args.quiet)
+                              args.switch_json, args.behavioral_exe, args.quiet,
+                              args.parallelism)
 
     exercise.run_exercise()
 
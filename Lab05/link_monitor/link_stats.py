@@ -0,0 +1,177 @@
+import json
+import math
+import os
+import struct
+import sys
+from array import array
+from time import monotonic, time
+
+'''
+Link utilization from the ProbeData stacks of probe packets.
+
+Probe packets are decoded in place, with fixed offsets:
+
+    Ethernet (14) | Probe: hop_cnt (1) | ProbeData (18) ... | ProbeFwd ...
+
+each ProbeData being bos (1 bit), swid (7 bits), port (8), byte_cnt (32),
+last_time (48) and cur_time (48), times in microseconds. A ProbeData
+gives the utilization of the egress port of a switch since the previous
+probe sent out of that port: 8 * byte_cnt / (cur_time - last_time) Mbps.
+
+LinkMonitor smooths the utilization of each (swid, port) with an
+exponentially weighted moving average, whose weight depends on the time
+covered by each sample (time constant tau), so that the average does not
+depend on the probing rate. State is kept in arrays indexed by
+swid << 8 | port. A link is flagged congested when its average goes above
+high * capacity, and cleared when it falls below low * capacity.
+'''
+
+TYPE_PROBE = 0x812
+MAX_HOPS = 10
+
+ETHERTYPE = struct.Struct('!H')
+# bos/swid, port, byte_cnt, last_time and cur_time (high and low parts)
+PROBE_DATA = struct.Struct('!BBIHIHI')
+PROBE_DATA_OFFSET = 15
+
+MAX_LINKS = 1 << 15
+
+
+def linkIndex(swid, port):
+    return swid << 8 | port
+
+def decodeProbe(buf, offset, caplen):
+    """Returns the list of (swid, port, byte_cnt, last_time, cur_time) of
+    the ProbeData stack of the frame of caplen bytes at offset of buf, the
+    last hop first, or None when the frame is not a probe"""
+    if caplen < PROBE_DATA_OFFSET or ETHERTYPE.unpack_from(buf, offset + 12)[0] != TYPE_PROBE:
+        return None
+    hops = []
+    if buf[offset + 14] == 0:
+        return hops
+    pos = offset + PROBE_DATA_OFFSET
+    end = offset + caplen
+    unpack = PROBE_DATA.unpack_from
+    while pos + PROBE_DATA.size <= end and len(hops) < MAX_HOPS:
+        bos_swid, port, byte_cnt, last_hi, last_lo, cur_hi, cur_lo = unpack(buf, pos)
+        hops.append((bos_swid & 0x7f, port, byte_cnt,
+                     last_hi << 32 | last_lo, cur_hi << 32 | cur_lo))
+        if bos_swid & 0x80:
+            break
+        pos += PROBE_DATA.size
+    return hops
+
+
+class LinkMonitor(object):
+    """Per-(swid, port) utilization from probe packets. update is a
+    PacketCapture handler.
+
+    capacity is the capacity of the links in Mbps, None to never flag
+    congestion. Links not probed for stale seconds are left out of
+    snapshots. With json_path, report also rewrites the snapshot there.
+    """
+
+    def __init__(self, tau=1.0, capacity=None, high=0.8, low=0.6, stale=5.0,
+                 json_path=None, out=sys.stdout):
+        self.tau = tau
+        self.capacity = capacity
+        self.high = high
+        self.low = low
+        self.stale = stale
+        self.json_path = json_path
+        self.out = out
+        self.ewma = array('d', bytes(8 * MAX_LINKS))
+        self.last = array('d', bytes(8 * MAX_LINKS))
+        self.last_seen = array('d', bytes(8 * MAX_LINKS))
+        self.samples = array('L', bytes(array('L').itemsize * MAX_LINKS))
+        self.congested = array('b', bytes(MAX_LINKS))
+        # Indexes of the links seen so far
+        self.links = set()
+        # (time, swid, port, congested, utilization) of congestion changes
+        # since the previous report
+        self.events = []
+        self.probes = 0
+
+    def update(self, buf, offset, caplen, wire_len):
+        hops = decodeProbe(buf, offset, caplen)
+        if hops is None:
+            return
+        self.probes += 1
+        now = monotonic()
+        for swid, port, byte_cnt, last_time, cur_time in hops:
+            self.addSample(swid, port, byte_cnt, last_time, cur_time, now)
+
+    def addSample(self, swid, port, byte_cnt, last_time, cur_time, now=None):
+        i = linkIndex(swid, port)
+        if now is None:
+            now = monotonic()
+        self.links.add(i)
+        self.last_seen[i] = now
+        # No previous probe on this port, or the clock wrapped
+        if last_time == 0 or cur_time <= last_time:
+            return
+        interval = cur_time - last_time
+        utilization = 8.0 * byte_cnt / interval
+        self.last[i] = utilization
+        if self.samples[i] == 0:
+            self.ewma[i] = utilization
+        else:
+            alpha = 1.0 - math.exp(-interval / 1e6 / self.tau)
+            self.ewma[i] += alpha * (utilization - self.ewma[i])
+        self.samples[i] += 1
+
+        if self.capacity is None:
+            return
+        ewma = self.ewma[i]
+        if not self.congested[i] and ewma >= self.high * self.capacity:
+            self.congested[i] = 1
+            self.events.append((time(), swid, port, True, ewma))
+        elif self.congested[i] and ewma < self.low * self.capacity:
+            self.congested[i] = 0
+            self.events.append((time(), swid, port, False, ewma))
+
+    def snapshot(self):
+        """Returns the list of {'swid', 'port', 'utilization', 'last',
+        'samples', 'age', 'congested'} of the links probed in the last stale
+        seconds, utilizations in Mbps and age in seconds"""
+        now = monotonic()
+        result = []
+        for i in sorted(self.links):
+            age = now - self.last_seen[i]
+            if age > self.stale:
+                continue
+            result.append({'swid': i >> 8, 'port': i & 0xff,
+                           'utilization': self.ewma[i], 'last': self.last[i],
+                           'samples': self.samples[i], 'age': age,
+                           'congested': bool(self.congested[i])})
+        return result
+
+    def congestedLinks(self):
+        "Returns the (swid, port) of the links flagged congested"
+        return [(i >> 8, i & 0xff) for i in sorted(self.links) if self.congested[i]]
+
+    def to_json(self, path):
+        "Writes the snapshot to path, replacing it atomically"
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'timestamp': time(), 'probes': self.probes,
+                       'links': self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def report(self):
+        lines = []
+        for timestamp, swid, port, congested, utilization in self.events:
+            lines.append("Switch %d - Port %d: %s (%.3f Mbps)" % (
+                swid, port, "congested" if congested else "no longer congested",
+                utilization))
+        self.events = []
+        snapshot = self.snapshot()
+        lines.append("%d probes, %d links" % (self.probes, len(snapshot)))
+        for link in snapshot:
+            lines.append("  Switch %d - Port %d: %.3f Mbps (last %.3f Mbps)%s" % (
+                link['swid'], link['port'], link['utilization'], link['last'],
+                " CONGESTED" if link['congested'] else ""))
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+        if self.json_path is not None:
+            self.to_json(self.json_path)
@@ -0,0 +1,138 @@
+import json
+from collections import deque
+
+'''
+Planning of source routed probe paths covering every link of a topology.
+
+Every link between two switches of topology.json is monitored in both
+directions, so the probes have to go through every directed link. Probes
+are sent and received by one host: each one starts at the switch of the
+host and ends with the hop back to the host.
+
+Links being bidirectional, every switch has as many outgoing as incoming
+links, so a single closed walk goes through every directed link exactly
+once (an Euler circuit), which is the shortest possible probe. When it
+has more hops than a probe can hold (MAX_HOPS ProbeFwd headers), it is cut
+into segments, each completed into a closed walk by the shortest paths
+from the host switch to its start and from its end back; links covered
+by these paths are not probed again.
+'''
+
+# Size of the ProbeFwd (and ProbeData) header stacks of link_monitor.p4
+MAX_HOPS = 10
+
+
+class PlanningException(Exception):
+    pass
+
+
+def parseNode(node):
+    "Returns (switch, port) of a switch node of the form 's1-p2'"
+    sw, port = node.split('-')
+    return sw, int(port[1:])
+
+def loadTopology(path):
+    """Returns (links, hosts) of a topology.json file: links maps each
+    switch to the list of its (port, peer switch) links to other switches,
+    hosts maps each host to its (switch, port)"""
+    with open(path, 'r') as f:
+        topo = json.load(f)
+    links = {sw: [] for sw in topo.get('switches', {})}
+    hosts = {}
+    for link in topo['links']:
+        a, b = link[0], link[1]
+        if a[0] == 'h' or b[0] == 'h':
+            host, node = (a, b) if a[0] == 'h' else (b, a)
+            hosts[host] = parseNode(node)
+            continue
+        sw_a, port_a = parseNode(a)
+        sw_b, port_b = parseNode(b)
+        links.setdefault(sw_a, []).append((port_a, sw_b))
+        links.setdefault(sw_b, []).append((port_b, sw_a))
+    for sw_links in links.values():
+        sw_links.sort()
+    return links, hosts
+
+def eulerCircuit(links, start):
+    """Returns a closed walk from start going once through every directed
+    link reachable from it, as a list of (switch, port, peer switch)
+    (Hierholzer's algorithm)"""
+    remaining = {sw: list(reversed(sw_links)) for sw, sw_links in links.items()}
+    # Stack of (switch, link taken to reach it)
+    stack = [(start, None)]
+    circuit = []
+    while stack:
+        sw, via = stack[-1]
+        if remaining.get(sw):
+            port, peer = remaining[sw].pop()
+            stack.append((peer, (sw, port, peer)))
+        else:
+            stack.pop()
+            if via is not None:
+                circuit.append(via)
+    circuit.reverse()
+    return circuit
+
+def shortestPath(links, src, dst):
+    "Returns the list of (switch, port, peer switch) of a shortest path"
+    previous = {src: None}
+    queue = deque([src])
+    while queue:
+        sw = queue.popleft()
+        if sw == dst:
+            break
+        for port, peer in links.get(sw, []):
+            if peer not in previous:
+                previous[peer] = (sw, port, peer)
+                queue.append(peer)
+    if dst not in previous:
+        raise PlanningException("%s is not reachable from %s" % (dst, src))
+    path = []
+    sw = dst
+    while previous[sw] is not None:
+        path.append(previous[sw])
+        sw = previous[sw][0]
+    path.reverse()
+    return path
+
+def planProbes(links, hosts, host, max_hops=MAX_HOPS):
+    """Returns the probe paths sent by host to cover every directed link
+    between switches, each as the list of its egress ports (the ProbeFwd
+    headers), the last one being the port of host."""
+    if host not in hosts:
+        raise PlanningException("unknown host %s" % host)
+    start, host_port = hosts[host]
+    # Each probe keeps one hop to return to the host
+    budget = max_hops - 1
+    circuit = eulerCircuit(links, start)
+    total = sum(len(sw_links) for sw_links in links.values())
+    if len(circuit) < total:
+        raise PlanningException("some links are not reachable from %s" % start)
+    if len(circuit) <= budget:
+        return [[port for sw, port, peer in circuit] + [host_port]]
+
+    probes = []
+    covered = set()
+    i = 0
+    while i < len(circuit):
+        if circuit[i] in covered:
+            i += 1
+            continue
+        path = shortestPath(links, start, circuit[i][0])
+        back = shortestPath(links, circuit[i][2], start)
+        if len(path) + 1 + len(back) > budget:
+            raise PlanningException("probes of %d hops cannot go through %s-p%d" % (
+                max_hops, circuit[i][0], circuit[i][1]))
+        # Extend the segment while it can still return to the start
+        j = i + 1
+        while j < len(circuit):
+            next_back = shortestPath(links, circuit[j][2], start)
+            if len(path) + (j + 1 - i) + len(next_back) > budget:
+                break
+            back = next_back
+            j += 1
+        path += circuit[i:j] + back
+        covered.update(path)
+        probes.append([port for sw, port, peer in path] + [host_port])
+        i = j
+    return probes
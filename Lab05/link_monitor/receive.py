@@ -1,6 +1,17 @@
 #!/usr/bin/env python3
+import argparse
+import os
+import sys
 
 from probe_hdrs import *
+from scapy.all import Ether
+
+# Import the capture engine from parent utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '../../utils/'))
+from capture import addCaptureArguments, bpfFilter, captureFromArgs
+from link_stats import TYPE_PROBE, LinkMonitor
 
 def expand(x):
     yield x
@@ -17,10 +28,27 @@ def handle_pkt(pkt):
             print(("Switch {} - Port {}: {} Mbps".format(sw.swid, sw.port, utilization)))
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tau', help='time constant of the utilization averages in seconds (default: 1)',
+                        type=float, default=1.0)
+    parser.add_argument('--capacity', help='link capacity in Mbps, to flag congested links',
+                        type=float)
+    parser.add_argument('--high', help='fraction of the capacity above which a link is congested (default: 0.8)',
+                        type=float, default=0.8)
+    parser.add_argument('--low', help='fraction of the capacity below which a link is no longer congested (default: 0.6)',
+                        type=float, default=0.6)
+    parser.add_argument('--json', help='file rewritten with the link utilizations at each report',
+                        type=str)
+    addCaptureArguments(parser)
+    args = parser.parse_args()
+
     iface = 'eth0'
     print(("sniffing on {}".format(iface)))
-    sniff(iface = iface,
-          prn = lambda x: handle_pkt(x))
+    sys.stdout.flush()
+    monitor = LinkMonitor(tau=args.tau, capacity=args.capacity, high=args.high, low=args.low,
+                          json_path=args.json)
+    captureFromArgs(iface, args, bpf=bpfFilter(ethertype=TYPE_PROBE),
+                    show=lambda frame: handle_pkt(Ether(frame)), counters=monitor)
 
 if __name__ == '__main__':
     main()
@@ -1,28 +1,68 @@
 #!/usr/bin/env python3
+import argparse
+import os
 import sys
 import time
 from probe_hdrs import *
+from probe_planner import MAX_HOPS, loadTopology, planProbes
+from scapy.all import Ether, get_if_hwaddr, sendp
+
+# Import the traffic generator from parent utils dir
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '../../utils/'))
+try:
+    from traffic import TrafficGenerator
+except ImportError:
+    TrafficGenerator = None
+
+def sendProbes(iface, probe_pkts, rate, duration=None):
+    # Without the traffic generator, each round of probes is sent with scapy
+    start = time.monotonic()
+    rounds = 0
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            sendp(probe_pkts, iface=iface, verbose=False)
+            rounds += 1
+            time.sleep(max(0, start + rounds / rate - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+    print("sent {} rounds of {} probes".format(rounds, len(probe_pkts)))
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--topo', help='topology file (default: pod-topo/topology.json)',
+                        type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                       'pod-topo', 'topology.json'))
+    parser.add_argument('--host', help='host sending and receiving the probes (default: h1)',
+                        type=str, default='h1')
+    parser.add_argument('--rate', help='rounds of probes per second, a round covering every link (default: 1)',
+                        type=float, default=1.0)
+    parser.add_argument('--duration', help='in seconds (default: until interrupted)', type=float)
+    parser.add_argument('--max-hops', help='hops of the longest probe (default: %d)' % MAX_HOPS,
+                        type=int, default=MAX_HOPS)
+    args = parser.parse_args()
 
-    probe_pkt = Ether(dst='ff:ff:ff:ff:ff:ff', src=get_if_hwaddr('eth0')) / \
-                Probe(hop_cnt=0) / \
-                ProbeFwd(egress_spec=4) / \
-                ProbeFwd(egress_spec=1) / \
-                ProbeFwd(egress_spec=4) / \
-                ProbeFwd(egress_spec=1) / \
-                ProbeFwd(egress_spec=3) / \
-                ProbeFwd(egress_spec=2) / \
-                ProbeFwd(egress_spec=3) / \
-                ProbeFwd(egress_spec=2) / \
-                ProbeFwd(egress_spec=1)
+    iface = 'eth0'
+    links, hosts = loadTopology(args.topo)
+    probes = planProbes(links, hosts, args.host, max_hops=args.max_hops)
+    probe_pkts = []
+    for ports in probes:
+        print("probe: {}".format(', '.join(str(port) for port in ports)))
+        probe_pkt = Ether(dst='ff:ff:ff:ff:ff:ff', src=get_if_hwaddr(iface)) / \
+                    Probe(hop_cnt=0)
+        for port in ports:
+            probe_pkt = probe_pkt / ProbeFwd(egress_spec=port)
+        probe_pkts.append(probe_pkt)
+    sys.stdout.flush()
 
-    while True:
-        try:
-            sendp(probe_pkt, iface='eth0')
-            time.sleep(1)
-        except KeyboardInterrupt:
-            sys.exit()
+    if TrafficGenerator is None:
+        sendProbes(iface, probe_pkts, args.rate, duration=args.duration)
+        return
+    frames = [bytes(probe_pkt) for probe_pkt in probe_pkts]
+    with TrafficGenerator(iface) as generator:
+        stats = generator.run(frames, pps=args.rate * len(frames), duration=args.duration)
+    print(stats)
 
 if __name__ == '__main__':
     main()
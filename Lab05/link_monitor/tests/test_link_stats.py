@@ -0,0 +1,138 @@
+import io
+import json
+import struct
+
+import pytest
+
+import link_stats
+from link_stats import TYPE_PROBE, LinkMonitor, decodeProbe
+
+
+def probeData(swid, port, byte_cnt, last_time, cur_time, bos=False):
+    return struct.pack('!BBIHIHI', (0x80 if bos else 0) | swid, port, byte_cnt,
+                       last_time >> 32, last_time & 0xffffffff,
+                       cur_time >> 32, cur_time & 0xffffffff)
+
+def probe(hops, ethertype=TYPE_PROBE):
+    "Probe frame with the ProbeData of hops, the last hop first"
+    data = b''.join(probeData(*hop, bos=i == len(hops) - 1) for i, hop in enumerate(hops))
+    # ProbeFwd headers left after the ProbeData stack
+    return b'\xff' * 12 + struct.pack('!HB', ethertype, len(hops)) + data + b'\x00\x01'
+
+def test_decode_probe():
+    big = (1 << 47) + 5
+    buf = probe([(2, 3, 1000, big, big + 10), (1, 2, 0, 0, 7)])
+    assert decodeProbe(buf, 0, len(buf)) == [(2, 3, 1000, big, big + 10), (1, 2, 0, 0, 7)]
+
+def test_decode_probe_at_offset():
+    buf = b'\x00' * 3 + probe([(1, 2, 3, 4, 5)])
+    assert decodeProbe(buf, 3, len(buf) - 3) == [(1, 2, 3, 4, 5)]
+
+def test_decode_not_a_probe():
+    buf = probe([(1, 2, 3, 4, 5)], ethertype=0x0800)
+    assert decodeProbe(buf, 0, len(buf)) is None
+    assert decodeProbe(buf, 0, 10) is None
+
+def test_decode_without_hops():
+    buf = b'\xff' * 12 + struct.pack('!HB', TYPE_PROBE, 0)
+    assert decodeProbe(buf, 0, len(buf)) == []
+
+def test_decode_stops_at_capture_end():
+    buf = probe([(1, 1, 0, 0, 1), (2, 2, 0, 0, 1)])
+    # The second ProbeData is truncated
+    assert decodeProbe(buf, 0, 15 + 18 + 10) == [(1, 1, 0, 0, 1)]
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(link_stats, 'monotonic', clock)
+    return clock
+
+def test_first_sample_sets_the_average(clock):
+    monitor = LinkMonitor()
+    # 125000 bytes in 1s
+    monitor.addSample(1, 2, 125000, 1000000, 2000000)
+    link, = monitor.snapshot()
+    assert (link['swid'], link['port'], link['samples']) == (1, 2, 1)
+    assert link['utilization'] == link['last'] == 1.0
+
+def test_samples_without_interval_are_ignored(clock):
+    monitor = LinkMonitor()
+    monitor.addSample(1, 2, 100, 0, 1000)
+    monitor.addSample(1, 2, 100, 1000, 1000)
+    link, = monitor.snapshot()
+    assert link['samples'] == 0 and link['utilization'] == 0
+
+def test_average_weight_depends_on_the_interval(clock):
+    tau = 1.0
+    a, b = LinkMonitor(tau=tau), LinkMonitor(tau=tau)
+    a.addSample(1, 1, 0, 1, 1000001)
+    b.addSample(1, 1, 0, 1, 1000001)
+    # One sample of 1s at 8 Mbps, against ten of 0.1s
+    a.addSample(1, 1, 1000000, 1000001, 2000001)
+    for i in range(10):
+        start = 1000001 + i * 100000
+        b.addSample(1, 1, 100000, start, start + 100000)
+    assert a.snapshot()[0]['utilization'] == pytest.approx(b.snapshot()[0]['utilization'])
+    assert a.snapshot()[0]['utilization'] == pytest.approx(8 * (1 - 2.718281828 ** -1))
+
+def test_congestion_hysteresis(clock):
+    monitor = LinkMonitor(tau=1e-9, capacity=10, high=0.8, low=0.6)
+    t = [1]
+
+    def sample(mbps):
+        # tau is short enough for the average to follow the samples
+        monitor.addSample(3, 1, int(mbps * 1e6 / 8), t[0], t[0] + 1000000)
+        t[0] += 1000000
+
+    sample(7)
+    assert monitor.congestedLinks() == []
+    sample(8)
+    assert monitor.congestedLinks() == [(3, 1)]
+    sample(7)
+    assert monitor.congestedLinks() == [(3, 1)]
+    sample(5)
+    assert monitor.congestedLinks() == []
+    assert [(swid, port, congested) for _, swid, port, congested, _ in monitor.events] == \
+        [(3, 1, True), (3, 1, False)]
+
+def test_no_capacity_never_flags(clock):
+    monitor = LinkMonitor()
+    monitor.addSample(1, 1, 10 ** 9, 1, 2)
+    assert monitor.congestedLinks() == [] and monitor.events == []
+
+def test_update_and_stale_links(clock):
+    monitor = LinkMonitor(stale=5)
+    buf = probe([(2, 1, 1250, 1000, 11000), (1, 3, 0, 0, 500)])
+    monitor.update(buf, 0, len(buf), len(buf))
+    buf = probe([(1, 2, 0, 0, 0)], ethertype=0x0800)
+    monitor.update(buf, 0, len(buf), len(buf))
+    assert monitor.probes == 1
+    assert [(l['swid'], l['port'], l['utilization']) for l in monitor.snapshot()] == \
+        [(1, 3, 0), (2, 1, 1.0)]
+    clock.now += 3
+    monitor.addSample(1, 3, 0, 0, 500)
+    clock.now += 3
+    assert [(l['swid'], l['port']) for l in monitor.snapshot()] == [(1, 3)]
+
+def test_report(clock, tmp_path):
+    out = io.StringIO()
+    path = str(tmp_path / 'links.json')
+    monitor = LinkMonitor(capacity=1, json_path=path, out=out)
+    monitor.addSample(4, 2, 125000, 1000000, 2000000)
+    monitor.report()
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "Switch 4 - Port 2: congested (1.000 Mbps)"
+    assert lines[-1] == "  Switch 4 - Port 2: 1.000 Mbps (last 1.000 Mbps) CONGESTED"
+    assert monitor.events == []
+    with open(path) as f:
+        saved = json.load(f)
+    assert [(l['swid'], l['port'], l['congested']) for l in saved['links']] == [(4, 2, True)]
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from probe_planner import (PlanningException, eulerCircuit, loadTopology, planProbes,
+                           shortestPath)
+
+POD_TOPO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'pod-topo', 'topology.json')
+
+
+def ring(n):
+    "Switches s1..sn in a ring, port 2 to the next switch and 3 to the previous"
+    links = {}
+    for i in range(1, n + 1):
+        links['s%d' % i] = [(2, 's%d' % (i % n + 1)), (3, 's%d' % ((i - 2) % n + 1))]
+    return links
+
+def walk(links, start, ports):
+    "Returns the directed links followed from start by ports"
+    sw = start
+    hops = []
+    for port in ports:
+        peer = dict(links[sw])[port]
+        hops.append((sw, port, peer))
+        sw = peer
+    return hops, sw
+
+def checkPlan(links, hosts, host, probes, max_hops):
+    start, host_port = hosts[host]
+    covered = set()
+    for ports in probes:
+        assert len(ports) <= max_hops
+        assert ports[-1] == host_port
+        hops, end = walk(links, start, ports[:-1])
+        # Every probe comes back to the host
+        assert end == start
+        covered.update(hops)
+    assert covered == {(sw, port, peer) for sw in links for port, peer in links[sw]}
+
+def test_load_topology():
+    links, hosts = loadTopology(POD_TOPO)
+    assert links == {'s1': [(3, 's3'), (4, 's4')], 's2': [(3, 's4'), (4, 's3')],
+                     's3': [(1, 's1'), (2, 's2')], 's4': [(1, 's2'), (2, 's1')]}
+    assert hosts == {'h1': ('s1', 1), 'h2': ('s1', 2), 'h3': ('s2', 1), 'h4': ('s2', 2)}
+
+def test_euler_circuit():
+    links = ring(4)
+    circuit = eulerCircuit(links, 's2')
+    assert len(circuit) == 8
+    assert sorted(circuit) == sorted((sw, port, peer) for sw in links for port, peer in links[sw])
+    assert circuit[0][0] == circuit[-1][2] == 's2'
+    for a, b in zip(circuit, circuit[1:]):
+        assert a[2] == b[0]
+
+def test_shortest_path():
+    assert shortestPath(ring(6), 's1', 's3') == [('s1', 2, 's2'), ('s2', 2, 's3')]
+    assert shortestPath(ring(6), 's1', 's1') == []
+    with pytest.raises(PlanningException):
+        shortestPath({'s1': [], 's2': []}, 's1', 's2')
+
+def test_single_probe():
+    links, hosts = loadTopology(POD_TOPO)
+    probes = planProbes(links, hosts, 'h1')
+    assert len(probes) == 1
+    assert len(probes[0]) == 9
+    checkPlan(links, hosts, 'h1', probes, 10)
+
+@pytest.mark.parametrize('n,max_hops', [(5, 10), (8, 10), (6, 8), (4, 5)])
+def test_probes_are_split(n, max_hops):
+    links = ring(n)
+    hosts = {'h1': ('s1', 1)}
+    probes = planProbes(links, hosts, 'h1', max_hops=max_hops)
+    assert len(probes) > 1
+    checkPlan(links, hosts, 'h1', probes, max_hops)
+
+def test_planning_errors():
+    links, hosts = loadTopology(POD_TOPO)
+    with pytest.raises(PlanningException):
+        planProbes(links, hosts, 'h9')
+    # A probe cannot go around a ring too long for its hops
+    with pytest.raises(PlanningException):
+        planProbes(ring(12), {'h1': ('s1', 1)}, 'h1', max_hops=5)
+    links['s5'] = [(1, 's6')]
+    links['s6'] = [(1, 's5')]
+    with pytest.raises(PlanningException):
+        planProbes(links, hosts, 'h1')
@@ -0,0 +1,344 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import ctypes
+import ctypes.util
+import errno
+import random
+import socket
+import struct
+from time import monotonic, sleep
+
+'''
+High rate traffic generation from pre-serialized packets.
+
+Packets are built once (with scapy or by hand) and serialized into a
+PacketTemplate. flowVariants derives one frame per flow from it, with
+randomized ports and TOS, patching the checksums incrementally. A
+TrafficGenerator then sends the frames in a loop over a single AF_PACKET
+socket, many frames per system call (sendmmsg) when the C library has it,
+at a target packet or bit rate:
+
+    template = PacketTemplate(bytes(Ether(...) / IP(...) / UDP(...) / payload))
+    frames = flowVariants(template, flows=16, sport=(49152, 65535))
+    stats = TrafficGenerator(iface).run(frames, pps=10000, duration=10)
+    print(stats)
+'''
+
+ETH_P_IP = 0x0800
+ETH_P_8021Q = 0x8100
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# Frames sent by a single sendmmsg call
+SEND_BATCH_SIZE = 64
+# Longest sleep between batches when rate limiting, so that batches are
+# small enough not to burst (seconds)
+RATE_GRANULARITY = 0.001
+# Delay before retrying when the interface queue is full (seconds)
+QUEUE_FULL_DELAY = 0.0001
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def loadSendmmsg():
+    "Returns libc's sendmmsg, or None when it is not available"
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+_sendmmsg = loadSendmmsg()
+
+
+def checksumAdjust(checksum, old, new):
+    "Updates a ones' complement checksum for a 16-bit word change (RFC 1624)"
+    total = (~checksum & 0xffff) + (~old & 0xffff) + new
+    total = (total & 0xffff) + (total >> 16)
+    total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+def patchChecksum(frame, offset, old, new, udp=False):
+    checksum, = struct.unpack_from('!H', frame, offset)
+    if udp and checksum == 0:
+        # UDP checksum not computed by the sender
+        return
+    checksum = checksumAdjust(checksum, old, new)
+    if udp and checksum == 0:
+        checksum = 0xffff
+    struct.pack_into('!H', frame, offset, checksum)
+
+
+class PacketTemplate(object):
+    """A serialized Ethernet/IPv4 frame, with the offsets of the fields that
+    flowVariants can change. The IPv4 header may have options and follow a
+    VLAN tag. Other frames can be sent as they are, but not varied."""
+
+    def __init__(self, frame):
+        self.frame = bytes(frame)
+        self.ip_offset = None
+        self.l4_offset = None
+        self.l4_checksum_offset = None
+        self.udp = False
+
+        ethertype_offset = 12
+        ethertype, = struct.unpack_from('!H', self.frame, ethertype_offset)
+        if ethertype == ETH_P_8021Q:
+            ethertype_offset += 4
+            ethertype, = struct.unpack_from('!H', self.frame, ethertype_offset)
+        if ethertype != ETH_P_IP:
+            return
+        self.ip_offset = ethertype_offset + 2
+        ihl = (self.frame[self.ip_offset] & 0x0f) * 4
+        protocol = self.frame[self.ip_offset + 9]
+        if protocol == IPPROTO_UDP:
+            self.l4_offset = self.ip_offset + ihl
+            self.l4_checksum_offset = self.l4_offset + 6
+            self.udp = True
+        elif protocol == IPPROTO_TCP:
+            self.l4_offset = self.ip_offset + ihl
+            self.l4_checksum_offset = self.l4_offset + 16
+
+    def __len__(self):
+        return len(self.frame)
+
+    def variant(self, sport=None, dport=None, tos=None):
+        "Returns a copy of the frame with the given fields changed"
+        frame = bytearray(self.frame)
+        if tos is not None:
+            if self.ip_offset is None:
+                raise ValueError("not an IPv4 frame")
+            tos_offset = self.ip_offset + 1
+            # TOS shares its checksum word with the version and IHL
+            old_word, = struct.unpack_from('!H', frame, self.ip_offset)
+            frame[tos_offset] = tos
+            new_word, = struct.unpack_from('!H', frame, self.ip_offset)
+            patchChecksum(frame, self.ip_offset + 10, old_word, new_word)
+        for value, offset in ((sport, 0), (dport, 2)):
+            if value is None:
+                continue
+            if self.l4_offset is None:
+                raise ValueError("not a TCP or UDP frame")
+            old, = struct.unpack_from('!H', frame, self.l4_offset + offset)
+            struct.pack_into('!H', frame, self.l4_offset + offset, value)
+            patchChecksum(frame, self.l4_checksum_offset, old, value, udp=self.udp)
+        return bytes(frame)
+
+
+def pickValue(rng, spec):
+    if spec is None:
+        return None
+    if isinstance(spec, tuple):
+        return rng.randint(spec[0], spec[1])
+    return rng.choice(spec)
+
+def flowVariants(template, flows=1, sport=None, dport=None, tos=None, seed=None):
+    """Returns the frames of `flows` flows derived from template. sport,
+    dport and tos are None to keep the value of the template, a (low, high)
+    range or a list of values to pick the value of each flow from."""
+    rng = random.Random(seed)
+    if sport is None and dport is None and tos is None:
+        return [template.frame]
+    return [template.variant(sport=pickValue(rng, sport),
+                             dport=pickValue(rng, dport),
+                             tos=pickValue(rng, tos))
+            for _ in range(flows)]
+
+
+class TrafficStats(object):
+    def __init__(self, packets, bytes, elapsed):
+        self.packets = packets
+        self.bytes = bytes
+        self.elapsed = elapsed
+
+    @property
+    def pps(self):
+        return self.packets / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bps(self):
+        return self.bytes * 8 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return "sent %d packets (%d bytes) in %.3fs: %.0f pps, %.3f Mbps" % (
+            self.packets, self.bytes, self.elapsed, self.pps, self.bps / 1e6)
+
+
+class TrafficGenerator(object):
+    """Sends frames on an interface through one persistent AF_PACKET socket.
+
+    Frames are sent in order and in a loop, SEND_BATCH_SIZE per sendmmsg
+    call (one send call per frame without sendmmsg, or with
+    use_sendmmsg=False).
+    """
+
+    def __init__(self, iface, use_sendmmsg=True):
+        self.iface = iface
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self.sock.bind((iface, 0))
+        self.sendmmsg = _sendmmsg if use_sendmmsg else None
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def run(self, frames, pps=None, bps=None, duration=None, count=None,
+            batch_size=SEND_BATCH_SIZE):
+        """Sends frames until duration seconds have passed or count frames
+        were sent (forever if both are None, until KeyboardInterrupt), at
+        most at pps packets or bps bits per second. Returns TrafficStats."""
+        if not frames:
+            raise ValueError("no frame to send")
+        frames = [bytes(f) for f in frames]
+        n = len(frames)
+        if bps is not None:
+            # Rate limiting counts packets, at the average frame size
+            rate = bps / 8.0 / (sum(len(f) for f in frames) / n)
+            pps = rate if pps is None else min(pps, rate)
+        if pps is not None:
+            batch_size = max(1, min(batch_size, int(pps * RATE_GRANULARITY)))
+
+        # Frames are repeated so that any batch_size frames starting at any
+        # position of the loop are contiguous
+        looped = frames + [frames[i % n] for i in range(batch_size)]
+        # prefix[i] = bytes of the frames before position i of looped
+        prefix = [0]
+        for f in looped:
+            prefix.append(prefix[-1] + len(f))
+        send_batch = self.batchSender(looped)
+
+        sent = 0
+        sent_bytes = 0
+        pos = 0
+        start = monotonic()
+        deadline = None if duration is None else start + duration
+        try:
+            while count is None or sent < count:
+                now = monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                if pps is not None:
+                    ahead = sent / pps - (now - start)
+                    if ahead > 0:
+                        sleep(min(ahead, RATE_GRANULARITY))
+                        continue
+                size = batch_size if count is None else min(batch_size, count - sent)
+                done = send_batch(pos, size)
+                sent += done
+                sent_bytes += prefix[pos + done] - prefix[pos]
+                pos = (pos + done) % n
+        except KeyboardInterrupt:
+            pass
+        return TrafficStats(sent, sent_bytes, monotonic() - start)
+
+    def batchSender(self, frames):
+        "Returns a function sending up to size frames from position pos"
+        if self.sendmmsg is None:
+            send = self.sock.send
+
+            def sendFrames(pos, size):
+                for i in range(pos, pos + size):
+                    try:
+                        send(frames[i])
+                    except OSError as e:
+                        if e.errno not in (errno.ENOBUFS, errno.EAGAIN):
+                            raise
+                        sleep(QUEUE_FULL_DELAY)
+                        return i - pos
+                return size
+            return sendFrames
+
+        # One iovec and message header per frame, built once
+        buffers = [ctypes.create_string_buffer(f, len(f)) for f in frames]
+        iovecs = (iovec * len(frames))()
+        msgs = (mmsghdr * len(frames))()
+        for i, buf in enumerate(buffers):
+            iovecs[i].iov_base = ctypes.addressof(buf)
+            iovecs[i].iov_len = len(frames[i])
+            msgs[i].msg_hdr.msg_iov = ctypes.pointer(iovecs[i])
+            msgs[i].msg_hdr.msg_iovlen = 1
+        base = ctypes.addressof(msgs)
+        fd = self.sock.fileno()
+        sendmmsg = self.sendmmsg
+
+        def sendFrames(pos, size):
+            done = sendmmsg(fd, base + pos * ctypes.sizeof(mmsghdr), size, 0)
+            if done < 0:
+                err = ctypes.get_errno()
+                if err not in (errno.ENOBUFS, errno.EAGAIN):
+                    raise OSError(err, "sendmmsg: %s" % errno.errorcode.get(err, err))
+                sleep(QUEUE_FULL_DELAY)
+                return 0
+            return done
+        # The messages point to these, keep them alive with the function
+        sendFrames.buffers = (buffers, iovecs, msgs)
+        return sendFrames
+
+
+def addTrafficArguments(parser, pps=None, count=None):
+    "Adds the options of sendFromArgs to an argparse parser"
+    group = parser.add_argument_group('traffic generation')
+    group.add_argument('--pps', help='packets per second (default: %s)' % (pps or 'as fast as possible'),
+                       type=float, default=pps)
+    group.add_argument('--bps', help='bits per second', type=float)
+    group.add_argument('--count', help='number of packets to send', type=int, default=count)
+    group.add_argument('--flows', help='number of flows, each with its own random fields',
+                       type=int, default=1)
+    group.add_argument('--random-sport', help='random source port for each flow',
+                       action='store_true')
+    group.add_argument('--random-dport', help='random destination port for each flow',
+                       action='store_true')
+    group.add_argument('--tos', help='comma separated TOS values picked for each flow',
+                       type=str)
+
+def sendFromArgs(iface, frame, args, duration=None):
+    """Sends frame (bytes, e.g. of a scapy packet) on iface as requested by
+    the options of addTrafficArguments, prints and returns TrafficStats."""
+    tos = None
+    if args.tos:
+        tos = [int(t, 0) for t in args.tos.split(',')]
+    frames = flowVariants(PacketTemplate(frame), flows=args.flows,
+                          sport=(49152, 65535) if args.random_sport else None,
+                          dport=(1024, 65535) if args.random_dport else None,
+                          tos=tos)
+    with TrafficGenerator(iface) as generator:
+        stats = generator.run(frames, pps=args.pps, bps=args.bps,
+                              duration=duration, count=args.count)
+    print(stats)
+    return stats